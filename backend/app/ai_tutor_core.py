@@ -4,70 +4,180 @@ from transformers import AutoModelForCausalLM, AutoTokenizer
 from sklearn.manifold import TSNE
 from sklearn.preprocessing import StandardScaler
 import numpy as np
-from typing import Dict, List, Optional, Tuple, Union
-from dataclasses import dataclass
-from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 import json
 import os
 from dotenv import load_dotenv
 import asyncio
-
-class LearningStyle(Enum):
-    VISUAL = "visual"
-    AUDITORY = "auditory"
-    KINESTHETIC = "kinesthetic"
-    READING_WRITING = "reading_writing"
-
-@dataclass
-class StudentProfile:
-    learning_style: LearningStyle
-    comprehension_level: float
-    attention_span: float
-    preferred_difficulty: str
-    recent_mistakes: List[str]
-    mastered_concepts: List[str]
-    cognitive_load: float
-    emotional_state: str
-    engagement_score: float
+from concurrent.futures import ThreadPoolExecutor
+from .inference_batching import BatchInferenceScheduler
+from .model_registry import ModelRegistry
+from .token_streaming import stream_generation
+from .response_cache import ResponseCache
+from .cpu_inference import CPUInferenceConfig, configure_threads, load_cpu_model
+from .kv_cache import PrefixKVCache, generate_with_prefix_cache
+from .speculative_decoding import SpeculativeDecoder
+from .answer_checker import check_answer
+from .solution_scoring import MisconceptionIndex, SolutionEncoder, student_work
+from .knowledge_graph import KnowledgeGraph
+from .engagement import EngagementModel, score_events
+from .profile_encoding import EncodedProfile, LearningStyle, ProfileEncoder, StudentProfile
 
 class AdvancedMathTutorAI:
     def __init__(self, use_gpu: bool = True):
         load_dotenv()
         self.device = torch.device("cuda" if torch.cuda.is_available() and use_gpu else "cpu")
         self._initialize_models()
+        self._initialize_batching()
+        self._initialize_response_cache()
+        self._initialize_solution_scoring()
         self.teaching_strategies = self._load_teaching_strategies()
         self.learning_adaptations = self._initialize_learning_adaptations()
         self.performance_metrics = self._initialize_performance_metrics()
         self.knowledge_graph = self._initialize_knowledge_graph()
+        self.profile_encoder = ProfileEncoder(self.knowledge_graph)
+        self.engagement_model = EngagementModel.from_env()
         self.visualization_engine = self._initialize_visualization_engine()
 
     def _initialize_models(self):
-        # Main tutoring model
-        self.main_model = self._load_model("mistralai/Mistral-7B-Instruct-v0.1")
-        
-        # Specialized models
-        self.models = {
-            "explanation": self._load_model(os.getenv("EXPLANATION_MODEL_PATH")),
-            "assessment": self._load_model(os.getenv("ASSESSMENT_MODEL_PATH")),
-            "hint_generation": self._load_model(os.getenv("HINT_MODEL_PATH")),
-            "engagement": self._load_model(os.getenv("ENGAGEMENT_MODEL_PATH"))
-        }
+        self.cpu_config = CPUInferenceConfig.from_env()
+        if self.device.type == "cpu":
+            configure_threads(self.cpu_config)
+
+        # Models are loaded on first use and evicted LRU-first once the
+        # combined weights would exceed MODEL_MEMORY_BUDGET_GB
+        self.model_registry = ModelRegistry(
+            {
+                # Main tutoring model
+                "main": "mistralai/Mistral-7B-Instruct-v0.1",
+                # Specialized models
+                "explanation": os.getenv("EXPLANATION_MODEL_PATH"),
+                "assessment": os.getenv("ASSESSMENT_MODEL_PATH"),
+                "hint_generation": os.getenv("HINT_MODEL_PATH"),
+                "engagement": os.getenv("ENGAGEMENT_MODEL_PATH"),
+                # Optional small model from the same tokenizer family
+                "draft": os.getenv("DRAFT_MODEL_PATH")
+            },
+            self._load_model,
+            memory_budget_bytes=int(float(os.getenv("MODEL_MEMORY_BUDGET_GB", "16")) * 1024 ** 3)
+        )
+        self.models = self.model_registry
         
         # Initialize tokenizers
         self.tokenizer = AutoTokenizer.from_pretrained(
             "mistralai/Mistral-7B-Instruct-v0.1",
             use_fast=True
         )
+        # Batched generation pads on the left so every prompt ends right before its new tokens
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+    def _initialize_batching(self):
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("INFERENCE_THREADS", "2")),
+            thread_name_prefix="tutor-inference"
+        )
+        self.batch_max_size = int(os.getenv("BATCH_MAX_SIZE", "8"))
+        self.batch_max_wait_ms = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+        self.generation_kwargs = {"max_length": 512}
+        self.schedulers: Dict[str, BatchInferenceScheduler] = {}
+        self.speculative_decoder = None
+        if os.getenv("DRAFT_MODEL_PATH"):
+            self.speculative_decoder = SpeculativeDecoder(
+                lambda: self.models["draft"],
+                num_draft_tokens=int(os.getenv("SPECULATIVE_DRAFT_TOKENS", "4"))
+            )
+        # Prompt KV caches of in-progress hint sessions, so follow-up hints
+        # only prefill the tokens added since the previous one
+        self.prefix_cache = PrefixKVCache(
+            max_bytes=int(float(os.getenv("KV_CACHE_MAX_MB", "512")) * 1024 ** 2),
+            idle_timeout=float(os.getenv("KV_CACHE_IDLE_SECONDS", "600"))
+        )
+
+    def _initialize_response_cache(self):
+        # Greedy decoding is deterministic, so identical prompts can share a response
+        self.response_cache = ResponseCache(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+            disk_path=os.getenv("RESPONSE_CACHE_PATH"),
+            max_disk_entries=int(os.getenv("RESPONSE_CACHE_DISK_ENTRIES", "100000"))
+        )
+        self.model_revision = os.getenv("MODEL_REVISION", "main")
+        self._inflight_generations: Dict[str, asyncio.Future] = {}
+
+    def _initialize_solution_scoring(self):
+        # Embeddings of solutions and misconception exemplars; scoring is a
+        # matrix multiply, so it runs on CPU alongside the generation models
+        self.solution_encoder = SolutionEncoder.from_env()
+        self.misconception_index = MisconceptionIndex(self.solution_encoder)
+
+    def _get_scheduler(self, model_type: str) -> BatchInferenceScheduler:
+        if model_type not in self.schedulers:
+            self.schedulers[model_type] = BatchInferenceScheduler(
+                lambda: self.models[model_type],
+                self.tokenizer,
+                self.inference_executor,
+                max_batch_size=self.batch_max_size,
+                max_wait_ms=self.batch_max_wait_ms,
+                generation_kwargs=self.generation_kwargs,
+                speculative=self.speculative_decoder,
+                model_type=model_type
+            )
+        return self.schedulers[model_type]
+
+    def get_batching_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-model micro-batching metrics"""
+        return {model_type: scheduler.get_stats() for model_type, scheduler in self.schedulers.items()}
+
+    @property
+    def main_model(self) -> Optional[nn.Module]:
+        return self.model_registry.get("main")
+
+    def get_cache_stats(self) -> Dict:
+        """Response cache hit/miss metrics"""
+        return self.response_cache.get_stats()
+
+    def get_kv_cache_stats(self) -> Dict:
+        """Session prefix KV cache reuse metrics"""
+        return self.prefix_cache.get_stats()
+
+    def get_model_stats(self) -> Dict:
+        """Model registry load/evict counters"""
+        return self.model_registry.get_stats()
+
+    async def get_inference_stats(self) -> Dict:
+        """All inference metrics; async so remote tutors can share the interface"""
+        return {
+            "pid": os.getpid(),
+            "models": self.get_model_stats(),
+            "batching": self.get_batching_stats(),
+            "response_cache": self.get_cache_stats(),
+            "kv_cache": self.get_kv_cache_stats(),
+            "speculative": self.speculative_decoder.get_stats() if self.speculative_decoder else None,
+            "solution_scoring": self.get_scoring_stats(),
+            "learning_paths": self.knowledge_graph.get_stats(),
+            "profiles": self.profile_encoder.get_stats()
+        }
+
+    def get_scoring_stats(self) -> Dict:
+        """Solution embedding throughput"""
+        stats = self.solution_encoder.stats
+        return {
+            **stats,
+            "backend": self.solution_encoder.backend,
+            "texts_per_second": stats["texts_encoded"] / stats["total_encode_time"] if stats["total_encode_time"] else 0.0
+        }
 
     def _load_model(self, model_path: str) -> Optional[nn.Module]:
         try:
-            model = AutoModelForCausalLM.from_pretrained(model_path).to(self.device)
-            
-            # Apply optimizations
-            if self.device.type == "cuda":
-                model = torch.quantization.quantize_dynamic(
-                    model, {torch.nn.Linear}, dtype=torch.qint8
-                )
+            # Dynamic quantization only has CPU kernels; GPUs get half precision instead
+            if self.device.type == "cpu":
+                return load_cpu_model(model_path, self.cpu_config)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_path,
+                torch_dtype=torch.float16
+            ).to(self.device)
             return model
         except Exception as e:
             print(f"Error loading model {model_path}: {e}")
@@ -108,9 +218,17 @@ class AdvancedMathTutorAI:
         problem: str,
         student_solution: str,
         correct_solution: str,
-        student_profile: StudentProfile
+        student_profile: StudentProfile,
+        explain_mistakes: bool = False,
+        topic: Optional[str] = None
     ) -> Dict[str, any]:
         """Assess student's solution comprehensively"""
+        # Numeric answers are graded exactly; the assessment model only runs
+        # when asked to explain a mistake or the answer is free-form text
+        check = check_answer(student_solution, correct_solution)
+        if not check.needs_model(explain_mistakes):
+            return check.to_assessment()
+
         # Analyze solution using specialized model
         assessment = await self._generate_specialized_content(
             "assessment",
@@ -123,10 +241,19 @@ class AdvancedMathTutorAI:
         )
         
         # Calculate metrics
-        similarity_score = self._calculate_solution_similarity(
+        loop = asyncio.get_running_loop()
+        similarity_score = await loop.run_in_executor(
+            self.inference_executor,
+            self._calculate_solution_similarity,
             student_solution,
             correct_solution
         )
+        misconceptions = await loop.run_in_executor(
+            self.inference_executor,
+            self._identify_misconceptions,
+            student_work(problem, student_solution),
+            topic
+        )
         
         # Generate feedback
         feedback = self._generate_personalized_feedback(
@@ -135,32 +262,36 @@ class AdvancedMathTutorAI:
         )
         
         return {
-            "is_correct": similarity_score > 0.9,
+            "is_correct": similarity_score > 0.9 if check.method == "text" else check.is_correct,
             "similarity_score": similarity_score,
             "detailed_feedback": feedback,
-            "misconceptions": self._identify_misconceptions(assessment),
+            "misconceptions": misconceptions,
             "recommended_practice": self._generate_practice_recommendations(
                 problem,
                 student_profile,
                 assessment
-            )
+            ),
+            "check": check.to_dict()
         }
 
     async def provide_hint(
         self,
         problem: str,
         student_profile: StudentProfile,
-        previous_hints: Optional[List[str]] = None
+        previous_hints: Optional[List[str]] = None,
+        session_id: Optional[str] = None
     ) -> Dict[str, any]:
         """Provide personalized hints"""
-        # Generate hint using specialized model
+        # Generate hint using specialized model; a session id (e.g. student and
+        # problem) lets follow-up hints reuse the previous prompt's KV cache
         hint = await self._generate_specialized_content(
             "hint_generation",
             {
                 "problem": problem,
                 "previous_hints": previous_hints or []
             },
-            student_profile
+            student_profile,
+            session_id=session_id
         )
         
         return {
@@ -169,27 +300,59 @@ class AdvancedMathTutorAI:
             "visual_aid": self._generate_hint_visualization(hint) if student_profile.learning_style == LearningStyle.VISUAL else None
         }
 
+    async def stream_explanation(
+        self,
+        concept: str,
+        student_profile: StudentProfile
+    ) -> AsyncIterator[str]:
+        """Stream a personalized concept explanation as it is generated"""
+        adapted_content = self._adapt_to_learning_style(
+            concept,
+            student_profile.learning_style
+        )
+        async for text in self._stream_specialized_content(
+            "explanation",
+            adapted_content,
+            student_profile
+        ):
+            yield text
+
+    async def stream_hint(
+        self,
+        problem: str,
+        student_profile: StudentProfile,
+        previous_hints: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """Stream a personalized hint as it is generated"""
+        async for text in self._stream_specialized_content(
+            "hint_generation",
+            {
+                "problem": problem,
+                "previous_hints": previous_hints or []
+            },
+            student_profile
+        ):
+            yield text
+
     async def track_engagement(
         self,
         student_profile: StudentProfile,
         session_data: Dict
     ) -> Dict[str, float]:
-        """Track student engagement in real-time"""
-        engagement_metrics = await self._analyze_engagement(
-            session_data,
-            student_profile
-        )
+        """Track student engagement from session telemetry"""
+        # Window features and a small logistic model; no language model involved
+        engagement_metrics = score_events(session_data.get("events", []), self.engagement_model)
         
         return {
-            "attention_level": engagement_metrics["attention"],
-            "interaction_rate": engagement_metrics["interaction"],
-            "emotional_state": engagement_metrics["emotion"],
+            "attention_level": engagement_metrics["attention_level"],
+            "interaction_rate": engagement_metrics["interaction_rate"],
+            "emotional_state": engagement_metrics["emotional_state"],
             "cognitive_load": engagement_metrics["cognitive_load"]
         }
 
     def optimize_learning_path(
         self,
-        student_profile: StudentProfile,
+        student_profile: Union[StudentProfile, EncodedProfile],
         learning_goals: List[str]
     ) -> Dict[str, any]:
         """Generate optimized learning path"""
@@ -203,6 +366,30 @@ class AdvancedMathTutorAI:
             "milestones": self._generate_milestones(path)
         }
 
+    def _initialize_knowledge_graph(self) -> KnowledgeGraph:
+        # Compiled once; learning paths are bitset lookups afterwards
+        return KnowledgeGraph(cache_size=int(os.getenv("LEARNING_PATH_CACHE_SIZE", "4096")))
+
+    def _assess_current_knowledge(self, student_profile: Union[StudentProfile, EncodedProfile]) -> int:
+        """Bitset of mastered concepts and their prerequisites"""
+        if isinstance(student_profile, EncodedProfile):
+            return self.profile_encoder.known_mask(student_profile)
+        return self.knowledge_graph.known_mask(student_profile.mastered_concepts)
+
+    def _generate_learning_path(self, current_knowledge: int, learning_goals: List[str]) -> List[str]:
+        path = self.knowledge_graph.plan(current_knowledge, self.knowledge_graph.mask(learning_goals))
+        return [self.knowledge_graph.concepts[i] for i in path]
+
+    def _estimate_completion_time(self, path: List[str]) -> float:
+        """Hours of practice for every concept on the path"""
+        return self.knowledge_graph.estimated_hours(path)
+
+    def _identify_prerequisites(self, path: List[str]) -> Dict[str, List[str]]:
+        return {concept: self.knowledge_graph.prerequisites_of(concept) for concept in path}
+
+    def _generate_milestones(self, path: List[str]) -> List[Dict]:
+        return self.knowledge_graph.milestones(path)
+
     def _adapt_to_learning_style(
         self,
         content: str,
@@ -212,25 +399,109 @@ class AdvancedMathTutorAI:
         adaptation = self.learning_adaptations.get(style, {})
         return adaptation.get("adapt_func", lambda x: x)(content)
 
+    def _calculate_solution_similarity(self, student_solution: str, correct_solution: str) -> float:
+        """Cosine similarity of the solution embeddings"""
+        return float(self.solution_encoder.similarity([student_solution], [correct_solution])[0])
+
+    def _identify_misconceptions(self, work: str, topic: Optional[str] = None) -> List[Dict]:
+        """Known misconceptions of the topic whose worked exemplars are closest to the student's work"""
+        return self.misconception_index.identify([work], topic)[0]
+
     async def _generate_specialized_content(
         self,
         model_type: str,
         content: Dict,
-        student_profile: StudentProfile
+        student_profile: StudentProfile,
+        session_id: Optional[str] = None
     ) -> str:
         """Generate content using specialized model"""
         if model_type not in self.models:
             return None
             
-        model = self.models[model_type]
         adapted_content = self._adapt_to_learning_style(
             str(content),
             student_profile.learning_style
         )
         
-        inputs = self.tokenizer(adapted_content, return_tensors="pt")
-        outputs = model.generate(**inputs, max_length=512)
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        cache_key = ResponseCache.make_key(
+            model_type,
+            adapted_content,
+            self.generation_kwargs,
+            f"{self.models.model_paths[model_type]}@{self.model_revision}"
+        )
+        cached = await self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Identical prompts already being generated share one result
+        if cache_key in self._inflight_generations:
+            return await asyncio.shield(self._inflight_generations[cache_key])
+
+        if session_id is not None:
+            generation = asyncio.ensure_future(
+                self._generate_in_session(model_type, adapted_content, session_id)
+            )
+        else:
+            # Concurrent requests for the same model are padded into one batch and
+            # generated off the event loop
+            generation = asyncio.ensure_future(self._get_scheduler(model_type).submit(adapted_content))
+        self._inflight_generations[cache_key] = generation
+        try:
+            result = await asyncio.shield(generation)
+        finally:
+            self._inflight_generations.pop(cache_key, None)
+        await self.response_cache.set(cache_key, result)
+        return result
+
+    async def _generate_in_session(
+        self,
+        model_type: str,
+        prompt: str,
+        session_id: str
+    ) -> str:
+        """Generate off the event loop, reusing the session's cached prompt prefix"""
+        loop = asyncio.get_running_loop()
+        input_ids = self.tokenizer(prompt, return_tensors="pt")["input_ids"]
+
+        def generate():
+            model = self.models[model_type]
+            if model is None:
+                raise RuntimeError(f"Model {model_type} is not available")
+            return generate_with_prefix_cache(
+                model,
+                input_ids,
+                self.prefix_cache,
+                (model_type, session_id),
+                self.generation_kwargs,
+                self.tokenizer.pad_token_id
+            )
+
+        sequences = await loop.run_in_executor(self.inference_executor, generate)
+        return self.tokenizer.decode(sequences[0], skip_special_tokens=True)
+
+    async def _stream_specialized_content(
+        self,
+        model_type: str,
+        content: Dict,
+        student_profile: StudentProfile
+    ) -> AsyncIterator[str]:
+        """Stream newly generated text from a specialized model"""
+        if model_type not in self.models:
+            return
+
+        adapted_content = self._adapt_to_learning_style(
+            str(content),
+            student_profile.learning_style
+        )
+
+        async for text in stream_generation(
+            lambda: self.models[model_type],
+            self.tokenizer,
+            self.inference_executor,
+            adapted_content,
+            self.generation_kwargs
+        ):
+            yield text
 
 if __name__ == "__main__":
     # Initialize tutor
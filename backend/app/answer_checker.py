@@ -0,0 +1,128 @@
+import math
+import re
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Dict, Optional
+
+# Length units from the Measurement curriculum, in metres
+UNITS = {
+    "mm": Fraction(1, 1000),
+    "cm": Fraction(1, 100),
+    "m": Fraction(1),
+    "km": Fraction(1000)
+}
+
+UNIT_ALIASES = {
+    "millimeter": "mm", "millimeters": "mm", "millimetre": "mm", "millimetres": "mm",
+    "centimeter": "cm", "centimeters": "cm", "centimetre": "cm", "centimetres": "cm",
+    "meter": "m", "meters": "m", "metre": "m", "metres": "m",
+    "kilometer": "km", "kilometers": "km", "kilometre": "km", "kilometres": "km"
+}
+
+NUMBER_PATTERN = re.compile(
+    r"""^(?P<sign>[-+])?\s*
+    (?:
+        (?P<whole>\d+)\s+(?P<mixed_num>\d+)\s*/\s*(?P<mixed_den>\d+)   # 2 1/3
+      | (?P<num>\d+)\s*/\s*(?P<den>\d+)                                # 7/4
+      | (?P<decimal>\d+\.?\d*|\.\d+)                                   # 12, 0.5, .5
+    )
+    \s*(?P<unit>[a-z]+)?$""",
+    re.VERBOSE
+)
+
+# Stored answers of fraction problems are floats, so exact rationals are
+# compared with a tolerance rather than for equality
+RELATIVE_TOLERANCE = 1e-6
+ABSOLUTE_TOLERANCE = 1e-9
+
+
+@dataclass
+class ParsedAnswer:
+    value: Fraction
+    unit: Optional[str] = None
+
+    def in_metres(self) -> Fraction:
+        return self.value * UNITS[self.unit]
+
+
+@dataclass
+class AnswerCheck:
+    is_correct: bool
+    # "numeric" when both sides parsed as numbers, else "text"
+    method: str
+    reason: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {"is_correct": self.is_correct, "method": self.method, "reason": self.reason}
+
+    def needs_model(self, explain_mistakes: bool) -> bool:
+        """Only mismatched free-form answers, or mistakes to be explained, need the assessment model"""
+        return not self.is_correct and (self.method == "text" or explain_mistakes)
+
+    def to_assessment(self) -> Dict:
+        """assess_solution's result when grading needs no model"""
+        return {
+            "is_correct": self.is_correct,
+            "similarity_score": 1.0 if self.is_correct else 0.0,
+            "detailed_feedback": None,
+            "misconceptions": [],
+            "recommended_practice": None,
+            "check": self.to_dict()
+        }
+
+
+def parse_answer(text) -> Optional[ParsedAnswer]:
+    """Integers, decimals, fractions and mixed numbers, with an optional length unit"""
+    cleaned = str(text).strip().lower().replace("−", "-").replace(",", "")
+    cleaned = cleaned.lstrip("=").strip().rstrip(".")
+    match = NUMBER_PATTERN.match(cleaned)
+    if match is None:
+        return None
+
+    if match.group("whole") is not None:
+        denominator = int(match.group("mixed_den"))
+        if denominator == 0:
+            return None
+        value = int(match.group("whole")) + Fraction(int(match.group("mixed_num")), denominator)
+    elif match.group("num") is not None:
+        denominator = int(match.group("den"))
+        if denominator == 0:
+            return None
+        value = Fraction(int(match.group("num")), denominator)
+    else:
+        value = Fraction(match.group("decimal"))
+    if match.group("sign") == "-":
+        value = -value
+
+    unit = match.group("unit")
+    if unit is not None:
+        unit = UNIT_ALIASES.get(unit, unit)
+        if unit not in UNITS:
+            return None
+    return ParsedAnswer(value, unit)
+
+
+def values_match(student: Fraction, expected: Fraction) -> bool:
+    if student == expected:
+        return True
+    return math.isclose(float(student), float(expected), rel_tol=RELATIVE_TOLERANCE, abs_tol=ABSOLUTE_TOLERANCE)
+
+
+def check_answer(student_answer, correct_answer) -> AnswerCheck:
+    """Grade an answer against the stored one without involving the tutor models"""
+    student = parse_answer(student_answer)
+    expected = parse_answer(correct_answer)
+    if expected is None:
+        # Free-form answers: compare normalised text
+        matches = " ".join(str(student_answer).lower().split()) == " ".join(str(correct_answer).lower().split())
+        return AnswerCheck(matches, "text")
+    if student is None:
+        return AnswerCheck(False, "numeric", "unparseable")
+
+    if student.unit and expected.unit:
+        # 150 cm is a correct answer to "... = ? m" with 1.5 m stored
+        return AnswerCheck(values_match(student.in_metres(), expected.in_metres()), "numeric")
+    if expected.unit and not student.unit:
+        # A bare number is read in the expected unit
+        return AnswerCheck(values_match(student.value, expected.value), "numeric", "unit_assumed")
+    return AnswerCheck(values_match(student.value, expected.value), "numeric")
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, cast, func, insert
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import ProblemAttempt, Progress
+from .progress_aggregates import MASTERY_ALPHA
+from .skill_model import SkillModel
+
+DURABILITY_MODES = ("buffered", "sync")
+
+# Keeps multi-row INSERTs well under driver bind-parameter limits
+INSERT_CHUNK_ROWS = 1000
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed write says nothing about the rows themselves, e.g. the database is unreachable"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError, DisconnectionError, OSError, asyncio.TimeoutError))
+
+
+@dataclass
+class AttemptRecord:
+    user_id: int
+    problem_id: int
+    topic: str
+    student_answer: str
+    is_correct: bool
+    time_taken: float
+    hints_used: int = 0
+    attempt_date: datetime = field(default_factory=datetime.utcnow)
+
+    def to_row(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "problem_id": self.problem_id,
+            "student_answer": self.student_answer,
+            "is_correct": self.is_correct,
+            "time_taken": self.time_taken,
+            "hints_used": self.hints_used,
+            "attempt_date": self.attempt_date
+        }
+
+    def to_json(self) -> Dict:
+        return {**asdict(self), "attempt_date": self.attempt_date.isoformat() if self.attempt_date else None}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "AttemptRecord":
+        fields = {key: value for key, value in data.items() if key in cls.__dataclass_fields__}
+        if fields.get("attempt_date"):
+            fields["attempt_date"] = datetime.fromisoformat(fields["attempt_date"])
+        return cls(**fields)
+
+
+@dataclass
+class ProgressDelta:
+    """Attempts for one (user_id, topic) folded together within a flush"""
+    attempted: int = 0
+    solved: int = 0
+    total_time: float = 0.0
+    last_attempt: Optional[datetime] = None
+    # EWMA of correctness over these attempts starting from zero; the stored
+    # mastery m becomes m * (1 - alpha)^attempted + mastery_gain
+    mastery_gain: float = 0.0
+
+    def add(self, record: AttemptRecord):
+        self.attempted += 1
+        self.solved += int(bool(record.is_correct))
+        self.total_time += record.time_taken or 0.0
+        self.last_attempt = record.attempt_date
+        self.mastery_gain = (1 - MASTERY_ALPHA) * self.mastery_gain + MASTERY_ALPHA * float(bool(record.is_correct))
+
+
+@dataclass
+class FlushOutcome:
+    written: List = field(default_factory=list)
+    upserts: int = 0
+    # (entry, error) for rows that failed on their own
+    rejected: List = field(default_factory=list)
+    # Entries not tried because the database became unreachable
+    unwritten: List = field(default_factory=list)
+    error: Optional[Exception] = None
+
+
+def fold_progress(records: List[AttemptRecord]) -> "OrderedDict[Tuple[int, str], ProgressDelta]":
+    deltas: "OrderedDict[Tuple[int, str], ProgressDelta]" = OrderedDict()
+    for record in records:
+        deltas.setdefault((record.user_id, record.topic), ProgressDelta()).add(record)
+    return deltas
+
+
+class AttemptWriteBuffer:
+    """Write-behind buffer for answer submissions.
+
+    Attempts are collected in memory and written every `flush_interval_ms`
+    or once `max_rows` are pending: one multi-row INSERT into
+    problem_attempts plus one upsert per (user_id, topic) into progress, in a
+    single transaction. With a `skill_model`, the same transaction also
+    updates skill ratings and problem difficulties. In "sync" durability
+    mode `add` returns only after the flush containing the attempt has
+    committed; in "buffered" mode it returns immediately and pending rows
+    are flushed on `stop()`.
+
+    A batch that fails on its data is retried in halves down to single rows,
+    and rows that still fail are appended to `dead_letter_path` (JSON lines,
+    see `load_dead_letters`). A batch that fails because the database is
+    unreachable is kept for the next flush, up to `max_pending` rows; older
+    rows beyond that, and rows still pending at `stop()`, are dead-lettered.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_rows: int = 500,
+        flush_interval_ms: float = 200.0,
+        durability: str = "buffered",
+        on_progress_updated: Optional[Callable[[List[int]], Awaitable[None]]] = None,
+        skill_model: Optional[SkillModel] = None,
+        max_pending: int = 50000,
+        dead_letter_path: Optional[str] = None
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.durability = durability
+        # Told which users' progress rows changed, e.g. to invalidate caches
+        self.on_progress_updated = on_progress_updated
+        self.skill_model = skill_model
+        self.max_pending = max(max_pending, max_rows)
+        self.dead_letter_path = dead_letter_path
+        self._pending: List[Tuple[AttemptRecord, Optional[asyncio.Future]]] = []
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {
+            "attempts_received": 0,
+            "attempts_written": 0,
+            "progress_upserts": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "split_retries": 0,
+            "attempts_dead_lettered": 0,
+            "largest_flush": 0,
+            "total_flush_time": 0.0
+        }
+
+    async def add(self, record: AttemptRecord):
+        """Queue one attempt"""
+        await self.add_many([record])
+
+    async def add_many(self, records: List[AttemptRecord]):
+        """Queue several attempts, e.g. a graded worksheet, as one unit"""
+        if not records:
+            return
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future() if self.durability == "sync" else None
+        # All records share one waiter, so a failed flush fails them together
+        self._pending.extend((record, waiter) for record in records)
+        self.stats["attempts_received"] += len(records)
+        await self._shed_overflow()
+        if len(self._pending) >= self.max_rows and self._wake is not None:
+            self._wake.set()
+        if self._task is None:
+            # No background flusher (e.g. scripts): write through
+            await self.flush()
+        elif waiter is not None:
+            await waiter
+
+    async def flush(self) -> int:
+        """Write everything pending; returns the number of attempts written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            outcome = await self._write_batch(batch)
+            if outcome.rejected or outcome.unwritten:
+                self.stats["failed_flushes"] += 1
+            if outcome.rejected:
+                await self._dead_letter(outcome.rejected)
+            if outcome.unwritten:
+                print(f"Error flushing {len(outcome.unwritten)} attempts, retrying next flush: {outcome.error}")
+                # Sync callers get the error; buffered rows wait for the next flush
+                self._pending[:0] = [(record, None) for record, waiter in outcome.unwritten if waiter is None]
+                self._fail_waiters(outcome.unwritten, outcome.error)
+                await self._shed_overflow()
+
+            if outcome.written:
+                elapsed = time.perf_counter() - started
+                self.stats["flushes"] += 1
+                self.stats["attempts_written"] += len(outcome.written)
+                self.stats["progress_upserts"] += outcome.upserts
+                self.stats["largest_flush"] = max(self.stats["largest_flush"], len(outcome.written))
+                self.stats["total_flush_time"] += elapsed
+            for _, waiter in outcome.written:
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+            return len(outcome.written)
+
+    async def _write_batch(self, batch: List) -> FlushOutcome:
+        """Write a batch, retrying halves of any chunk that fails on its data"""
+        outcome = FlushOutcome()
+        # Stack of chunks still to write; the last one is the oldest
+        chunks = [batch]
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                outcome.upserts += await self._write([record for record, _ in chunk])
+                outcome.written.extend(chunk)
+            except Exception as e:
+                if is_transient(e):
+                    outcome.unwritten = chunk + [entry for rest in reversed(chunks) for entry in rest]
+                    outcome.error = e
+                    break
+                if len(chunk) == 1:
+                    outcome.rejected.append((chunk[0], e))
+                    continue
+                self.stats["split_retries"] += 1
+                middle = len(chunk) // 2
+                chunks.extend([chunk[middle:], chunk[:middle]])
+        return outcome
+
+    async def _shed_overflow(self):
+        """Dead-letter the oldest pending rows beyond max_pending"""
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return
+        shed, self._pending = self._pending[:overflow], self._pending[overflow:]
+        error = RuntimeError(f"more than {self.max_pending} attempts pending")
+        await self._dead_letter([(entry, error) for entry in shed])
+
+    @staticmethod
+    def _fail_waiters(entries: List, error: Exception):
+        for _, waiter in entries:
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(error)
+
+    async def _dead_letter(self, failures: List):
+        """Set rows that cannot be written aside, so one bad row does not block the rest"""
+        print(f"Dead-lettering {len(failures)} attempts: {failures[0][1]}")
+        self.stats["attempts_dead_lettered"] += len(failures)
+        for entry, error in failures:
+            self._fail_waiters([entry], error)
+        if self.dead_letter_path is None:
+            return
+        lines = [
+            json.dumps({**record.to_json(), "error": str(error), "failed_at": datetime.utcnow().isoformat()})
+            for (record, _), error in failures
+        ]
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._append_lines, lines)
+        except Exception as e:
+            print(f"Error writing attempt dead letters to {self.dead_letter_path}: {e}")
+
+    def _append_lines(self, lines: List[str]):
+        with open(self.dead_letter_path, "a") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    async def _write(self, records: List[AttemptRecord]) -> int:
+        deltas = fold_progress(records)
+        async with self.session_factory() as db:
+            async with db.begin():
+                rows = [record.to_row() for record in records]
+                for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+                    await db.execute(insert(ProblemAttempt).values(rows[start:start + INSERT_CHUNK_ROWS]))
+                await db.execute(self._progress_upsert(db.bind.dialect.name, deltas))
+                if self.skill_model is not None:
+                    await self.skill_model.apply(db, records)
+        if self.on_progress_updated is not None:
+            await self.on_progress_updated([user_id for user_id, _ in deltas])
+        return len(deltas)
+
+    @staticmethod
+    def _progress_upsert(dialect: str, deltas: "OrderedDict[Tuple[int, str], ProgressDelta]"):
+        """One INSERT ... ON CONFLICT (user_id, topic) DO UPDATE for all touched rows"""
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        statement = dialect_insert(Progress).values([
+            {
+                "user_id": user_id,
+                "topic": topic,
+                "problems_attempted": delta.attempted,
+                "problems_solved": delta.solved,
+                "solve_rate": delta.solved / delta.attempted,
+                "mastery_level": delta.mastery_gain,
+                "average_time": delta.total_time / delta.attempted,
+                "last_updated": delta.last_attempt
+            }
+            for (user_id, topic), delta in deltas.items()
+        ])
+        new = statement.excluded
+        attempted = Progress.problems_attempted + new.problems_attempted
+        solved = Progress.problems_solved + new.problems_solved
+        return statement.on_conflict_do_update(
+            index_elements=[Progress.user_id, Progress.topic],
+            set_={
+                "problems_attempted": attempted,
+                "problems_solved": solved,
+                "solve_rate": cast(solved, Float) / attempted,
+                # Decay the stored EWMA by one step per new attempt, then add theirs
+                "mastery_level": (
+                    func.coalesce(Progress.mastery_level, 0.0)
+                    * func.power(1 - MASTERY_ALPHA, new.problems_attempted)
+                    + new.mastery_level
+                ),
+                # Combine running means weighted by their attempt counts
+                "average_time": (
+                    func.coalesce(Progress.average_time, 0.0) * Progress.problems_attempted
+                    + new.average_time * new.problems_attempted
+                ) / attempted,
+                "last_updated": new.last_updated
+            }
+        )
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flusher on the running event loop"""
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stopping = True
+        if self._task is not None:
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            # The database is still unreachable; keep the rows on disk instead
+            error = RuntimeError("database unreachable at shutdown")
+            shed, self._pending = self._pending, []
+            await self._dead_letter([(entry, error) for entry in shed])
+
+    def get_stats(self) -> Dict:
+        flushes = self.stats["flushes"]
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "average_flush_size": self.stats["attempts_written"] / flushes if flushes else 0.0,
+            "average_flush_time": self.stats["total_flush_time"] / flushes if flushes else 0.0
+        }
+
+
+def load_dead_letters(path: str) -> List[AttemptRecord]:
+    """Read attempts set aside by AttemptWriteBuffer, e.g. to replay them once fixed"""
+    with open(path) as f:
+        return [AttemptRecord.from_json(json.loads(line)) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    from .database import AsyncSessionLocal
+
+    parser = argparse.ArgumentParser(description="Replay dead-lettered attempts")
+    parser.add_argument("path", help="Dead letter file (ATTEMPT_DEAD_LETTER_PATH)")
+    args = parser.parse_args()
+
+    async def replay():
+        buffer = AttemptWriteBuffer(AsyncSessionLocal, dead_letter_path=args.path + ".failed")
+        await buffer.add_many(load_dead_letters(args.path))
+        await buffer.stop()
+        print(buffer.get_stats())
+
+    asyncio.run(replay())
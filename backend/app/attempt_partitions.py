@@ -0,0 +1,339 @@
+"""Monthly partitions and retention for problem_attempts.
+
+In Postgres `problem_attempts` is range-partitioned on `attempt_date`, one
+partition per month (problem_attempts_y2026m01, ...), plus a DEFAULT
+partition so an attempt outside every month (a skewed clock, maintenance
+that fell behind) is still stored. The maintainer keeps `months_ahead`
+future partitions in place and compacts every month older than
+`retention_months` into `attempt_daily_summaries` (one row per student,
+topic and day) before detaching and dropping its partition. On other
+databases the same rollup runs and the compacted rows are deleted.
+
+Every web worker starts a maintainer, but a run only proceeds while it holds
+a Postgres advisory lock, so one worker at a time creates, detaches and
+drops partitions; the others skip that run.
+
+    python -m app.attempt_partitions ensure|compact
+"""
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import AttemptDailySummary, MathProblem, ProblemAttempt
+
+PARENT_TABLE = ProblemAttempt.__tablename__
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+# Held by whichever process is maintaining partitions (Postgres)
+PARTITION_MAINTENANCE_LOCK = 0x5C4E3A02
+
+# Summary topic for attempts whose problem is missing (NULL or deleted), so
+# they are still counted before their partition is dropped
+UNKNOWN_TOPIC = "unknown"
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """Inverse of partition_name; None for partitions not created here"""
+    suffix = name[len(PARENT_TABLE) + 1:]
+    if not name.startswith(PARENT_TABLE + "_") or len(suffix) != 8 or suffix[0] != "y" or suffix[5] != "m":
+        return None
+    try:
+        return datetime(int(suffix[1:5]), int(suffix[6:8]), 1)
+    except ValueError:
+        return None
+
+
+class AttemptPartitionMaintainer:
+    """Background job creating future partitions and compacting old ones"""
+
+    def __init__(
+        self,
+        engine,
+        months_ahead: Optional[int] = None,
+        retention_months: Optional[int] = None,
+        check_interval: float = 6 * 3600.0
+    ):
+        self.engine = engine
+        self.months_ahead = months_ahead if months_ahead is not None else int(os.getenv("ATTEMPT_PARTITIONS_AHEAD", "3"))
+        self.retention_months = retention_months if retention_months is not None else int(os.getenv("ATTEMPT_RETENTION_MONTHS", "12"))
+        self.check_interval = check_interval
+        self.is_postgres = engine.dialect.name == "postgresql"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "partitions_created": 0,
+            "months_compacted": 0,
+            "attempts_compacted": 0,
+            "summary_rows_written": 0,
+            "maintenance_runs": 0,
+            "maintenance_skipped": 0,
+            "maintenance_errors": 0,
+            "total_compaction_time": 0.0
+        }
+
+    def list_partitions(self, conn) -> List[str]:
+        rows = conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"
+        ), {"parent": PARENT_TABLE})
+        return [row[0] for row in rows]
+
+    def is_partitioned(self, conn) -> bool:
+        return conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table "
+            "JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+            "WHERE pg_class.relname = :parent"
+        ), {"parent": PARENT_TABLE}).first() is not None
+
+    @contextmanager
+    def maintenance_lock(self):
+        """Yields whether this process may maintain partitions now"""
+        if not self.is_postgres:
+            yield True
+            return
+        with self.engine.connect() as conn:
+            key = {"key": PARTITION_MAINTENANCE_LOCK}
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), key).scalar()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), key)
+
+    def _create_month(self, conn, month: datetime):
+        start, end = month.isoformat(), add_months(month, 1).isoformat()
+        bounds = {"start": start, "end": end}
+        stranded = conn.execute(text(
+            f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE attempt_date >= :start AND attempt_date < :end LIMIT 1"
+        ), bounds).first() is not None
+        if not stranded:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+            return
+        # Postgres refuses a partition whose range already has rows in the
+        # default one, so move them over while the default is detached
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+        conn.execute(text(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE attempt_date >= :start AND attempt_date < :end RETURNING *) "
+            f"INSERT INTO {PARENT_TABLE} SELECT * FROM moved"
+        ), bounds)
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+    def ensure_partitions(self, now: Optional[datetime] = None) -> int:
+        """Create the default partition and monthly ones from the oldest retained month through months_ahead"""
+        if not self.is_postgres:
+            return 0
+        current = month_start(now or datetime.utcnow())
+        created = 0
+        with self.engine.begin() as conn:
+            if not self.is_partitioned(conn):
+                # Tables created before partitioning need a one-off migration
+                print(f"{PARENT_TABLE} is not partitioned; skipping partition maintenance")
+                return 0
+            existing = set(self.list_partitions(conn))
+            if DEFAULT_PARTITION not in existing:
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+                created += 1
+            for offset in range(-self.retention_months, self.months_ahead + 1):
+                month = add_months(current, offset)
+                if partition_name(month) in existing:
+                    continue
+                self._create_month(conn, month)
+                created += 1
+        with self._lock:
+            self.stats["partitions_created"] += created
+        return created
+
+    def _expired_months(self, conn, cutoff: datetime) -> List[datetime]:
+        if self.is_postgres:
+            months = [partition_month(name) for name in self.list_partitions(conn)]
+            return sorted(month for month in months if month is not None and month < cutoff)
+        oldest = conn.execute(select(func.min(ProblemAttempt.attempt_date))).scalar()
+        if oldest is None:
+            return []
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+        months, month = [], month_start(oldest)
+        while month < cutoff:
+            months.append(month)
+            month = add_months(month, 1)
+        return months
+
+    def _rollup_statement(self, start: datetime, end: datetime):
+        """INSERT ... SELECT of one month's attempts, adding onto existing day rows"""
+        day = func.date(ProblemAttempt.attempt_date)
+        topic = func.coalesce(MathProblem.topic, UNKNOWN_TOPIC)
+        rollup = (
+            select(
+                ProblemAttempt.user_id,
+                topic,
+                day,
+                func.count(),
+                func.sum(case((ProblemAttempt.is_correct, 1), else_=0)),
+                func.sum(func.coalesce(ProblemAttempt.time_taken, 0.0)),
+                func.sum(func.coalesce(ProblemAttempt.hints_used, 0))
+            )
+            # Outer join: every attempt in the month must land in a summary row
+            .outerjoin(MathProblem, MathProblem.id == ProblemAttempt.problem_id)
+            .where(and_(ProblemAttempt.attempt_date >= start, ProblemAttempt.attempt_date < end))
+            .group_by(ProblemAttempt.user_id, topic, day)
+        )
+        dialect_insert = postgresql_insert if self.is_postgres else sqlite_insert
+        statement = dialect_insert(AttemptDailySummary).from_select(
+            ["user_id", "topic", "day", "attempts", "solved", "total_time", "hints_used"],
+            rollup
+        )
+        new = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=[AttemptDailySummary.user_id, AttemptDailySummary.topic, AttemptDailySummary.day],
+            set_={
+                "attempts": AttemptDailySummary.attempts + new.attempts,
+                "solved": AttemptDailySummary.solved + new.solved,
+                "total_time": AttemptDailySummary.total_time + new.total_time,
+                "hints_used": AttemptDailySummary.hints_used + new.hints_used
+            }
+        )
+
+    def compact_month(self, month: datetime) -> int:
+        """Roll one month into daily summaries and drop its raw attempts"""
+        start, end = month, add_months(month, 1)
+        started = time.perf_counter()
+        with self.engine.begin() as conn:
+            in_month = and_(ProblemAttempt.attempt_date >= start, ProblemAttempt.attempt_date < end)
+            compacted = conn.execute(select(func.count()).select_from(ProblemAttempt).where(in_month)).scalar()
+            summaries = conn.execute(self._rollup_statement(start, end)).rowcount
+            if self.is_postgres:
+                name = partition_name(month)
+                conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            else:
+                conn.execute(delete(ProblemAttempt).where(in_month))
+        with self._lock:
+            self.stats["months_compacted"] += 1
+            self.stats["attempts_compacted"] += compacted
+            self.stats["summary_rows_written"] += max(summaries, 0)
+            self.stats["total_compaction_time"] += time.perf_counter() - started
+        return compacted
+
+    def compact_default(self, cutoff: datetime) -> int:
+        """Roll up and delete default-partition rows from before the retention window"""
+        started = time.perf_counter()
+        with self.engine.begin() as conn:
+            if DEFAULT_PARTITION not in self.list_partitions(conn):
+                return 0
+            oldest = conn.execute(text(f"SELECT MIN(attempt_date) FROM {DEFAULT_PARTITION}")).scalar()
+            if oldest is None or oldest >= cutoff:
+                return 0
+            # Expired monthly partitions are already gone, so these rows are the default's
+            summaries = conn.execute(self._rollup_statement(oldest, cutoff)).rowcount
+            compacted = conn.execute(
+                text(f"DELETE FROM {DEFAULT_PARTITION} WHERE attempt_date < :cutoff"), {"cutoff": cutoff}
+            ).rowcount
+        with self._lock:
+            self.stats["attempts_compacted"] += compacted
+            self.stats["summary_rows_written"] += max(summaries, 0)
+            self.stats["total_compaction_time"] += time.perf_counter() - started
+        return compacted
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """Compact every month that fell out of the retention window"""
+        cutoff = add_months(month_start(now or datetime.utcnow()), -self.retention_months)
+        with self.engine.connect() as conn:
+            months = self._expired_months(conn, cutoff)
+        compacted = sum(self.compact_month(month) for month in months)
+        if self.is_postgres:
+            compacted += self.compact_default(cutoff)
+        return compacted
+
+    def run_once(self) -> bool:
+        """One maintenance pass; False if another process holds the maintenance lock"""
+        try:
+            with self.maintenance_lock() as acquired:
+                if not acquired:
+                    with self._lock:
+                        self.stats["maintenance_skipped"] += 1
+                    return False
+                self.ensure_partitions()
+                self.compact()
+        except Exception as e:
+            with self._lock:
+                self.stats["maintenance_errors"] += 1
+            print(f"Error maintaining attempt partitions: {e}")
+        with self._lock:
+            self.stats["maintenance_runs"] += 1
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.run_once()
+
+    def start(self):
+        """Make sure this month's partitions exist, then maintain in the background"""
+        self.run_once()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="attempt-partition-maintainer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "months_ahead": self.months_ahead,
+                "retention_months": self.retention_months
+            }
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="problem_attempts partition maintenance")
+    parser.add_argument("command", choices=["ensure", "compact"])
+    parser.add_argument("--retention-months", type=int, help="Override ATTEMPT_RETENTION_MONTHS")
+    args = parser.parse_args()
+
+    maintainer = AttemptPartitionMaintainer(engine, retention_months=args.retention_months)
+    with maintainer.maintenance_lock() as acquired:
+        if not acquired:
+            print("Another process is maintaining partitions; try again later")
+        elif args.command == "ensure":
+            print(f"Created {maintainer.ensure_partitions()} partitions")
+        else:
+            print(f"Compacted {maintainer.compact()} attempts")
+    print(maintainer.get_stats())
@@ -0,0 +1,281 @@
+import asyncio
+import hmac
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import jwt
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import RevokedToken
+from .passwords import pwd_context
+
+try:
+    import redis.asyncio as async_redis
+except ImportError:
+    async_redis = None
+
+JWT_ALGORITHM = "HS256"
+
+
+class HashingBusy(Exception):
+    """Raised when too many logins are already waiting for a hashing thread"""
+
+
+class PasswordHasher:
+    """Runs password hashing in a small dedicated thread pool.
+
+    At most `max_workers` hashes run at once, and at most `max_pending`
+    logins may wait for one; beyond that, or after `queue_timeout` seconds of
+    waiting, HashingBusy is raised so a login storm sheds load instead of
+    piling up work behind the rest of the API.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        queue_timeout: float = 5.0
+    ):
+        self.max_workers = max_workers or int(os.getenv("AUTH_HASH_WORKERS", "2"))
+        self.max_pending = max_pending or int(os.getenv("AUTH_HASH_MAX_PENDING", "32"))
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self.stats = {
+            "hashes": 0,
+            "rejected": 0,
+            "total_hash_time": 0.0,
+            "total_queue_time": 0.0,
+            "max_waiting": 0
+        }
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self._waiting >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HashingBusy()
+
+        queued = time.perf_counter()
+        self._waiting += 1
+        self.stats["max_waiting"] = max(self.stats["max_waiting"], self._waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise HashingBusy()
+        finally:
+            self._waiting -= 1
+
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._slots.release()
+            self.stats["hashes"] += 1
+            self.stats["total_queue_time"] += started - queued
+            self.stats["total_hash_time"] += time.perf_counter() - started
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    def get_stats(self) -> Dict:
+        hashes = self.stats["hashes"]
+        return {
+            **self.stats,
+            "waiting": self._waiting,
+            "average_hash_time": self.stats["total_hash_time"] / hashes if hashes else 0.0,
+            "average_queue_time": self.stats["total_queue_time"] / hashes if hashes else 0.0
+        }
+
+
+class InvalidToken(Exception):
+    """Raised for tokens that are malformed, expired, forged or revoked"""
+
+
+class DatabaseRevocationStore:
+    """Revoked token ids in the revoked_tokens table, shared by every worker"""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def is_revoked(self, jti: str) -> bool:
+        async with self.session_factory() as db:
+            return (await db.execute(select(RevokedToken.jti).where(RevokedToken.jti == jti))).first() is not None
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        async with self.session_factory() as db:
+            async with db.begin():
+                dialect_insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+                await db.execute(
+                    dialect_insert(RevokedToken).values(jti=jti, expires_at=expires_at).on_conflict_do_nothing()
+                )
+                # Expired tokens fail verification anyway; keep the table small
+                await db.execute(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow()))
+
+
+class RedisRevocationStore:
+    """Revoked token ids in Redis; the server must not evict keys (maxmemory-policy noeviction)"""
+
+    def __init__(self, client, prefix: str = "revoked:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRevocationStore":
+        if url.startswith("fakeredis://"):
+            import fakeredis
+            return cls(fakeredis.FakeAsyncRedis())
+        if async_redis is None:
+            raise RuntimeError("TOKEN_REVOCATION_URL is set but the redis package is not installed")
+        return cls(async_redis.from_url(url))
+
+    async def is_revoked(self, jti: str) -> bool:
+        return bool(await self.client.exists(self.prefix + jti))
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        remaining = (expires_at - datetime.utcnow()).total_seconds()
+        if remaining > 0:
+            await self.client.set(self.prefix + jti, "1", px=int(remaining * 1000))
+
+
+def make_revocation_store(session_factory, url: Optional[str] = None):
+    """Redis when TOKEN_REVOCATION_URL is set, else the revoked_tokens table.
+
+    Not the identity cache: revocations must reach every worker and must
+    never be evicted, or a logged-out token becomes valid again.
+    """
+    url = url if url is not None else os.getenv("TOKEN_REVOCATION_URL")
+    if url:
+        return RedisRevocationStore.from_url(url)
+    return DatabaseRevocationStore(session_factory)
+
+
+class TokenVerifier:
+    """Issues and verifies access tokens, caching verified claims.
+
+    Verified claims are kept in an LRU keyed by the token's signature until
+    the token expires (or `cache_ttl` passes), so repeat requests skip the
+    JWT decode. Every lookup, cached or not, consults `revocations`, a store
+    shared by all workers that keeps each revocation until the token would
+    have expired (see make_revocation_store).
+    """
+
+    def __init__(
+        self,
+        secret_key: str,
+        revocations,
+        token_ttl: timedelta = timedelta(days=1),
+        cache_ttl: float = 300.0,
+        max_entries: int = 10000
+    ):
+        self.secret_key = secret_key
+        self.revocations = revocations
+        self.token_ttl = token_ttl
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[str, float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "verifications": 0,
+            "cache_hits": 0,
+            "decodes": 0,
+            "invalid": 0,
+            "revoked": 0,
+            "total_verify_time": 0.0,
+            "total_decode_time": 0.0
+        }
+
+    def create_token(self, username: str) -> str:
+        claims = {
+            "sub": username,
+            "exp": datetime.utcnow() + self.token_ttl,
+            # Revocation is by token id
+            "jti": uuid.uuid4().hex
+        }
+        return jwt.encode(claims, self.secret_key, algorithm=JWT_ALGORITHM)
+
+    @staticmethod
+    def _signature(token: str) -> str:
+        return token.rsplit(".", 1)[-1]
+
+    def _cached_claims(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._cache.get(self._signature(token))
+            if entry is None:
+                return None
+            cached_token, expires_at, claims = entry
+            # A reused signature with a different header/payload is not the same token
+            if not hmac.compare_digest(cached_token, token) or expires_at < time.time():
+                del self._cache[self._signature(token)]
+                return None
+            self._cache.move_to_end(self._signature(token))
+            return claims
+
+    def _decode(self, token: str) -> Dict:
+        started = time.perf_counter()
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[JWT_ALGORITHM])
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+        finally:
+            self.stats["decodes"] += 1
+            self.stats["total_decode_time"] += time.perf_counter() - started
+
+        expires_at = min(float(claims.get("exp", 0)), time.time() + self.cache_ttl)
+        with self._lock:
+            self._cache[self._signature(token)] = (token, expires_at, claims)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return claims
+
+    async def verify(self, token: str) -> Dict:
+        """Claims of a valid, unrevoked token; raises InvalidToken otherwise"""
+        started = time.perf_counter()
+        self.stats["verifications"] += 1
+        try:
+            claims = self._cached_claims(token)
+            if claims is not None:
+                self.stats["cache_hits"] += 1
+            else:
+                claims = self._decode(token)
+            if claims.get("jti") and await self.revocations.is_revoked(claims["jti"]):
+                self.stats["revoked"] += 1
+                raise InvalidToken("Token has been revoked")
+            return claims
+        except InvalidToken:
+            self.stats["invalid"] += 1
+            raise
+        finally:
+            self.stats["total_verify_time"] += time.perf_counter() - started
+
+    async def revoke(self, token: str):
+        """Reject this token from now until it would have expired"""
+        claims = await self.verify(token)
+        expires_at = datetime.utcfromtimestamp(float(claims.get("exp", 0)))
+        if claims.get("jti") and expires_at > datetime.utcnow():
+            await self.revocations.revoke(claims["jti"], expires_at)
+        with self._lock:
+            self._cache.pop(self._signature(token), None)
+
+    def get_stats(self) -> Dict:
+        verifications = self.stats["verifications"]
+        return {
+            **self.stats,
+            "cached_tokens": len(self._cache),
+            "hit_rate": self.stats["cache_hits"] / verifications if verifications else 0.0,
+            "average_verify_time": self.stats["total_verify_time"] / verifications if verifications else 0.0,
+            "average_decode_time": self.stats["total_decode_time"] / self.stats["decodes"] if self.stats["decodes"] else 0.0
+        }
@@ -4,10 +4,10 @@ from dataclasses import dataclass
 import json
 from enum import Enum
 import random
-import matplotlib.pyplot as plt
-import io
-import base64
 from datetime import datetime
+import copy
+from .curriculum import CURRICULUM
+from .visual_aids import VisualAidGenerator
 
 class DifficultyLevel(Enum):
     EASY = "easy"
@@ -29,77 +29,14 @@ class AdvancedContentGenerator:
     def __init__(self, ai_tutor):
         self.ai_tutor = ai_tutor
         self.curriculum = self._initialize_curriculum()
-        self.problem_templates = self._load_problem_templates()
         self.difficulty_adjustor = AdaptiveDifficultyEngine()
         self.visual_generator = VisualAidGenerator()
-        self.template_engine = InteractiveProblemTemplates()
+        # Created on the first interactive request; batch generation doesn't use it
+        self.template_engine: Optional[InteractiveProblemTemplates] = None
+        self.batch_generator = BatchProblemGenerator(self.curriculum)
 
     def _initialize_curriculum(self) -> Dict:
-        return {
-            "Grade 1": {
-                "Addition": {
-                    "easy": {"range": (1, 10), "terms": 2},
-                    "medium": {"range": (1, 20), "terms": 2},
-                    "hard": {"range": (1, 50), "terms": 3}
-                },
-                "Subtraction": {
-                    "easy": {"range": (1, 10), "min_result": 0},
-                    "medium": {"range": (1, 20), "min_result": 0},
-                    "hard": {"range": (1, 50), "min_result": 0}
-                }
-            },
-            "Grade 2": {
-                "Addition": {
-                    "easy": {"range": (10, 50), "terms": 2},
-                    "medium": {"range": (10, 100), "terms": 2},
-                    "hard": {"range": (10, 100), "terms": 3}
-                },
-                "Subtraction": {
-                    "easy": {"range": (10, 50), "min_result": 0},
-                    "medium": {"range": (10, 100), "min_result": 0},
-                    "hard": {"range": (10, 100), "min_result": 0}
-                },
-                "Multiplication": {
-                    "easy": {"range": (1, 5)},
-                    "medium": {"range": (1, 10)},
-                    "hard": {"range": (1, 12)}
-                }
-            },
-            "Grade 3": {
-                "Multiplication": {
-                    "easy": {"range": (2, 9)},
-                    "medium": {"range": (2, 12)},
-                    "hard": {"range": (2, 15)}
-                },
-                "Division": {
-                    "easy": {"range": (1, 20), "divisors": (2, 5)},
-                    "medium": {"range": (1, 50), "divisors": (2, 9)},
-                    "hard": {"range": (1, 100), "divisors": (2, 12)}
-                }
-            },
-            "Grade 4": {
-                "Fractions": {
-                    "easy": {"denominators": [2, 3, 4]},
-                    "medium": {"denominators": [2, 3, 4, 5, 6]},
-                    "hard": {"denominators": [2, 3, 4, 5, 6, 8, 10]}
-                },
-                "Decimals": {
-                    "easy": {"places": 1},
-                    "medium": {"places": 2},
-                    "hard": {"places": 3}
-                },
-                "Geometry": {
-                    "easy": {"shapes": ["square", "rectangle", "triangle"]},
-                    "medium": {"shapes": ["circle", "parallelogram", "rhombus"]},
-                    "hard": {"shapes": ["trapezoid", "pentagon", "hexagon"]}
-                },
-                "Measurement": {
-                    "easy": {"units": ["cm", "m"], "conversions": False},
-                    "medium": {"units": ["mm", "cm", "m"], "conversions": True},
-                    "hard": {"units": ["mm", "cm", "m", "km"], "conversions": True}
-                }
-            }
-        }
+        return copy.deepcopy(CURRICULUM)
 
     def generate_problem_set(
         self,
@@ -121,6 +58,8 @@ class AdvancedContentGenerator:
                 student_profile
             )
             if interactive:
+                if self.template_engine is None:
+                    self.template_engine = InteractiveProblemTemplates()
                 problem = self.template_engine.create_interactive_problem(
                     problem,
                     "drag_and_drop"
@@ -135,6 +74,23 @@ class AdvancedContentGenerator:
         
         return problems
 
+    def generate_problem_batch(
+        self,
+        grade: str,
+        topic: str,
+        difficulty: str,
+        count: int,
+        seed: Optional[int] = None,
+        with_visuals: bool = False
+    ) -> List[MathProblem]:
+        """Generate many problems at once; the same seed yields the same problems"""
+        problems = self.batch_generator.generate(grade, topic, difficulty, count, seed)
+        if with_visuals:
+            visuals = self.visual_generator.generate_visuals(problems)
+            for problem, visual in zip(problems, visuals):
+                problem.visual_aids = visual
+        return problems
+
     def _generate_single_problem(
         self,
         grade: str,
@@ -191,6 +147,197 @@ class AdvancedContentGenerator:
 
     # Similar methods for other problem types...
 
+class BatchProblemGenerator:
+    """Vectorized problem generation for worksheet exports and pre-generation.
+
+    All operands for a (grade, topic, difficulty) are drawn at once from a
+    seeded NumPy Generator; constraints such as `min_result` and `divisors`
+    are enforced by redrawing only the rejected rows.
+    """
+
+    HINTS = {
+        "Addition": [
+            "Try counting up from the first number",
+            "Break the numbers into tens and ones",
+            "Look for combinations that make 10"
+        ],
+        "Subtraction": [
+            "Try counting back from the bigger number",
+            "Count up from the smaller number to the bigger one",
+            "Break the number you take away into tens and ones"
+        ],
+        "Multiplication": [
+            "Think of it as equal groups",
+            "Skip count by one of the numbers",
+            "Swap the numbers if the other order is easier"
+        ],
+        "Division": [
+            "How many equal groups can you make?",
+            "Think of the multiplication fact that matches",
+            "Share the total out one at a time"
+        ],
+        "Fractions": [
+            "The denominators are the same, so add the numerators",
+            "Keep the denominator the same",
+            "Draw the pieces to check your answer"
+        ],
+        "Decimals": [
+            "Line up the decimal points",
+            "Add each place value from right to left",
+            "Remember to carry into the next place"
+        ]
+    }
+
+    def __init__(self, curriculum: Dict):
+        self.curriculum = curriculum
+        self.builders = {
+            "Addition": self._build_addition,
+            "Subtraction": self._build_subtraction,
+            "Multiplication": self._build_multiplication,
+            "Division": self._build_division,
+            "Fractions": self._build_fractions,
+            "Decimals": self._build_decimals
+        }
+
+    def generate(
+        self,
+        grade: str,
+        topic: str,
+        difficulty: str,
+        count: int,
+        seed: Optional[int] = None
+    ) -> List[MathProblem]:
+        if topic not in self.builders:
+            raise ValueError(f"Unsupported topic for batch generation: {topic}")
+        try:
+            config = self.curriculum[grade][topic][difficulty]
+        except KeyError:
+            raise ValueError(f"No curriculum for {grade} {topic} {difficulty}")
+
+        rng = np.random.default_rng(seed)
+        questions, answers, steps = self.builders[topic](rng, config, count)
+        level = DifficultyLevel(difficulty)
+        hints = self.HINTS[topic]
+        return [
+            MathProblem(
+                question=question,
+                answer=answer,
+                difficulty=level,
+                topic=topic,
+                grade_level=grade,
+                solution_steps=solution_steps,
+                hints=list(hints)
+            )
+            for question, answer, solution_steps in zip(questions, answers, steps)
+        ]
+
+    @staticmethod
+    def _rejection_sample(rng, count: int, draw, accept, max_rounds: int = 100) -> np.ndarray:
+        """Draw rows with `draw(rng, n)` until `count` of them satisfy `accept`"""
+        kept = []
+        needed = count
+        for _ in range(max_rounds):
+            rows = draw(rng, max(2 * needed, 16))
+            rows = rows[accept(rows)][:needed]
+            kept.append(rows)
+            needed -= len(rows)
+            if needed <= 0:
+                return np.concatenate(kept)
+        raise ValueError("Could not generate problems satisfying the curriculum constraints")
+
+    def _build_addition(self, rng, config: Dict, count: int):
+        low, high = config["range"]
+        terms = rng.integers(low, high, size=(count, config["terms"]), endpoint=True)
+        answers = terms.sum(axis=1).tolist()
+        rows = terms.tolist()
+        questions = [" + ".join(map(str, row)) + " = ?" for row in rows]
+        steps = [
+            [f"Start with {row[0]}", *[f"Add {term}" for term in row[1:]], f"Total: {answer}"]
+            for row, answer in zip(rows, answers)
+        ]
+        return questions, answers, steps
+
+    def _build_subtraction(self, rng, config: Dict, count: int):
+        low, high = config["range"]
+        min_result = config.get("min_result", 0)
+        pairs = self._rejection_sample(
+            rng,
+            count,
+            lambda rng, n: rng.integers(low, high, size=(n, 2), endpoint=True),
+            lambda rows: rows[:, 0] - rows[:, 1] >= min_result
+        )
+        answers = (pairs[:, 0] - pairs[:, 1]).tolist()
+        rows = pairs.tolist()
+        questions = [f"{a} - {b} = ?" for a, b in rows]
+        steps = [
+            [f"Start with {a}", f"Take away {b}", f"Result: {answer}"]
+            for (a, b), answer in zip(rows, answers)
+        ]
+        return questions, answers, steps
+
+    def _build_multiplication(self, rng, config: Dict, count: int):
+        low, high = config["range"]
+        factors = rng.integers(low, high, size=(count, 2), endpoint=True)
+        answers = (factors[:, 0] * factors[:, 1]).tolist()
+        rows = factors.tolist()
+        questions = [f"{a} × {b} = ?" for a, b in rows]
+        steps = [
+            [f"Make {a} groups of {b}", f"Skip count by {b} {a} times", f"Product: {answer}"]
+            for (a, b), answer in zip(rows, answers)
+        ]
+        return questions, answers, steps
+
+    def _build_division(self, rng, config: Dict, count: int):
+        low, high = config["range"]
+        divisor_low, divisor_high = config["divisors"]
+
+        def draw(rng, n):
+            return np.column_stack([
+                rng.integers(low, high, size=n, endpoint=True),
+                rng.integers(divisor_low, divisor_high, size=n, endpoint=True)
+            ])
+
+        pairs = self._rejection_sample(
+            rng,
+            count,
+            draw,
+            lambda rows: (rows[:, 0] % rows[:, 1] == 0) & (rows[:, 0] >= rows[:, 1])
+        )
+        answers = (pairs[:, 0] // pairs[:, 1]).tolist()
+        rows = pairs.tolist()
+        questions = [f"{a} ÷ {b} = ?" for a, b in rows]
+        steps = [
+            [f"Share {a} into {b} equal groups", f"Check: {b} × {answer} = {a}", f"Quotient: {answer}"]
+            for (a, b), answer in zip(rows, answers)
+        ]
+        return questions, answers, steps
+
+    def _build_fractions(self, rng, config: Dict, count: int):
+        denominators = rng.choice(np.asarray(config["denominators"]), size=count)
+        # Numerators between 1 and denominator - 1 (halves only allow 1)
+        numerators = 1 + np.floor(rng.random((count, 2)) * (denominators[:, None] - 1)).astype(int)
+        answers = ((numerators[:, 0] + numerators[:, 1]) / denominators).tolist()
+        rows = np.column_stack([numerators, denominators]).tolist()
+        questions = [f"{a}/{d} + {b}/{d} = ?" for a, b, d in rows]
+        steps = [
+            [f"The denominators are both {d}", f"Add the numerators: {a} + {b} = {a + b}", f"Answer: {a + b}/{d}"]
+            for a, b, d in rows
+        ]
+        return questions, answers, steps
+
+    def _build_decimals(self, rng, config: Dict, count: int):
+        places = config["places"]
+        scale = 10 ** places
+        scaled = rng.integers(1, 10 * scale, size=(count, 2), endpoint=True)
+        answers = np.round(scaled.sum(axis=1) / scale, places).tolist()
+        rows = (scaled / scale).round(places).tolist()
+        questions = [f"{a:.{places}f} + {b:.{places}f} = ?" for a, b in rows]
+        steps = [
+            ["Line up the decimal points", f"Add {a:.{places}f} and {b:.{places}f}", f"Sum: {answer:.{places}f}"]
+            for (a, b), answer in zip(rows, answers)
+        ]
+        return questions, answers, steps
+
 class AdaptiveDifficultyEngine:
     def __init__(self):
         self.learning_rate_threshold = 0.1
@@ -215,25 +362,6 @@ class AdaptiveDifficultyEngine:
         recent_attempts = student_profile.get('recent_attempts', [])[-self.performance_window:]
         return sum(attempt['success'] for attempt in recent_attempts) / len(recent_attempts) if recent_attempts else 0.5
 
-class VisualAidGenerator:
-    def generate_visual(self, problem: MathProblem) -> str:
-        plt.figure(figsize=(8, 6))
-        
-        visual_methods = {
-            "Addition": self._draw_addition_visual,
-            "Multiplication": self._draw_multiplication_visual,
-            "Fractions": self._draw_fraction_visual,
-            "Geometry": self._draw_geometry_visual
-        }
-        
-        if problem.topic in visual_methods:
-            visual_methods[problem.topic](problem)
-        
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png')
-        buffer.seek(0)
-        return base64.b64encode(buffer.read()).decode()
-
 class InteractiveProblemTemplates:
     def __init__(self):
         self.templates = {
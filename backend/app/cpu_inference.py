@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+QUANTIZATION_MODES = ("none", "int8", "int4")
+
+# Fixed prompts for comparing quantized output against full precision
+REPORT_PROMPTS = [
+    "Explain how to add 27 and 15 to a second grader.",
+    "Give a hint for the problem 48 - 19 = ? without telling the answer.",
+    "A student wrote 6 x 7 = 48. What mistake did they make?",
+    "Explain what the fraction 3/4 means using a pizza.",
+    "How many centimeters are in 2 meters? Show the steps.",
+    "Why is 0.5 the same as 1/2?"
+]
+
+
+@dataclass
+class CPUInferenceConfig:
+    quantization: str = "int8"
+    intra_op_threads: Optional[int] = None
+    inter_op_threads: Optional[int] = None
+    cache_dir: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "CPUInferenceConfig":
+        intra = os.getenv("TORCH_INTRA_OP_THREADS")
+        inter = os.getenv("TORCH_INTER_OP_THREADS")
+        quantization = os.getenv("CPU_QUANTIZATION", "int8").lower()
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported CPU_QUANTIZATION: {quantization}")
+        return cls(
+            quantization=quantization,
+            intra_op_threads=int(intra) if intra else None,
+            inter_op_threads=int(inter) if inter else None,
+            cache_dir=os.getenv("QUANTIZED_MODEL_DIR")
+        )
+
+
+def configure_threads(config: CPUInferenceConfig):
+    """Apply intra/inter-op thread counts; must run before the first inference"""
+    if config.intra_op_threads:
+        torch.set_num_threads(config.intra_op_threads)
+    if config.inter_op_threads:
+        try:
+            torch.set_num_interop_threads(config.inter_op_threads)
+        except RuntimeError as e:
+            # Only settable once per process, before any parallel work has started
+            print(f"Could not set inter-op threads: {e}")
+
+
+def quantize_for_cpu(model: nn.Module, mode: str) -> nn.Module:
+    """Quantize Linear layers for CPU inference"""
+    if mode == "none":
+        return model
+    if mode == "int4":
+        try:
+            from torchao.quantization import int4_weight_only, quantize_
+            quantize_(model, int4_weight_only())
+            return model
+        except Exception as e:
+            print(f"int4 weight-only quantization unavailable ({e}), using int8")
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _cache_path(config: CPUInferenceConfig, model_path: str) -> Optional[str]:
+    if not config.cache_dir:
+        return None
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_path.strip("/"))
+    return os.path.join(config.cache_dir, f"{name}.{config.quantization}.pt")
+
+
+def load_cpu_model(model_path: str, config: CPUInferenceConfig) -> nn.Module:
+    """Load a causal LM for CPU inference, reusing a persisted quantized copy if present"""
+    cache_path = _cache_path(config, model_path)
+    if cache_path and config.quantization != "none" and os.path.exists(cache_path):
+        # Written by this module, so unpickling the full module is safe
+        model = torch.load(cache_path, map_location="cpu", weights_only=False)
+        model.eval()
+        return model
+
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32)
+    model.eval()
+    model = quantize_for_cpu(model, config.quantization)
+
+    if cache_path and config.quantization != "none":
+        os.makedirs(config.cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, cache_path)
+    return model
+
+
+def _generate_greedy(model: nn.Module, tokenizer, prompt: str, max_new_tokens: int) -> Dict:
+    inputs = tokenizer(prompt, return_tensors="pt")
+    started = time.perf_counter()
+    with torch.no_grad():
+        output = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id
+        )
+    elapsed = time.perf_counter() - started
+    new_tokens = output[0, inputs["input_ids"].shape[1]:].tolist()
+    return {"tokens": new_tokens, "latency": elapsed}
+
+
+def _token_agreement(reference: List[int], candidate: List[int]) -> float:
+    """Fraction of reference tokens reproduced before the first divergence"""
+    if not reference:
+        return 1.0
+    matched = 0
+    for expected, actual in zip(reference, candidate):
+        if expected != actual:
+            break
+        matched += 1
+    return matched / len(reference)
+
+
+def quantization_report(
+    model_path: str,
+    modes: List[str] = ("int8", "int4"),
+    prompts: List[str] = REPORT_PROMPTS,
+    max_new_tokens: int = 64
+) -> Dict:
+    """Compare latency and greedy output of quantized models against fp32"""
+    tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+    runs = {}
+    for mode in ("none", *modes):
+        model = load_cpu_model(model_path, CPUInferenceConfig(quantization=mode))
+        runs[mode] = [_generate_greedy(model, tokenizer, prompt, max_new_tokens) for prompt in prompts]
+        del model
+
+    baseline = runs["none"]
+    report = {"model": model_path, "prompts": len(prompts), "modes": {}}
+    for mode, results in runs.items():
+        latency = sum(result["latency"] for result in results)
+        tokens = sum(len(result["tokens"]) for result in results)
+        agreement = [
+            _token_agreement(reference["tokens"], result["tokens"])
+            for reference, result in zip(baseline, results)
+        ]
+        report["modes"]["fp32" if mode == "none" else mode] = {
+            "total_latency": latency,
+            "tokens_per_second": tokens / latency if latency else 0.0,
+            "speedup_vs_fp32": sum(r["latency"] for r in baseline) / latency if latency else 0.0,
+            "exact_match_rate": sum(score == 1.0 for score in agreement) / len(agreement),
+            "mean_prefix_agreement": sum(agreement) / len(agreement)
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy vs latency report for CPU quantization")
+    parser.add_argument("model_path")
+    parser.add_argument("--modes", nargs="+", default=["int8", "int4"], choices=QUANTIZATION_MODES[1:])
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    configure_threads(CPUInferenceConfig.from_env())
+    print(json.dumps(quantization_report(args.model_path, args.modes, max_new_tokens=args.max_new_tokens), indent=2))
@@ -0,0 +1,86 @@
+"""What the app can teach: topics per grade and the generator settings per level.
+
+AdvancedContentGenerator builds problems from these settings, so these are
+the only topics students can practise and get progress in. Learning-path
+planning is restricted to them (see app.knowledge_graph).
+"""
+from typing import Dict, List
+
+CURRICULUM: Dict[str, Dict[str, Dict[str, Dict]]] = {
+    "Grade 1": {
+        "Addition": {
+            "easy": {"range": (1, 10), "terms": 2},
+            "medium": {"range": (1, 20), "terms": 2},
+            "hard": {"range": (1, 50), "terms": 3}
+        },
+        "Subtraction": {
+            "easy": {"range": (1, 10), "min_result": 0},
+            "medium": {"range": (1, 20), "min_result": 0},
+            "hard": {"range": (1, 50), "min_result": 0}
+        }
+    },
+    "Grade 2": {
+        "Addition": {
+            "easy": {"range": (10, 50), "terms": 2},
+            "medium": {"range": (10, 100), "terms": 2},
+            "hard": {"range": (10, 100), "terms": 3}
+        },
+        "Subtraction": {
+            "easy": {"range": (10, 50), "min_result": 0},
+            "medium": {"range": (10, 100), "min_result": 0},
+            "hard": {"range": (10, 100), "min_result": 0}
+        },
+        "Multiplication": {
+            "easy": {"range": (1, 5)},
+            "medium": {"range": (1, 10)},
+            "hard": {"range": (1, 12)}
+        }
+    },
+    "Grade 3": {
+        "Multiplication": {
+            "easy": {"range": (2, 9)},
+            "medium": {"range": (2, 12)},
+            "hard": {"range": (2, 15)}
+        },
+        "Division": {
+            "easy": {"range": (1, 20), "divisors": (2, 5)},
+            "medium": {"range": (1, 50), "divisors": (2, 9)},
+            "hard": {"range": (1, 100), "divisors": (2, 12)}
+        }
+    },
+    "Grade 4": {
+        "Fractions": {
+            "easy": {"denominators": [2, 3, 4]},
+            "medium": {"denominators": [2, 3, 4, 5, 6]},
+            "hard": {"denominators": [2, 3, 4, 5, 6, 8, 10]}
+        },
+        "Decimals": {
+            "easy": {"places": 1},
+            "medium": {"places": 2},
+            "hard": {"places": 3}
+        },
+        "Geometry": {
+            "easy": {"shapes": ["square", "rectangle", "triangle"]},
+            "medium": {"shapes": ["circle", "parallelogram", "rhombus"]},
+            "hard": {"shapes": ["trapezoid", "pentagon", "hexagon"]}
+        },
+        "Measurement": {
+            "easy": {"units": ["cm", "m"], "conversions": False},
+            "medium": {"units": ["mm", "cm", "m"], "conversions": True},
+            "hard": {"units": ["mm", "cm", "m", "km"], "conversions": True}
+        }
+    }
+}
+
+
+def grade_topics(curriculum: Dict = CURRICULUM) -> Dict[str, List[str]]:
+    """Topics taught in each grade, in curriculum order"""
+    return {grade: list(topics) for grade, topics in curriculum.items()}
+
+
+def practisable_topics(curriculum: Dict = CURRICULUM) -> List[str]:
+    """Every topic with problems in some grade, in first-taught order"""
+    topics: List[str] = []
+    for taught in curriculum.values():
+        topics.extend(topic for topic in taught if topic not in topics)
+    return topics
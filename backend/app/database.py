@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 import os
 from dotenv import load_dotenv
 
@@ -11,19 +12,69 @@ load_dotenv()
 # Get database URL from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Create SQLAlchemy engine
+def _split_pool(connections: int) -> dict:
+    # A third of the connections are overflow, opened only under load
+    pool_size = max(connections * 2 // 3, 1)
+    return {"pool_size": pool_size, "max_overflow": connections - pool_size}
+
+def connection_shares() -> tuple:
+    """
+    (sync, async) connections per web worker. The database's connection
+    budget (DB_MAX_CONNECTIONS) is split across the web workers
+    (WEB_CONCURRENCY), and each worker's share covers both engines:
+    DB_SYNC_CONNECTIONS go to the sync engine, used only by background jobs
+    (problem pool refills, partition maintenance, create_all), and the rest
+    to the async engine that serves requests. Leave headroom in the budget
+    for CLI jobs such as the nightly learning-path refresh.
+    """
+    workers = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+    per_worker = max(int(os.getenv("DB_MAX_CONNECTIONS", "60")) // workers, 2)
+    sync_connections = min(max(int(os.getenv("DB_SYNC_CONNECTIONS", "3")), 1), per_worker - 1)
+    return sync_connections, per_worker - sync_connections
+
+def sync_pool_settings() -> dict:
+    return _split_pool(connection_shares()[0])
+
+def async_pool_settings() -> dict:
+    return _split_pool(connection_shares()[1])
+
+# Create SQLAlchemy engine (a local SQLite stand-in takes no pool sizing)
 engine = create_engine(
     DATABASE_URL,
-    pool_size=5,  # Maximum number of database connections in the pool
-    max_overflow=10,  # Maximum number of connections that can be created beyond pool_size
-    pool_timeout=30,  # Timeout for getting a connection from the pool
-    pool_recycle=1800,  # Recycle connections after 30 minutes
+    **({} if DATABASE_URL.startswith("sqlite") else {
+        **sync_pool_settings(),
+        "pool_timeout": 30,  # Timeout for getting a connection from the pool
+        "pool_recycle": 1800  # Recycle connections after 30 minutes
+    }),
     echo=False  # Set to True to see SQL queries in console
 )
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def to_async_url(url: str) -> str:
+    """Map a sync database URL onto its async driver (asyncpg / aiosqlite)"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **({} if ASYNC_DATABASE_URL.startswith("sqlite") else {
+        **async_pool_settings(),
+        "pool_timeout": 30,
+        "pool_recycle": 1800
+    }),
+    echo=False
+)
+
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -41,6 +92,17 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """
+    Async dependency to get database session.
+    Usage in FastAPI:
+    @app.get("/users/")
+    async def get_users(db: AsyncSession = Depends(get_async_db)):
+        ...
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 @contextmanager
 def db_session():
     """
@@ -59,6 +121,24 @@ def db_session():
     finally:
         session.close()
 
+@asynccontextmanager
+async def async_db_session():
+    """
+    Async context manager for database sessions.
+    Usage:
+    async with async_db_session() as db:
+        await db.execute(select(User))
+    """
+    session = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        raise e
+    finally:
+        await session.close()
+
 class DatabaseManager:
     """Database management utilities"""
     
@@ -84,6 +164,16 @@ class DatabaseManager:
         except Exception as e:
             return {"status": "error", "message": f"Database connection failed: {str(e)}"}
 
+    @staticmethod
+    async def async_check_connection():
+        """Check database connection without blocking the event loop"""
+        try:
+            async with async_db_session() as db:
+                await db.execute(text("SELECT 1"))
+            return {"status": "connected", "message": "Database connection successful"}
+        except Exception as e:
+            return {"status": "error", "message": f"Database connection failed: {str(e)}"}
+
     @staticmethod
     async def get_connection_pool_status():
         """Get database connection pool status"""
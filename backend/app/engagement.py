@@ -0,0 +1,577 @@
+"""Engagement scoring from session telemetry.
+
+Clients post small batches of events (answers, hints, clicks, focus changes).
+Each (user, session) keeps a sliding window of recent events with running
+counts and inter-event gap sums, updated in O(1) per event. Every few seconds
+the sessions that received events are scored together: their window
+features form one matrix and a small logistic model turns it into
+engagement and cognitive-load scores with a single multiply. The scores are
+written to `student_profiles`, so each profile is updated at most once per
+`update_interval` no matter how many events arrive.
+
+Windows live in a session store. The default keeps them in the process,
+which is only correct with one web worker; with several, set
+ENGAGEMENT_STORE_URL to a Redis URL so every worker sees the same sessions
+and each session is claimed for writing by one worker at a time.
+
+The model defaults to hand-set coefficients; ENGAGEMENT_COEFFICIENTS_PATH may point
+to a JSON file with fitted ones in the same layout as DEFAULT_MODEL.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, update
+
+from .models import StudentProfile
+
+try:
+    import redis.asyncio as async_redis
+except ImportError:
+    async_redis = None
+
+EVENT_TYPES = ("answer_correct", "answer_wrong", "hint", "interaction", "focus_lost")
+EVENT_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+
+FEATURES = (
+    "events_per_minute",
+    "mean_gap",
+    "gap_variation",
+    "idle_seconds",
+    "long_gap_share",
+    "error_rate",
+    "hint_rate",
+    "focus_lost_per_minute"
+)
+
+# Gaps longer than this count as the student stepping away
+LONG_GAP_SECONDS = 30.0
+
+SessionKey = Tuple[int, str]
+
+# Features are standardised with mean/scale, then each output is
+# sigmoid(weights . x + bias)
+DEFAULT_MODEL = {
+    "mean": [6.0, 10.0, 1.0, 10.0, 0.1, 0.3, 0.3, 0.2],
+    "scale": [4.0, 10.0, 0.5, 30.0, 0.2, 0.25, 0.4, 0.5],
+    "engagement": {"weights": [1.0, -0.5, -0.2, -1.5, -1.0, -0.3, -0.2, -0.8], "bias": 0.5},
+    "cognitive_load": {"weights": [0.0, 0.6, 0.4, 0.2, 0.3, 1.2, 1.0, 0.2], "bias": 0.0}
+}
+
+
+class SessionWindow:
+    """Events of one session within the last `window_seconds`, with running aggregates"""
+    __slots__ = (
+        "user_id", "events", "counts", "started", "last_seen", "gap_sum",
+        "gap_squares", "long_gaps", "dirty", "last_written"
+    )
+
+    def __init__(self, user_id: int, started: float):
+        self.user_id = user_id
+        self.events: Deque[Tuple[float, int]] = deque()
+        self.counts = [0] * len(EVENT_TYPES)
+        self.started = started
+        self.last_seen = started
+        self.gap_sum = 0.0
+        self.gap_squares = 0.0
+        self.long_gaps = 0
+        self.dirty = False
+        self.last_written = 0.0
+
+    def add(self, timestamp: float, code: int):
+        if self.events:
+            # Late events are placed at the end so gaps stay non-negative
+            timestamp = max(timestamp, self.events[-1][0])
+            self._count_gap(timestamp - self.events[-1][0], 1)
+        self.events.append((timestamp, code))
+        self.counts[code] += 1
+        self.last_seen = timestamp
+        self.dirty = True
+
+    def evict(self, now: float, window_seconds: float):
+        cutoff = now - window_seconds
+        while self.events and self.events[0][0] < cutoff:
+            timestamp, code = self.events.popleft()
+            self.counts[code] -= 1
+            if self.events:
+                self._count_gap(self.events[0][0] - timestamp, -1)
+
+    def _count_gap(self, gap: float, sign: int):
+        self.gap_sum += sign * gap
+        self.gap_squares += sign * gap * gap
+        self.long_gaps += sign * (gap > LONG_GAP_SECONDS)
+
+    def features(self, now: float, window_seconds: float) -> List[float]:
+        """Values of FEATURES for the current window"""
+        minutes = max(min(window_seconds, now - self.started), 1.0) / 60.0
+        n = len(self.events)
+        gaps = max(n - 1, 1)
+        mean_gap = self.gap_sum / gaps if n > 1 else 0.0
+        variance = max(self.gap_squares / gaps - mean_gap * mean_gap, 0.0) if n > 1 else 0.0
+        answers = self.counts[EVENT_CODES["answer_correct"]] + self.counts[EVENT_CODES["answer_wrong"]]
+        hints = self.counts[EVENT_CODES["hint"]]
+        return [
+            n / minutes,
+            mean_gap,
+            variance ** 0.5 / mean_gap if mean_gap > 0 else 0.0,
+            now - self.events[-1][0] if self.events else now - self.started,
+            self.long_gaps / gaps if n > 1 else 0.0,
+            self.counts[EVENT_CODES["answer_wrong"]] / answers if answers else 0.0,
+            hints / answers if answers else float(hints),
+            self.counts[EVENT_CODES["focus_lost"]] / minutes
+        ]
+
+
+class EngagementModel:
+    """Logistic scores of engagement and cognitive load from window features"""
+
+    def __init__(self, spec: Optional[Dict] = None):
+        spec = spec or DEFAULT_MODEL
+        self.mean = np.array(spec["mean"])
+        self.scale = np.array(spec["scale"])
+        # (features, 2): one column per output
+        self.weights = np.array([spec["engagement"]["weights"], spec["cognitive_load"]["weights"]]).T
+        self.bias = np.array([spec["engagement"]["bias"], spec["cognitive_load"]["bias"]])
+
+    @classmethod
+    def from_env(cls) -> "EngagementModel":
+        path = os.getenv("ENGAGEMENT_COEFFICIENTS_PATH")
+        if path:
+            try:
+                with open(path) as f:
+                    return cls(json.load(f))
+            except Exception as e:
+                print(f"Error loading engagement model {path}, using defaults: {e}")
+        return cls()
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """(n, 2) array of [engagement, cognitive_load] in 0..1"""
+        logits = ((features - self.mean) / self.scale) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+def emotional_state(features: List[float], engagement: float, cognitive_load: float) -> str:
+    values = dict(zip(FEATURES, features))
+    if values["idle_seconds"] > 2 * LONG_GAP_SECONDS or engagement < 0.3:
+        return "disengaged"
+    if cognitive_load > 0.7 and values["error_rate"] > 0.5:
+        return "frustrated"
+    return "engaged" if engagement >= 0.6 else "neutral"
+
+
+def describe(features: List[float], scores: np.ndarray) -> Dict:
+    engagement, cognitive_load = float(scores[0]), float(scores[1])
+    values = dict(zip(FEATURES, features))
+    return {
+        "attention_level": engagement,
+        "interaction_rate": values["events_per_minute"],
+        "emotional_state": emotional_state(features, engagement, cognitive_load),
+        "cognitive_load": cognitive_load,
+        "features": values
+    }
+
+
+def parse_event(event: Dict, now: float, max_skew: Optional[float] = 60.0) -> Optional[Tuple[float, int]]:
+    """(timestamp, code) of a {"type", "timestamp"} event; None for unknown types"""
+    code = EVENT_CODES.get(event.get("type"))
+    if code is None:
+        return None
+    timestamp = event.get("timestamp")
+    # Live client clocks are trusted only within `max_skew` seconds of ours
+    if not isinstance(timestamp, (int, float)) or (max_skew is not None and abs(timestamp - now) > max_skew):
+        timestamp = now
+    return float(timestamp), code
+
+
+def score_events(events: Iterable[Dict], model: EngagementModel, window_seconds: float = 120.0) -> Dict:
+    """Score a recorded batch of events on its own, as of its last event"""
+    parsed = sorted(filter(None, (parse_event(event, time.time(), max_skew=None) for event in events)))
+    now = parsed[-1][0] if parsed else time.time()
+    window = SessionWindow(user_id=0, started=parsed[0][0] if parsed else now)
+    for timestamp, code in parsed:
+        window.add(timestamp, code)
+    window.evict(now, window_seconds)
+    features = window.features(now, window_seconds)
+    return describe(features, model.score(np.array([features]))[0])
+
+
+class MemorySessionStore:
+    """Session windows in this process; only correct with a single web worker"""
+
+    def __init__(self, max_sessions_per_user: int = 5):
+        self.max_sessions_per_user = max_sessions_per_user
+        self.sessions: Dict[SessionKey, SessionWindow] = {}
+        # Each user's session ids, least recently used first
+        self.user_sessions: Dict[int, "OrderedDict[str, None]"] = {}
+        self._lock = threading.Lock()
+
+    async def append(self, user_id: int, session_id: str, events: List[Tuple[float, int]], now: float) -> int:
+        """Add events to the session's window; returns how many older sessions were dropped"""
+        dropped = 0
+        with self._lock:
+            key = (user_id, session_id)
+            window = self.sessions.get(key)
+            if window is None:
+                window = SessionWindow(user_id, events[0][0] if events else now)
+                self.sessions[key] = window
+            for timestamp, code in events:
+                window.add(timestamp, code)
+            recent = self.user_sessions.setdefault(user_id, OrderedDict())
+            recent[session_id] = None
+            recent.move_to_end(session_id)
+            while len(recent) > self.max_sessions_per_user:
+                oldest, _ = recent.popitem(last=False)
+                del self.sessions[(user_id, oldest)]
+                dropped += 1
+        return dropped
+
+    async def windows(self, keys: List[SessionKey]) -> Dict[SessionKey, SessionWindow]:
+        with self._lock:
+            return {key: self.sessions[key] for key in keys if key in self.sessions}
+
+    async def claim_due(self, now: float, interval: float, force: bool = False) -> List[SessionKey]:
+        """Sessions with events not yet written whose last write is at least `interval` old"""
+        with self._lock:
+            return [
+                key for key, window in self.sessions.items()
+                if window.dirty and (force or now - window.last_written >= interval)
+            ]
+
+    async def mark_written(self, keys: List[SessionKey], now: float):
+        with self._lock:
+            for key in keys:
+                window = self.sessions.get(key)
+                if window is not None:
+                    window.dirty = False
+                    window.last_written = now
+
+    async def release(self, keys: List[SessionKey]):
+        # Unwritten windows stay dirty, so the next pass retries them
+        pass
+
+    async def expire(self, now: float, timeout: float) -> int:
+        with self._lock:
+            expired = [
+                key for key, window in self.sessions.items()
+                if not window.dirty and now - window.last_seen > timeout
+            ]
+            for user_id, session_id in expired:
+                del self.sessions[(user_id, session_id)]
+                recent = self.user_sessions.get(user_id)
+                if recent is not None:
+                    recent.pop(session_id, None)
+                    if not recent:
+                        del self.user_sessions[user_id]
+        return len(expired)
+
+    def get_stats(self) -> Dict:
+        return {"store": "memory", "active_sessions": len(self.sessions)}
+
+
+class RedisSessionStore:
+    """Session windows in Redis, shared by every web worker.
+
+    Per session: a list of "timestamp:code" events (trimmed to `max_events`)
+    and a hash with its start and last write time, both expiring
+    `session_timeout` after the last event. Each user has a sorted set of
+    session ids by last event, and one sorted set holds sessions waiting to
+    be written, scored by the earliest time they may be. A worker claims a
+    due session by removing it from that set, so only one writes it.
+    """
+
+    def __init__(
+        self,
+        client,
+        session_timeout: float = 1800.0,
+        max_sessions_per_user: int = 5,
+        max_events: int = 1000,
+        prefix: str = "engagement:"
+    ):
+        self.client = client
+        self.session_timeout = session_timeout
+        self.max_sessions_per_user = max_sessions_per_user
+        self.max_events = max_events
+        self.prefix = prefix
+        self.due_key = prefix + "due"
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSessionStore":
+        if url.startswith("fakeredis://"):
+            import fakeredis
+            return cls(fakeredis.FakeAsyncRedis(), **kwargs)
+        if async_redis is None:
+            raise RuntimeError("ENGAGEMENT_STORE_URL is set but the redis package is not installed")
+        return cls(async_redis.from_url(url), **kwargs)
+
+    def _session(self, user_id: int, session_id: str) -> str:
+        return f"{user_id}:{session_id}"
+
+    @staticmethod
+    def _key(member) -> SessionKey:
+        user_id, session_id = (member.decode() if isinstance(member, bytes) else member).split(":", 1)
+        return int(user_id), session_id
+
+    def _keys(self, session: str, user_id: int) -> Tuple[str, str, str]:
+        return (
+            f"{self.prefix}events:{session}",
+            f"{self.prefix}session:{session}",
+            f"{self.prefix}user:{user_id}"
+        )
+
+    async def append(self, user_id: int, session_id: str, events: List[Tuple[float, int]], now: float) -> int:
+        session = self._session(user_id, session_id)
+        events_key, meta_key, user_key = self._keys(session, user_id)
+        ttl = int(self.session_timeout) + 1
+        async with self.client.pipeline(transaction=True) as pipe:
+            if events:
+                pipe.rpush(events_key, *[f"{timestamp!r}:{code}" for timestamp, code in events])
+                pipe.ltrim(events_key, -self.max_events, -1)
+            pipe.hsetnx(meta_key, "started", repr(events[0][0] if events else now))
+            pipe.expire(events_key, ttl)
+            pipe.expire(meta_key, ttl)
+            pipe.zadd(user_key, {session_id: now})
+            pipe.zremrangebyscore(user_key, "-inf", now - self.session_timeout)
+            pipe.expire(user_key, ttl)
+            pipe.hget(meta_key, "last_written")
+            results = await pipe.execute()
+        last_written = float(results[-1] or 0.0)
+
+        dropped = 0
+        excess = await self.client.zcard(user_key) - self.max_sessions_per_user
+        if excess > 0:
+            # Least recently used sessions beyond the cap
+            for member, _ in await self.client.zpopmin(user_key, excess):
+                old = self._session(user_id, member.decode() if isinstance(member, bytes) else member)
+                await self.client.delete(*self._keys(old, user_id)[:2])
+                await self.client.zrem(self.due_key, old)
+                dropped += 1
+        if events:
+            # Already-due sessions keep their place; others wait out the interval
+            await self.client.zadd(self.due_key, {session: last_written}, nx=True)
+        return dropped
+
+    async def windows(self, keys: List[SessionKey]) -> Dict[SessionKey, SessionWindow]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id, session_id in keys:
+                events_key, meta_key, _ = self._keys(self._session(user_id, session_id), user_id)
+                pipe.lrange(events_key, 0, -1)
+                pipe.hget(meta_key, "started")
+            results = await pipe.execute()
+        windows = {}
+        for i, key in enumerate(keys):
+            raw, started = results[2 * i], results[2 * i + 1]
+            if started is None:
+                continue
+            events = sorted(
+                (float(timestamp), int(code))
+                for timestamp, code in (item.decode().split(":") for item in raw)
+            )
+            window = SessionWindow(key[0], float(started))
+            for timestamp, code in events:
+                window.add(timestamp, code)
+            windows[key] = window
+        return windows
+
+    async def claim_due(self, now: float, interval: float, force: bool = False) -> List[SessionKey]:
+        # Scores hold the last write time, so due means score <= now - interval
+        members = await self.client.zrangebyscore(self.due_key, "-inf", "+inf" if force else now - interval)
+        if not members:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for member in members:
+                pipe.zrem(self.due_key, member)
+            removed = await pipe.execute()
+        return [self._key(member) for member, won in zip(members, removed) if won]
+
+    async def mark_written(self, keys: List[SessionKey], now: float):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id, session_id in keys:
+                pipe.hset(self._keys(self._session(user_id, session_id), user_id)[1], "last_written", repr(now))
+            await pipe.execute()
+
+    async def release(self, keys: List[SessionKey]):
+        if keys:
+            await self.client.zadd(self.due_key, {self._session(*key): 0.0 for key in keys}, nx=True)
+
+    async def expire(self, now: float, timeout: float) -> int:
+        # Session keys expire in Redis on their own
+        return 0
+
+    def get_stats(self) -> Dict:
+        return {"store": "redis"}
+
+
+def make_session_store(
+    url: Optional[str] = None,
+    session_timeout: float = 1800.0,
+    max_sessions_per_user: int = 5
+):
+    """Redis when ENGAGEMENT_STORE_URL is set, else in-process (single worker only)"""
+    url = url if url is not None else os.getenv("ENGAGEMENT_STORE_URL")
+    if url:
+        return RedisSessionStore.from_url(
+            url, session_timeout=session_timeout, max_sessions_per_user=max_sessions_per_user
+        )
+    return MemorySessionStore(max_sessions_per_user)
+
+
+class EngagementTracker:
+    """Sliding-window engagement per session, written to profiles on a timer"""
+
+    def __init__(
+        self,
+        session_factory,
+        model: Optional[EngagementModel] = None,
+        window_seconds: float = 120.0,
+        update_interval: float = 5.0,
+        session_timeout: float = 1800.0,
+        store=None,
+        on_profiles_updated: Optional[Callable[[List[int]], Awaitable[None]]] = None
+    ):
+        self.session_factory = session_factory
+        self.model = model or EngagementModel.from_env()
+        self.window_seconds = window_seconds
+        self.update_interval = update_interval
+        self.session_timeout = session_timeout
+        self.store = store if store is not None else MemorySessionStore()
+        # Told which users' profiles changed, e.g. to invalidate caches
+        self.on_profiles_updated = on_profiles_updated
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {
+            "events_received": 0,
+            "events_rejected": 0,
+            "scoring_passes": 0,
+            "sessions_scored": 0,
+            "profiles_written": 0,
+            "sessions_expired": 0,
+            "sessions_dropped": 0,
+            "failed_writes": 0,
+            "total_score_time": 0.0
+        }
+
+    async def ingest(self, user_id: int, session_id: str, events: List[Dict]) -> int:
+        """Add events to the session's window; returns how many were accepted"""
+        now = time.time()
+        parsed = [parse_event(event, now) for event in events]
+        accepted = sorted(event for event in parsed if event is not None)
+        # Beyond the per-user cap the least recently used sessions are dropped
+        self.stats["sessions_dropped"] += await self.store.append(user_id, session_id, accepted, now)
+        self.stats["events_received"] += len(accepted)
+        self.stats["events_rejected"] += len(parsed) - len(accepted)
+        return len(accepted)
+
+    def score(self, windows: Dict[SessionKey, SessionWindow], now: float) -> Dict[SessionKey, Dict]:
+        """Current metrics of the given sessions, scored as one batch"""
+        if not windows:
+            return {}
+        started = time.perf_counter()
+        features = []
+        for window in windows.values():
+            window.evict(now, self.window_seconds)
+            features.append(window.features(now, self.window_seconds))
+        scores = self.model.score(np.array(features))
+        self.stats["sessions_scored"] += len(windows)
+        self.stats["total_score_time"] += time.perf_counter() - started
+        return {key: describe(row, score) for key, row, score in zip(windows, features, scores)}
+
+    async def snapshot(self, user_id: int, session_id: str) -> Optional[Dict]:
+        key = (user_id, session_id)
+        return self.score(await self.store.windows([key]), time.time()).get(key)
+
+    async def flush(self, force: bool = False) -> int:
+        """Score sessions with new events and write their profiles; returns profiles written"""
+        now = time.time()
+        self.stats["sessions_expired"] += await self.store.expire(now, self.session_timeout)
+        self.stats["scoring_passes"] += 1
+        due = await self.store.claim_due(now, self.update_interval, force)
+        if not due:
+            return 0
+
+        windows = await self.store.windows(due)
+        metrics = self.score(windows, now)
+        # A student with several open sessions gets the most recent one's scores
+        latest: Dict[int, Tuple[float, Dict]] = {}
+        for (user_id, session_id), values in metrics.items():
+            seen = windows[(user_id, session_id)].last_seen
+            if user_id not in latest or seen >= latest[user_id][0]:
+                latest[user_id] = (seen, values)
+        params = [
+            {
+                "profile_user_id": user_id,
+                "new_engagement": values["attention_level"],
+                "new_cognitive_load": values["cognitive_load"],
+                "updated_at": datetime.utcnow()
+            }
+            for user_id, (_, values) in latest.items()
+        ]
+        if not params:
+            return 0
+        try:
+            async with self.session_factory() as db:
+                async with db.begin():
+                    await db.execute(self._profile_update(), params)
+        except Exception as e:
+            self.stats["failed_writes"] += 1
+            print(f"Error writing engagement scores: {e}")
+            await self.store.release(due)
+            return 0
+
+        await self.store.mark_written(due, now)
+        self.stats["profiles_written"] += len(params)
+        if self.on_profiles_updated is not None:
+            await self.on_profiles_updated(list(latest))
+        return len(params)
+
+    @staticmethod
+    def _profile_update():
+        profiles = StudentProfile.__table__
+        return (
+            update(profiles)
+            .where(profiles.c.user_id == bindparam("profile_user_id"))
+            .values(
+                engagement_score=bindparam("new_engagement"),
+                cognitive_load=bindparam("new_cognitive_load"),
+                engagement_updated_at=bindparam("updated_at")
+            )
+        )
+
+    async def _run(self):
+        while not self._stopping:
+            await asyncio.sleep(self.update_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error in engagement scoring pass: {e}")
+
+    def start(self):
+        """Start the periodic scorer on the running event loop"""
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the scorer and write whatever is still pending"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Pending sessions are written regardless of when they last were
+        await self.flush(force=True)
+
+    def get_stats(self) -> Dict:
+        passes = self.stats["scoring_passes"]
+        return {
+            **self.stats,
+            **self.store.get_stats(),
+            "average_score_time": self.stats["total_score_time"] / passes if passes else 0.0
+        }
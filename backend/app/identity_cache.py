@@ -0,0 +1,477 @@
+import asyncio
+import enum
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from .models import Progress, StudentProfile, User
+
+try:
+    import redis
+    import redis.asyncio as async_redis
+except ImportError:
+    redis = None
+    async_redis = None
+
+# Cached marker for lookups that found no row, so unknown usernames don't
+# reach the database on every request either
+MISSING = "__missing__"
+
+# Never written to the cache; login reads password hashes from the database
+SECRET_COLUMNS = {"hashed_password"}
+
+
+def row_to_dict(row, exclude: Iterable[str] = ()) -> Dict:
+    """Column values of an ORM row in JSON-safe form"""
+    values = {}
+    for column in inspect(row).mapper.column_attrs:
+        if column.key in exclude:
+            continue
+        value = getattr(row, column.key)
+        if isinstance(value, enum.Enum):
+            value = value.value
+        elif isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        values[column.key] = value
+    return values
+
+
+class LocalCacheBackend:
+    """In-process LRU with per-entry TTL"""
+
+    # Deletes are in-memory, so commit hooks run them inline
+    blocking_deletes = False
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    async def delete_async(self, keys: Iterable[str]):
+        self.delete(keys)
+
+    async def version(self, key: str) -> Optional[str]:
+        # Only one process fills this cache; IdentityCache tracks its own races
+        return None
+
+    async def set_if_version(self, key: str, value: str, ttl: float, version: Optional[str]) -> bool:
+        await self.set(key, value, ttl)
+        return True
+
+    async def acquire_fill_lock(self, key: str, ttl: float) -> bool:
+        # Fills are already single-flight within the process
+        return True
+
+    async def release_fill_lock(self, key: str):
+        pass
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Redis-protocol backend shared by every worker process.
+
+    Everything on the event loop uses the asyncio client. The blocking client
+    is only for commit hooks on threads without a running loop. Invalidation
+    also replaces a per-key version token, and fills write only if the token
+    is unchanged since they started (WATCH/MULTI), so a fill in one process
+    cannot cache a value read before another process's commit.
+    """
+
+    blocking_deletes = True
+
+    def __init__(self, async_client, sync_client, prefix: str = "identity:", version_ttl: float = 300.0):
+        self.client = async_client
+        self.sync_client = sync_client
+        self.prefix = prefix
+        # Outlives any fill that could have started before the invalidation
+        self.version_ttl = version_ttl
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        if url.startswith("fakeredis://"):
+            # In-memory Redis for tests and local development
+            import fakeredis
+            server = fakeredis.FakeServer()
+            return cls(fakeredis.FakeAsyncRedis(server=server), fakeredis.FakeRedis(server=server))
+        if redis is None:
+            raise RuntimeError("IDENTITY_CACHE_URL is set but the redis package is not installed")
+        return cls(async_redis.from_url(url), redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def _version_key(self, key: str) -> str:
+        return f"{self.prefix}version:{key}"
+
+    def _queue_delete(self, pipe, keys: List[str]):
+        token = uuid.uuid4().hex
+        for key in keys:
+            pipe.set(self._version_key(key), token, px=int(self.version_ttl * 1000))
+        pipe.delete(*[self.prefix + key for key in keys])
+
+    def delete(self, keys: Iterable[str]):
+        """Blocking; only for threads without a running event loop"""
+        keys = list(keys)
+        if keys:
+            with self.sync_client.pipeline() as pipe:
+                self._queue_delete(pipe, keys)
+                pipe.execute()
+
+    async def delete_async(self, keys: Iterable[str]):
+        keys = list(keys)
+        if keys:
+            async with self.client.pipeline() as pipe:
+                self._queue_delete(pipe, keys)
+                await pipe.execute()
+
+    async def version(self, key: str) -> Optional[str]:
+        value = await self.client.get(self._version_key(key))
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set_if_version(self, key: str, value: str, ttl: float, version: Optional[str]) -> bool:
+        async with self.client.pipeline() as pipe:
+            try:
+                await pipe.watch(self._version_key(key))
+                current = await pipe.get(self._version_key(key))
+                if (current.decode() if isinstance(current, bytes) else current) != version:
+                    return False
+                pipe.multi()
+                pipe.set(self.prefix + key, value, px=int(ttl * 1000))
+                await pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    async def acquire_fill_lock(self, key: str, ttl: float) -> bool:
+        """Only one process refills a missing key; the others wait for its value"""
+        return bool(await self.client.set(f"{self.prefix}lock:{key}", "1", nx=True, px=int(ttl * 1000)))
+
+    async def release_fill_lock(self, key: str):
+        await self.client.delete(f"{self.prefix}lock:{key}")
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def make_backend(url: Optional[str] = None):
+    """Redis when IDENTITY_CACHE_URL is set (fakeredis:// for an in-memory server), else local LRU"""
+    url = url if url is not None else os.getenv("IDENTITY_CACHE_URL")
+    if url:
+        return RedisCacheBackend.from_url(url)
+    return LocalCacheBackend(int(os.getenv("IDENTITY_CACHE_SIZE", "10000")))
+
+
+class IdentityCache:
+    """Read-through cache for user, profile and progress lookups.
+
+    Values are JSON snapshots of the rows. Commits that change User,
+    StudentProfile or Progress rows delete the affected keys (see `install`);
+    bulk statements that bypass the ORM, like attempt ingestion's progress
+    upsert or engagement scoring, call `invalidate_progress` /
+    `invalidate_profiles` themselves. Concurrent misses for a key
+    share one database load in-process and, on Redis, one load cluster-wide.
+    User snapshots never include SECRET_COLUMNS.
+    """
+
+    def __init__(
+        self,
+        backend,
+        session_factory,
+        ttl_seconds: float = 300.0,
+        missing_ttl_seconds: float = 30.0,
+        lock_timeout: float = 2.0
+    ):
+        self.backend = backend
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.missing_ttl_seconds = missing_ttl_seconds
+        self.lock_timeout = lock_timeout
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Keys invalidated while this process was filling them; the fill's
+        # value may predate the commit, so it is returned but not cached.
+        # Only keys with a fill in flight are tracked, so this stays small.
+        self._stale: Set[str] = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Deferred remote deletes, drained in batches by one task at a time
+        self._pending_deletes: Set[str] = set()
+        self._drain_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "coalesced": 0,
+            "lock_waits": 0,
+            "stale_fills_skipped": 0,
+            "invalidations": 0,
+            "deferred_invalidations": 0,
+            "backend_errors": 0
+        }
+
+    @staticmethod
+    def user_key(username: str) -> str:
+        return f"user:{username}"
+
+    @staticmethod
+    def profile_key(user_id: int) -> str:
+        return f"profile:{user_id}"
+
+    @staticmethod
+    def progress_key(user_id: int) -> str:
+        return f"progress:{user_id}"
+
+    async def get_user(self, username: str) -> Optional[Dict]:
+        async def load(db):
+            user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+            return row_to_dict(user, exclude=SECRET_COLUMNS) if user is not None else None
+        return await self._read_through(self.user_key(username), load)
+
+    async def get_profile(self, user_id: int) -> Optional[Dict]:
+        async def load(db):
+            profile = (await db.execute(select(StudentProfile).where(StudentProfile.user_id == user_id))).scalar_one_or_none()
+            return row_to_dict(profile) if profile is not None else None
+        return await self._read_through(self.profile_key(user_id), load)
+
+    async def get_progress(self, user_id: int) -> List[Dict]:
+        async def load(db):
+            result = await db.execute(select(Progress).where(Progress.user_id == user_id))
+            return [progress.to_dict() for progress in result.scalars()]
+        return await self._read_through(self.progress_key(user_id), load)
+
+    async def _read_through(self, key: str, loader: Callable):
+        self._loop = asyncio.get_running_loop()
+        cached = await self._backend_get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return None if cached == MISSING else json.loads(cached)
+        self.stats["misses"] += 1
+
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key])
+        fill = asyncio.ensure_future(self._fill(key, loader))
+        self._inflight[key] = fill
+        try:
+            return await asyncio.shield(fill)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _fill(self, key: str, loader: Callable):
+        locked = await self._acquire_fill_lock(key)
+        if not locked:
+            # Another process is loading this key: wait for its value instead
+            self.stats["lock_waits"] += 1
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+                cached = await self._backend_get(key)
+                if cached is not None:
+                    return None if cached == MISSING else json.loads(cached)
+
+        with self._lock:
+            self._stale.discard(key)
+        try:
+            try:
+                version = await self.backend.version(key)
+            except Exception as e:
+                self.stats["backend_errors"] += 1
+                print(f"Error reading identity cache version: {e}")
+                version = None
+            async with self.session_factory() as db:
+                value = await loader(db)
+            self.stats["loads"] += 1
+            with self._lock:
+                stale = key in self._stale
+                self._stale.discard(key)
+            if not stale:
+                payload = MISSING if value is None else json.dumps(value)
+                ttl = self.missing_ttl_seconds if value is None else self.ttl_seconds
+                try:
+                    stale = not await self.backend.set_if_version(key, payload, ttl, version)
+                except Exception as e:
+                    self.stats["backend_errors"] += 1
+                    print(f"Error writing identity cache: {e}")
+            if stale:
+                self.stats["stale_fills_skipped"] += 1
+            return value
+        finally:
+            if locked:
+                try:
+                    await self.backend.release_fill_lock(key)
+                except Exception as e:
+                    self.stats["backend_errors"] += 1
+                    print(f"Error releasing identity cache lock: {e}")
+
+    async def _backend_get(self, key: str) -> Optional[str]:
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            # A cache outage degrades to database reads
+            self.stats["backend_errors"] += 1
+            print(f"Error reading identity cache: {e}")
+            return None
+
+    async def _acquire_fill_lock(self, key: str) -> bool:
+        try:
+            return await self.backend.acquire_fill_lock(key, self.lock_timeout)
+        except Exception as e:
+            self.stats["backend_errors"] += 1
+            print(f"Error acquiring identity cache lock: {e}")
+            return True
+
+    def _mark_invalidated(self, keys: List[str]):
+        with self._lock:
+            self._stale.update(key for key in keys if key in self._inflight)
+            self.stats["invalidations"] += len(keys)
+
+    async def invalidate_async(self, keys: Iterable[str]):
+        """Delete keys from the event loop without blocking it"""
+        keys = list(keys)
+        if not keys:
+            return
+        self._mark_invalidated(keys)
+        await self._delete_async(keys)
+
+    def invalidate(self, keys: Iterable[str]):
+        """Delete keys from synchronous code such as commit hooks.
+
+        Remote deletes never run on the event loop: on the loop's thread they
+        are scheduled as a task, from other threads they are handed to the
+        loop, and only without a running loop does the blocking client run.
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        self._mark_invalidated(keys)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if not self.backend.blocking_deletes:
+            self.backend.delete(keys)
+        elif loop is not None:
+            self._spawn_invalidation(keys)
+        elif self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._spawn_invalidation, keys)
+        else:
+            try:
+                self.backend.delete(keys)
+            except Exception as e:
+                self.stats["backend_errors"] += 1
+                print(f"Error invalidating identity cache: {e}")
+
+    def _spawn_invalidation(self, keys: List[str]):
+        # Always runs on the loop's thread
+        self.stats["deferred_invalidations"] += len(keys)
+        self._pending_deletes.update(keys)
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.ensure_future(self._drain_deletes())
+
+    async def _drain_deletes(self):
+        while self._pending_deletes:
+            keys = list(self._pending_deletes)
+            self._pending_deletes.clear()
+            await self._delete_async(keys)
+
+    async def _delete_async(self, keys: List[str]):
+        try:
+            await self.backend.delete_async(keys)
+        except Exception as e:
+            self.stats["backend_errors"] += 1
+            print(f"Error invalidating identity cache: {e}")
+
+    async def invalidate_progress(self, user_ids: Iterable[int]):
+        await self.invalidate_async(self.progress_key(user_id) for user_id in set(user_ids))
+
+    async def invalidate_profiles(self, user_ids: Iterable[int]):
+        await self.invalidate_async(self.profile_key(user_id) for user_id in set(user_ids))
+
+    @classmethod
+    def keys_for(cls, row) -> Set[str]:
+        """Cache keys a changed row affects"""
+        if isinstance(row, User):
+            keys = {cls.user_key(row.username)}
+            # A renamed user must also drop the entry under the old name
+            history = inspect(row).attrs.username.history
+            keys.update(cls.user_key(name) for name in history.deleted or () if name)
+            return keys
+        if isinstance(row, StudentProfile):
+            return {cls.profile_key(row.user_id)}
+        if isinstance(row, Progress):
+            return {cls.progress_key(row.user_id)}
+        return set()
+
+    def install(self, session_class=Session) -> Callable[[], None]:
+        """Invalidate affected keys whenever a session commits changes to cached models
+
+        Returns a function that removes the listeners again.
+        """
+        info_key = f"identity_cache_keys:{id(self)}"
+
+        def collect(session, flush_context, instances):
+            pending = session.info.setdefault(info_key, set())
+            for row in list(session.new) + list(session.dirty) + list(session.deleted):
+                pending.update(self.keys_for(row))
+
+        def commit(session):
+            self.invalidate(session.info.pop(info_key, ()))
+
+        def rollback(session):
+            session.info.pop(info_key, None)
+
+        # Collected before the flush, while renamed rows still carry their history
+        listeners = (("before_flush", collect), ("after_commit", commit), ("after_rollback", rollback))
+        for name, listener in listeners:
+            event.listen(session_class, name, listener)
+
+        def uninstall():
+            for name, listener in listeners:
+                event.remove(session_class, name, listener)
+        return uninstall
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "backend": type(self.backend).__name__,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": self.backend.size()
+        }
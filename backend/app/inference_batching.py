@@ -0,0 +1,159 @@
+import asyncio
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+from .speculative_decoding import SpeculativeDecoder
+
+
+@dataclass
+class PendingGeneration:
+    prompt: str
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class BatchInferenceScheduler:
+    """Micro-batching request queue for a single causal LM.
+
+    Concurrent callers submit prompts; the scheduler waits up to `max_wait_ms`
+    for more requests to arrive, pads them into one batch, runs `generate` on a
+    worker thread and resolves each caller's future with its own decoded text.
+    """
+
+    def __init__(
+        self,
+        model_provider: Callable[[], Optional[nn.Module]],
+        tokenizer,
+        executor: Executor,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        generation_kwargs: Optional[Dict] = None,
+        speculative: Optional[SpeculativeDecoder] = None,
+        model_type: str = "default"
+    ):
+        # Resolved per batch so the registry can load or evict the model
+        self.model_provider = model_provider
+        self.tokenizer = tokenizer
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.generation_kwargs = generation_kwargs or {"max_length": 512}
+        # Lone requests are decoded speculatively; real batches use plain generate
+        self.speculative = speculative
+        self.model_type = model_type
+        self.eos_token_id = tokenizer.eos_token_id
+        self.stats = {
+            "requests": 0,
+            "batches": 0,
+            "largest_batch": 0,
+            "total_queue_wait": 0.0,
+            "total_generation_time": 0.0
+        }
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(self, prompt: str) -> str:
+        """Queue a prompt and wait for its generated text"""
+        loop = asyncio.get_running_loop()
+        self._ensure_worker(loop)
+        future = loop.create_future()
+        await self._queue.put(PendingGeneration(prompt, future, loop.time()))
+        return await future
+
+    def _ensure_worker(self, loop: asyncio.AbstractEventLoop):
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _collect_batch(self) -> List[PendingGeneration]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return [request for request in batch if not request.future.cancelled()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            if not batch:
+                continue
+
+            started = loop.time()
+            try:
+                # Tokenize and decode on the loop thread: fast tokenizers are shared
+                # between schedulers and are not safe to use from several threads.
+                inputs = self.tokenizer(
+                    [request.prompt for request in batch],
+                    return_tensors="pt",
+                    padding=True
+                )
+                outputs = await loop.run_in_executor(self.executor, self._generate, inputs)
+                texts = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            except Exception as e:
+                print(f"Error generating batch of {len(batch)}: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            self._record_batch(batch, started, loop.time())
+            for request, text in zip(batch, texts):
+                if not request.future.done():
+                    request.future.set_result(text)
+
+    def _generate(self, inputs) -> torch.Tensor:
+        model = self.model_provider()
+        if model is None:
+            raise RuntimeError("Model is not available")
+        inputs = inputs.to(model.device)
+        if (
+            self.speculative is not None
+            and inputs["input_ids"].shape[0] == 1
+            and self.speculative.is_available()
+        ):
+            prompt_length = inputs["input_ids"].shape[1]
+            return self.speculative.generate(
+                model,
+                inputs["input_ids"],
+                self.generation_kwargs.get("max_new_tokens", self.generation_kwargs.get("max_length", 512) - prompt_length),
+                self.eos_token_id,
+                self.model_type
+            )
+        with torch.no_grad():
+            return model.generate(
+                **inputs,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.generation_kwargs
+            )
+
+    def _record_batch(self, batch: List[PendingGeneration], started: float, finished: float):
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        self.stats["total_queue_wait"] += sum(started - request.enqueued_at for request in batch)
+        self.stats["total_generation_time"] += finished - started
+
+    def get_stats(self) -> Dict[str, float]:
+        """Batching metrics for monitoring"""
+        batches = self.stats["batches"] or 1
+        requests = self.stats["requests"] or 1
+        return {
+            **self.stats,
+            "average_batch_size": self.stats["requests"] / batches,
+            "average_queue_wait": self.stats["total_queue_wait"] / requests,
+            "average_generation_time": self.stats["total_generation_time"] / batches
+        }
@@ -0,0 +1,256 @@
+"""Out-of-process inference for the AI tutor.
+
+The server binds one Unix socket and forks worker processes that accept
+jobs on it. Each worker builds its own `AdvancedMathTutorAI` after the fork
+and optionally preloads models, so CUDA contexts, model weights and the
+response cache's SQLite connection are never shared between processes (a
+process that has initialised CUDA cannot fork usable children). Size
+--workers to fit one copy of the preloaded weights per worker. API
+processes talk to the server through `RemoteTutor`, which mirrors the
+tutor's async methods.
+
+    python -m app.inference_workers --socket /tmp/tutor.sock --workers 2 --preload explanation hint_generation
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import time
+from dataclasses import asdict
+from typing import AsyncIterator, Dict, List, Optional
+
+from .ai_tutor_core import AdvancedMathTutorAI, LearningStyle, StudentProfile
+from .answer_checker import check_answer
+
+FRAME_HEADER = struct.Struct(">I")
+
+# Tutor methods a client may call, and whether they stream
+REMOTE_METHODS = {
+    "generate_explanation": False,
+    "assess_solution": False,
+    "provide_hint": False,
+    "stream_explanation": True,
+    "stream_hint": True,
+    "get_inference_stats": False
+}
+
+
+def profile_to_dict(profile: StudentProfile) -> Dict:
+    data = asdict(profile)
+    data["learning_style"] = profile.learning_style.value
+    return data
+
+
+def profile_from_dict(data: Dict) -> StudentProfile:
+    return StudentProfile(**{**data, "learning_style": LearningStyle(data["learning_style"])})
+
+
+async def write_frame(writer: asyncio.StreamWriter, message: Dict):
+    payload = json.dumps(message, default=str).encode("utf-8")
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return json.loads(await reader.readexactly(length))
+
+
+async def _handle_job(tutor: AdvancedMathTutorAI, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        job = await read_frame(reader)
+        method = job.get("method")
+        if method not in REMOTE_METHODS:
+            await write_frame(writer, {"error": f"Unknown method: {method}"})
+            return
+
+        kwargs = dict(job.get("kwargs", {}))
+        if "student_profile" in kwargs:
+            kwargs["student_profile"] = profile_from_dict(kwargs["student_profile"])
+
+        if REMOTE_METHODS[method]:
+            async for chunk in getattr(tutor, method)(**kwargs):
+                await write_frame(writer, {"chunk": chunk})
+            await write_frame(writer, {"done": True})
+        else:
+            await write_frame(writer, {"result": await getattr(tutor, method)(**kwargs)})
+    except asyncio.IncompleteReadError:
+        pass
+    except Exception as e:
+        print(f"Inference worker {os.getpid()} job failed: {e}")
+        try:
+            await write_frame(writer, {"error": str(e)})
+        except Exception:
+            pass
+    finally:
+        writer.close()
+
+
+def _worker_main(listen_socket: socket.socket, preload: List[str]):
+    # Let the supervisor decide when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Built after the fork: the parent never touches models, CUDA or the cache
+    tutor = AdvancedMathTutorAI()
+    for model_type in preload:
+        if tutor.models.get(model_type) is None:
+            print(f"Inference worker {os.getpid()} could not preload model {model_type}")
+
+    async def serve():
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: _handle_job(tutor, reader, writer),
+            sock=listen_socket
+        )
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+class InferenceWorkerPool:
+    """Pre-forked inference processes sharing one listening Unix socket"""
+
+    def __init__(self, socket_path: str, num_workers: int = 2, preload: Optional[List[str]] = None):
+        self.socket_path = socket_path
+        self.num_workers = num_workers
+        self.preload = preload or []
+        self._context = multiprocessing.get_context("fork")
+        self._workers: List[multiprocessing.Process] = []
+        self._stopping = False
+
+    def _bind(self) -> socket.socket:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listen_socket.bind(self.socket_path)
+        # Only processes running as the same user may submit jobs
+        os.chmod(self.socket_path, 0o600)
+        listen_socket.listen(1024)
+        return listen_socket
+
+    def _spawn(self, listen_socket: socket.socket) -> multiprocessing.Process:
+        worker = self._context.Process(target=_worker_main, args=(listen_socket, self.preload), daemon=True)
+        worker.start()
+        return worker
+
+    def serve_forever(self):
+        listen_socket = self._bind()
+        self._workers = [self._spawn(listen_socket) for _ in range(self.num_workers)]
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        print(f"Inference server listening on {self.socket_path} with {self.num_workers} workers")
+
+        try:
+            while not self._stopping:
+                for index, worker in enumerate(self._workers):
+                    if not worker.is_alive() and not self._stopping:
+                        print(f"Inference worker {worker.pid} exited with {worker.exitcode}, restarting")
+                        self._workers[index] = self._spawn(listen_socket)
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            listen_socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def stop(self):
+        self._stopping = True
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in self._workers:
+            worker.join(timeout=10)
+
+
+class RemoteTutor:
+    """Async client with the same generation API as AdvancedMathTutorAI"""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+
+    async def _open(self, method: str, kwargs: Dict):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        if isinstance(kwargs.get("student_profile"), StudentProfile):
+            kwargs["student_profile"] = profile_to_dict(kwargs["student_profile"])
+        await write_frame(writer, {"method": method, "kwargs": kwargs})
+        return reader, writer
+
+    async def call(self, method: str, **kwargs):
+        reader, writer = await self._open(method, kwargs)
+        try:
+            response = await read_frame(reader)
+        finally:
+            writer.close()
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    async def stream(self, method: str, **kwargs) -> AsyncIterator[str]:
+        reader, writer = await self._open(method, kwargs)
+        try:
+            while True:
+                response = await read_frame(reader)
+                if "error" in response:
+                    raise RuntimeError(response["error"])
+                if response.get("done"):
+                    break
+                yield response["chunk"]
+        finally:
+            writer.close()
+
+    async def generate_explanation(self, concept: str, student_profile: StudentProfile, previous_explanations: Optional[List[str]] = None) -> Dict:
+        return await self.call(
+            "generate_explanation",
+            concept=concept,
+            student_profile=student_profile,
+            previous_explanations=previous_explanations
+        )
+
+    async def assess_solution(self, problem: str, student_solution: str, correct_solution: str, student_profile: StudentProfile, explain_mistakes: bool = False, topic: Optional[str] = None) -> Dict:
+        # Rule-based grading needs no worker round trip
+        check = check_answer(student_solution, correct_solution)
+        if not check.needs_model(explain_mistakes):
+            return check.to_assessment()
+        return await self.call(
+            "assess_solution",
+            problem=problem,
+            student_solution=student_solution,
+            correct_solution=correct_solution,
+            student_profile=student_profile,
+            explain_mistakes=explain_mistakes,
+            topic=topic
+        )
+
+    async def provide_hint(self, problem: str, student_profile: StudentProfile, previous_hints: Optional[List[str]] = None, session_id: Optional[str] = None) -> Dict:
+        return await self.call(
+            "provide_hint",
+            problem=problem,
+            student_profile=student_profile,
+            previous_hints=previous_hints,
+            session_id=session_id
+        )
+
+    def stream_explanation(self, concept: str, student_profile: StudentProfile) -> AsyncIterator[str]:
+        return self.stream("stream_explanation", concept=concept, student_profile=student_profile)
+
+    def stream_hint(self, problem: str, student_profile: StudentProfile, previous_hints: Optional[List[str]] = None) -> AsyncIterator[str]:
+        return self.stream("stream_hint", problem=problem, student_profile=student_profile, previous_hints=previous_hints)
+
+    async def get_inference_stats(self) -> Dict:
+        """Stats of whichever worker process picks up the request"""
+        return await self.call("get_inference_stats")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the AI tutor inference workers")
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET", "/tmp/math_tutor_inference.sock"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INFERENCE_WORKERS", "2")))
+    parser.add_argument("--preload", nargs="*", default=[], help="Model types each worker loads at startup")
+    args = parser.parse_args()
+
+    InferenceWorkerPool(args.socket, args.workers, args.preload).serve_forever()
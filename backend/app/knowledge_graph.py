@@ -0,0 +1,269 @@
+"""Compiled concept prerequisite graph for learning-path planning.
+
+The graph is compiled once: concepts are numbered in topological order,
+direct prerequisites are stored as CSR arrays (`indptr`, `indices`), and each
+concept gets a bitset (a Python int) of all its transitive prerequisites.
+Planning a path from a student's mastered concepts to their goals is then a
+few bitset operations, and results are cached per (mastered, goals) pair, so
+it is cheap enough for every dashboard load and whole classes at once.
+
+CONCEPT_PREREQUISITES also names finer concepts (Times Tables, Place Value,
+...) that have no problems or progress of their own. A student could never
+master them, so the planner's graph keeps only curriculum topics (see
+app.curriculum), linked through those concepts by `practisable_prerequisites`.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .curriculum import practisable_topics
+
+# A concept counts as mastered at this mastery level over at least
+# MIN_ATTEMPTS attempts; fewer attempts are too noisy to act on
+MASTERY_THRESHOLD = float(os.getenv("LEARNING_PATH_MASTERY", "0.8"))
+MIN_ATTEMPTS = int(os.getenv("LEARNING_PATH_MIN_ATTEMPTS", "5"))
+
+# concept -> concepts that must be mastered first
+CONCEPT_PREREQUISITES: Dict[str, List[str]] = {
+    "Counting": [],
+    "Place Value": ["Counting"],
+    "Addition": ["Counting"],
+    "Subtraction": ["Addition"],
+    "Addition with Regrouping": ["Addition", "Place Value"],
+    "Subtraction with Regrouping": ["Subtraction", "Addition with Regrouping"],
+    "Multiplication": ["Addition"],
+    "Times Tables": ["Multiplication"],
+    "Multi-digit Multiplication": ["Times Tables", "Addition with Regrouping"],
+    "Division": ["Times Tables", "Subtraction"],
+    "Long Division": ["Division", "Multi-digit Multiplication", "Subtraction with Regrouping"],
+    "Fractions": ["Division"],
+    "Equivalent Fractions": ["Fractions", "Times Tables"],
+    "Adding Fractions": ["Equivalent Fractions", "Addition"],
+    "Decimals": ["Place Value", "Fractions"],
+    "Decimal Arithmetic": ["Decimals", "Addition with Regrouping", "Subtraction with Regrouping"],
+    "Measurement": ["Counting"],
+    "Unit Conversion": ["Measurement", "Multi-digit Multiplication", "Decimals"],
+    "Geometry": ["Counting"],
+    "Perimeter": ["Geometry", "Addition"],
+    "Area": ["Perimeter", "Multiplication"]
+}
+
+# Typical hours of practice to master each concept
+CONCEPT_HOURS: Dict[str, float] = {
+    "Counting": 2.0,
+    "Place Value": 3.0,
+    "Addition": 3.0,
+    "Subtraction": 3.0,
+    "Addition with Regrouping": 4.0,
+    "Subtraction with Regrouping": 4.0,
+    "Multiplication": 4.0,
+    "Times Tables": 6.0,
+    "Multi-digit Multiplication": 5.0,
+    "Division": 5.0,
+    "Long Division": 6.0,
+    "Fractions": 5.0,
+    "Equivalent Fractions": 4.0,
+    "Adding Fractions": 5.0,
+    "Decimals": 4.0,
+    "Decimal Arithmetic": 5.0,
+    "Measurement": 3.0,
+    "Unit Conversion": 4.0,
+    "Geometry": 3.0,
+    "Perimeter": 3.0,
+    "Area": 4.0
+}
+
+
+def practisable_prerequisites(
+    prerequisites: Dict[str, List[str]],
+    topics: Iterable[str]
+) -> Dict[str, List[str]]:
+    """Prerequisite graph on `topics` only: each topic's nearest prerequisites among them.
+
+    A concept outside `topics` is looked through, so Division, which needs
+    Times Tables, which needs Multiplication, comes to need Multiplication.
+    """
+    topics = list(topics)
+    keep = set(topics)
+
+    def nearest(concept: str, seen: set) -> List[str]:
+        found = []
+        for parent in prerequisites.get(concept, []):
+            if parent in seen:
+                continue
+            seen.add(parent)
+            found.extend([parent] if parent in keep else nearest(parent, seen))
+        return found
+
+    return {topic: nearest(topic, set()) for topic in topics}
+
+
+class KnowledgeGraph:
+    """Prerequisite DAG compiled to CSR arrays and transitive bitsets"""
+
+    def __init__(
+        self,
+        prerequisites: Optional[Dict[str, List[str]]] = None,
+        hours: Optional[Dict[str, float]] = None,
+        default_hours: float = 4.0,
+        cache_size: int = 4096
+    ):
+        if prerequisites is None:
+            prerequisites = practisable_prerequisites(CONCEPT_PREREQUISITES, practisable_topics())
+        hours = hours if hours is not None else CONCEPT_HOURS
+        self.concepts = self._topological_order(prerequisites)
+        # Concept names are matched case-insensitively
+        self.index = {concept.lower(): i for i, concept in enumerate(self.concepts)}
+
+        # Direct prerequisites as CSR; node ids are topological positions
+        self.indptr = np.zeros(len(self.concepts) + 1, dtype=np.int32)
+        indices = []
+        for i, concept in enumerate(self.concepts):
+            indices.extend(sorted(self.index[p.lower()] for p in prerequisites.get(concept, [])))
+            self.indptr[i + 1] = len(indices)
+        self.indices = np.array(indices, dtype=np.int32)
+
+        # Transitive prerequisites, built in one pass since parents come first
+        self.direct: List[int] = []
+        self.closure: List[int] = []
+        depth = []
+        for i in range(len(self.concepts)):
+            parents = self.indices[self.indptr[i]:self.indptr[i + 1]].tolist()
+            direct = 0
+            closure = 0
+            for p in parents:
+                direct |= 1 << p
+                closure |= self.closure[p] | (1 << p)
+            self.direct.append(direct)
+            self.closure.append(closure)
+            depth.append(1 + max((depth[p] for p in parents), default=-1))
+        self.depth = np.array(depth, dtype=np.int32)
+        self.hours = np.array([hours.get(concept, default_hours) for concept in self.concepts])
+
+        self.cache_size = cache_size
+        self._paths: "OrderedDict[Tuple[int, int], Tuple[int, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"plans": 0, "cache_hits": 0}
+
+    @staticmethod
+    def _topological_order(prerequisites: Dict[str, List[str]]) -> List[str]:
+        """Kahn's algorithm; ties keep declaration order so numbering is stable"""
+        concepts = list(prerequisites)
+        for parents in prerequisites.values():
+            concepts.extend(p for p in parents if p not in prerequisites and p not in concepts)
+        remaining = {concept: len(set(prerequisites.get(concept, []))) for concept in concepts}
+        dependents: Dict[str, List[str]] = {concept: [] for concept in concepts}
+        for concept in concepts:
+            for parent in set(prerequisites.get(concept, [])):
+                dependents[parent].append(concept)
+
+        order = []
+        ready = [concept for concept in concepts if remaining[concept] == 0]
+        while ready:
+            concept = ready.pop(0)
+            order.append(concept)
+            for child in dependents[concept]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    ready.append(child)
+        if len(order) != len(concepts):
+            raise ValueError(f"Prerequisite cycle among: {sorted(set(concepts) - set(order))}")
+        return order
+
+    def mask(self, concepts: Iterable[str]) -> int:
+        """Bitset of the named concepts; names not in the graph are ignored"""
+        bits = 0
+        for concept in concepts or ():
+            i = self.index.get(str(concept).lower())
+            if i is not None:
+                bits |= 1 << i
+        return bits
+
+    def known_mask(self, mastered: Iterable[str]) -> int:
+        """Mastered concepts plus everything they build on"""
+        return self.with_prerequisites(self.mask(mastered))
+
+    def with_prerequisites(self, mask: int) -> int:
+        known = mask
+        for i in self._bits(mask):
+            known |= self.closure[i]
+        return known
+
+    @staticmethod
+    def _bits(mask: int) -> Iterable[int]:
+        # Ascending bit order is topological order
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def concepts_of(self, mask: int) -> List[str]:
+        return [self.concepts[i] for i in self._bits(mask)]
+
+    def path_mask(self, known: int, goals: int) -> int:
+        """Concepts still to learn: the goals and their prerequisites, minus what is known"""
+        needed = goals
+        for i in self._bits(goals):
+            needed |= self.closure[i]
+        return needed & ~known
+
+    def plan(self, known: int, goals: int) -> Tuple[int, ...]:
+        """Shortest learning path as concept ids in study order, cached per (known, goals)"""
+        key = (known, goals)
+        with self._lock:
+            self.stats["plans"] += 1
+            path = self._paths.get(key)
+            if path is not None:
+                self.stats["cache_hits"] += 1
+                self._paths.move_to_end(key)
+                return path
+        # Every concept in the closure is required, so this set is minimal;
+        # ascending ids already respect prerequisites
+        path = tuple(self._bits(self.path_mask(known, goals)))
+        with self._lock:
+            self._paths[key] = path
+            if len(self._paths) > self.cache_size:
+                self._paths.popitem(last=False)
+        return path
+
+    def learning_path(self, mastered: Iterable[str], goals: Iterable[str]) -> List[str]:
+        return [self.concepts[i] for i in self.plan(self.known_mask(mastered), self.mask(goals))]
+
+    def ready(self, known: int) -> List[str]:
+        """Unlearned concepts whose prerequisites are all known"""
+        return [
+            concept
+            for i, concept in enumerate(self.concepts)
+            if not known >> i & 1 and self.direct[i] & ~known == 0
+        ]
+
+    def prerequisites_of(self, concept: str) -> List[str]:
+        i = self.index[concept.lower()]
+        return [self.concepts[p] for p in self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def estimated_hours(self, path: Iterable[str]) -> float:
+        return float(sum(self.hours[self.index[concept.lower()]] for concept in path))
+
+    def milestones(self, path: List[str]) -> List[Dict]:
+        """Path grouped by graph depth; each stage's concepts can be studied in any order"""
+        stages: "OrderedDict[int, List[str]]" = OrderedDict()
+        for concept in sorted(path, key=lambda concept: self.depth[self.index[concept.lower()]]):
+            stages.setdefault(int(self.depth[self.index[concept.lower()]]), []).append(concept)
+        milestones, elapsed = [], 0.0
+        for concepts in stages.values():
+            elapsed += self.estimated_hours(concepts)
+            milestones.append({"concepts": concepts, "cumulative_hours": elapsed})
+        return milestones
+
+    def get_stats(self) -> Dict:
+        plans = self.stats["plans"]
+        return {
+            **self.stats,
+            "concepts": len(self.concepts),
+            "edges": int(len(self.indices)),
+            "cached_paths": len(self._paths),
+            "hit_rate": self.stats["cache_hits"] / plans if plans else 0.0
+        }
@@ -0,0 +1,167 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from transformers import DynamicCache
+
+
+def _cache_tensors(cache) -> Iterator[torch.Tensor]:
+    layers = getattr(cache, "layers", None)
+    if layers is not None:
+        for layer in layers:
+            for tensor in (getattr(layer, "keys", None), getattr(layer, "values", None)):
+                if isinstance(tensor, torch.Tensor):
+                    yield tensor
+    else:
+        yield from getattr(cache, "key_cache", [])
+        yield from getattr(cache, "value_cache", [])
+
+
+def cache_nbytes(cache) -> int:
+    return sum(tensor.numel() * tensor.element_size() for tensor in _cache_tensors(cache))
+
+
+def crop_to(cache: DynamicCache, length: int):
+    """Keep the first `length` positions of a cache"""
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        cache.crop(-excess)
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+@dataclass
+class PrefixEntry:
+    token_ids: List[int]
+    past_key_values: DynamicCache
+    nbytes: int
+    last_used: float
+
+
+class PrefixKVCache:
+    """Keeps the prompt key/value cache of in-progress tutoring sessions.
+
+    A session (e.g. one student working on one problem) stores the KV cache
+    for its last prompt. The next prompt only needs prefilling from the first
+    token where it diverges from the stored one. Entries are dropped after
+    `idle_timeout` seconds, or least-recently-used first past `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, idle_timeout: float = 600.0):
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[Hashable, PrefixEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "reused_tokens": 0,
+            "prefilled_tokens": 0,
+            "evictions": 0,
+            "expirations": 0
+        }
+
+    def lookup(self, key: Hashable, token_ids: List[int]) -> Tuple[Optional[DynamicCache], int]:
+        """Return a private copy of the reusable cache and how many tokens it covers"""
+        with self._lock:
+            self._expire(time.monotonic())
+            self.stats["lookups"] += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, 0
+            # At least one prompt token must be left to produce the next logits
+            reusable = min(common_prefix_length(entry.token_ids, token_ids), len(token_ids) - 1)
+            if reusable <= 0:
+                return None, 0
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            past = copy.deepcopy(entry.past_key_values)
+
+        crop_to(past, reusable)
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["reused_tokens"] += reusable
+        return past, reusable
+
+    def store(self, key: Hashable, token_ids: List[int], past_key_values: DynamicCache):
+        """Remember the cache for a session's latest prompt"""
+        crop_to(past_key_values, len(token_ids))
+        nbytes = cache_nbytes(past_key_values)
+        with self._lock:
+            self._entries.pop(key, None)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = PrefixEntry(token_ids, past_key_values, nbytes, time.monotonic())
+            while self._bytes_in_use() > self.max_bytes:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def record_prefill(self, tokens: int):
+        with self._lock:
+            self.stats["prefilled_tokens"] += tokens
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry.last_used > self.idle_timeout]
+        for key in expired:
+            del self._entries[key]
+            self.stats["expirations"] += 1
+
+    def _bytes_in_use(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "sessions": len(self._entries),
+                "bytes_in_use": self._bytes_in_use(),
+                "max_bytes": self.max_bytes
+            }
+
+
+def generate_with_prefix_cache(
+    model: nn.Module,
+    input_ids: torch.Tensor,
+    prefix_cache: PrefixKVCache,
+    session_key: Hashable,
+    generation_kwargs: Dict,
+    pad_token_id: Optional[int] = None
+) -> torch.Tensor:
+    """Greedy generation that reuses and then refreshes a session's prompt KV cache"""
+    input_ids = input_ids.to(model.device)
+    token_ids = input_ids[0].tolist()
+    past, reused = prefix_cache.lookup(session_key, token_ids)
+    if past is None:
+        past = DynamicCache()
+    prefix_cache.record_prefill(len(token_ids) - reused)
+
+    with torch.no_grad():
+        # generate() only feeds the tokens beyond the cache's current length
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past,
+            use_cache=True,
+            return_dict_in_generate=True,
+            pad_token_id=pad_token_id,
+            **generation_kwargs
+        )
+
+    prefix_cache.store(session_key, token_ids, output.past_key_values)
+    return output.sequences
@@ -0,0 +1,221 @@
+"""Nightly refresh of every student's learning path and practice plan.
+
+Students are streamed in chunks from a server-side cursor (keyset pages on
+SQLite). Per chunk, their progress and skill ratings are loaded with one
+query each and laid out as (students x concepts) NumPy arrays; mastery,
+review flags and recommended difficulty levels are computed for the whole
+chunk at once, paths come from the compiled KnowledgeGraph (students with
+the same mastered set and goals share one cached plan), and the chunk is
+written with one bulk upsert into learning_paths and committed.
+
+    python -m app.learning_path_jobs refresh --chunk-size 2000
+"""
+import argparse
+import math
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .curriculum import grade_topics
+from .knowledge_graph import MASTERY_THRESHOLD, MIN_ATTEMPTS, KnowledgeGraph
+from .models import DifficultyLevel, LearningPath, Progress, SkillRating, User, UserRole
+from .profile_encoding import ProfileEncoder
+from .skill_model import LEVEL_DIFFICULTY, TARGET_SUCCESS
+
+# A student's goals are the topics of their grade and every grade before it
+GRADE_TOPICS: Dict[str, List[str]] = grade_topics()
+
+REVIEW_THRESHOLD = float(os.getenv("LEARNING_PATH_REVIEW", "0.5"))
+NEXT_TOPICS = 10
+RECOMMENDED_NEXT = 3
+RECOMMENDED_REVIEW = 2
+
+# Keeps multi-row statements well under driver bind-parameter limits
+UPSERT_CHUNK_ROWS = 1000
+
+
+class LearningPathJob:
+    """Recomputes learning_paths rows for all students, chunk by chunk"""
+
+    def __init__(
+        self,
+        session_factory,
+        graph: Optional[KnowledgeGraph] = None,
+        chunk_size: int = 2000,
+        mastery_threshold: float = MASTERY_THRESHOLD,
+        review_threshold: float = REVIEW_THRESHOLD,
+        min_attempts: int = MIN_ATTEMPTS
+    ):
+        self.session_factory = session_factory
+        self.graph = graph or KnowledgeGraph()
+        self.chunk_size = chunk_size
+        # Same mastery rule and concept bitsets as the tutor's profiles
+        self.encoder = ProfileEncoder(self.graph, mastery_threshold, min_attempts)
+        self.review_threshold = review_threshold
+        self.levels = list(LEVEL_DIFFICULTY)
+        self.level_values = np.array([LEVEL_DIFFICULTY[level] for level in self.levels])
+        self.goals = self._grade_goals()
+        self.stats = {
+            "students": 0,
+            "chunks": 0,
+            "load_time": 0.0,
+            "plan_time": 0.0,
+            "write_time": 0.0
+        }
+
+    def _grade_goals(self) -> Dict[Optional[str], int]:
+        goals, cumulative = {}, 0
+        for grade, topics in GRADE_TOPICS.items():
+            cumulative |= self.graph.mask(topics)
+            goals[grade] = cumulative
+        # Students without a known grade work towards the whole curriculum
+        goals[None] = cumulative
+        return goals
+
+    def run(self, report: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Refresh every student's row; `report` is called after each chunk"""
+        started = time.perf_counter()
+        with self.session_factory() as reader, self.session_factory() as writer:
+            for chunk in self._student_chunks(reader):
+                self._refresh_chunk(writer, chunk)
+                if report is not None:
+                    report(self.get_report(started))
+        return self.get_report(started)
+
+    def _student_chunks(self, reader):
+        students = (
+            select(User.id, User.grade_level)
+            .where(User.role == UserRole.STUDENT)
+            .order_by(User.id)
+        )
+        if reader.bind.dialect.name == "postgresql":
+            # Server-side cursor on its own session while chunks commit on another
+            result = reader.execute(students.execution_options(stream_results=True, yield_per=self.chunk_size))
+            yield from result.partitions(self.chunk_size)
+            return
+        # SQLite can't commit while a read cursor is open: page by primary key
+        last_id = 0
+        while True:
+            chunk = reader.execute(students.where(User.id > last_id).limit(self.chunk_size)).all()
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
+
+    def _refresh_chunk(self, db, students: List):
+        loaded = time.perf_counter()
+        user_ids = [student.id for student in students]
+        progress = db.execute(
+            select(Progress.user_id, Progress.topic, Progress.mastery_level, Progress.problems_attempted)
+            .where(Progress.user_id.in_(user_ids))
+        ).all()
+        ratings = db.execute(
+            select(SkillRating.user_id, SkillRating.topic, SkillRating.rating)
+            .where(SkillRating.user_id.in_(user_ids))
+        ).all()
+
+        planned = time.perf_counter()
+        rows = self.plan_chunk(students, progress, ratings)
+
+        written = time.perf_counter()
+        self._upsert(db, rows)
+        db.commit()
+
+        self.stats["students"] += len(students)
+        self.stats["chunks"] += 1
+        self.stats["load_time"] += planned - loaded
+        self.stats["plan_time"] += written - planned
+        self.stats["write_time"] += time.perf_counter() - written
+
+    def plan_chunk(self, students: List, progress: List, ratings: List) -> List[Dict]:
+        """learning_paths rows for a chunk of (id, grade_level) students"""
+        graph = self.graph
+        position = {student.id: i for i, student in enumerate(students)}
+        mastery, attempts = self.encoder.progress_arrays(list(position), progress)
+        skill = np.zeros(mastery.shape)
+        for row in ratings:
+            column = graph.index.get(row.topic.lower())
+            if column is not None:
+                skill[position[row.user_id], column] = row.rating or 0.0
+
+        review = (attempts >= self.encoder.min_attempts) & (mastery < self.review_threshold)
+        # Level whose prior difficulty is closest to the target for each rating
+        target = skill - math.log(TARGET_SUCCESS / (1.0 - TARGET_SUCCESS))
+        level = np.abs(target[:, :, None] - self.level_values).argmin(axis=2)
+        mastered_masks = self.encoder.mastered_masks(mastery, attempts)
+
+        now = datetime.utcnow()
+        rows = []
+        for i, student in enumerate(students):
+            mastered_mask = mastered_masks[i]
+            goals = self.goals.get(student.grade_level, self.goals[None])
+            path = graph.plan(graph.with_prerequisites(mastered_mask), goals)
+            recommended = [
+                {"topic": graph.concepts[c], "difficulty": self.levels[level[i, c]], "reason": "next"}
+                for c in path[:RECOMMENDED_NEXT]
+            ]
+            weakest = np.flatnonzero(review[i])
+            weakest = weakest[np.argsort(mastery[i, weakest])][:RECOMMENDED_REVIEW]
+            recommended.extend(
+                {"topic": graph.concepts[c], "difficulty": self.levels[level[i, c]], "reason": "review"}
+                for c in weakest
+            )
+            rows.append({
+                "user_id": student.id,
+                "current_topic": graph.concepts[path[0]] if path else None,
+                "completed_topics": graph.concepts_of(mastered_mask),
+                "next_topics": [graph.concepts[c] for c in path[1:1 + NEXT_TOPICS]],
+                "difficulty_level": DifficultyLevel(self.levels[level[i, path[0]]]) if path else None,
+                "recommended_practice": recommended,
+                "last_updated": now
+            })
+        return rows
+
+    @staticmethod
+    def _upsert(db, rows: List[Dict]):
+        dialect_insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+        for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+            statement = dialect_insert(LearningPath).values(rows[start:start + UPSERT_CHUNK_ROWS])
+            new = statement.excluded
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[LearningPath.user_id],
+                set_={
+                    "current_topic": new.current_topic,
+                    "completed_topics": new.completed_topics,
+                    "next_topics": new.next_topics,
+                    "difficulty_level": new.difficulty_level,
+                    "recommended_practice": new.recommended_practice,
+                    "last_updated": new.last_updated
+                }
+            ))
+
+    def get_report(self, started: float) -> Dict:
+        elapsed = time.perf_counter() - started
+        return {
+            **self.stats,
+            "seconds": elapsed,
+            "students_per_second": self.stats["students"] / elapsed if elapsed else 0.0,
+            "path_cache_hit_rate": self.graph.get_stats()["hit_rate"]
+        }
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Learning path batch jobs")
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    job = LearningPathJob(SessionLocal, chunk_size=args.chunk_size)
+    report = job.run(lambda progress: print(
+        f"{progress['students']} students in {progress['seconds']:.1f}s "
+        f"({progress['students_per_second']:.0f}/s)"
+    ))
+    print(report)
@@ -0,0 +1,147 @@
+import gc
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+
+def estimate_model_bytes(model: nn.Module) -> int:
+    """Approximate resident size of a model's weights and buffers"""
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    # Dynamically quantized Linear layers keep their packed int8 weights
+    # outside of parameters()
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            for tensor in packed._weight_bias():
+                if tensor is not None:
+                    total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """Loads tutor models on first use and keeps them under a memory budget.
+
+    Models are evicted least-recently-used first when loading another one
+    would exceed `memory_budget_bytes`. A model larger than the whole budget
+    is still loaded, after everything else has been evicted.
+    """
+
+    def __init__(
+        self,
+        model_paths: Dict[str, Optional[str]],
+        loader: Callable[[str], Optional[nn.Module]],
+        memory_budget_bytes: int
+    ):
+        self.model_paths = dict(model_paths)
+        self.loader = loader
+        self.memory_budget_bytes = memory_budget_bytes
+        self._loaded: "OrderedDict[str, nn.Module]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.model_paths}
+        self.stats = {
+            "hits": 0,
+            "loads": 0,
+            "evictions": 0,
+            "load_failures": 0,
+            "total_load_time": 0.0
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.model_paths
+
+    def __getitem__(self, name: str) -> Optional[nn.Module]:
+        return self.get(name)
+
+    def keys(self) -> List[str]:
+        return list(self.model_paths)
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._loaded
+
+    def get(self, name: str) -> Optional[nn.Module]:
+        """Return a loaded model, loading it (and evicting others) if needed"""
+        if name not in self.model_paths:
+            raise KeyError(name)
+
+        model = self._lookup(name)
+        if model is not None or name in self._failed:
+            return model
+
+        # Only one thread loads a given model; others wait and reuse it
+        with self._load_locks[name]:
+            model = self._lookup(name)
+            if model is not None or name in self._failed:
+                return model
+            return self._load(name)
+
+    def _lookup(self, name: str) -> Optional[nn.Module]:
+        with self._lock:
+            model = self._loaded.get(name)
+            if model is not None:
+                self._loaded.move_to_end(name)
+                self.stats["hits"] += 1
+            return model
+
+    def _load(self, name: str) -> Optional[nn.Module]:
+        started = time.perf_counter()
+        model = self.loader(self.model_paths[name])
+        if model is None:
+            with self._lock:
+                self._failed[name] = self.model_paths[name]
+                self.stats["load_failures"] += 1
+            return None
+
+        size = estimate_model_bytes(model)
+        with self._lock:
+            self._evict_until_fits(size)
+            self._loaded[name] = model
+            self._sizes[name] = size
+            self.stats["loads"] += 1
+            self.stats["total_load_time"] += time.perf_counter() - started
+        return model
+
+    def _evict_until_fits(self, incoming_bytes: int):
+        evicted_any = False
+        while self._loaded and self._bytes_in_use() + incoming_bytes > self.memory_budget_bytes:
+            evicted, _ = self._loaded.popitem(last=False)
+            self._sizes.pop(evicted, None)
+            self.stats["evictions"] += 1
+            evicted_any = True
+        if evicted_any:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def _bytes_in_use(self) -> int:
+        return sum(self._sizes.values())
+
+    def evict(self, name: str) -> bool:
+        """Drop a loaded model; returns False if it was not loaded"""
+        with self._lock:
+            if name not in self._loaded:
+                return False
+            del self._loaded[name]
+            self._sizes.pop(name, None)
+            self.stats["evictions"] += 1
+        gc.collect()
+        return True
+
+    def get_stats(self) -> Dict:
+        """Load/evict counters and current memory usage"""
+        with self._lock:
+            return {
+                **self.stats,
+                "loaded_models": list(self._loaded),
+                "failed_models": list(self._failed),
+                "bytes_in_use": self._bytes_in_use(),
+                "memory_budget_bytes": self.memory_budget_bytes
+            }
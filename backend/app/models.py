@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum, JSON
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Enum, JSON, Text, Identity, Index, PrimaryKeyConstraint, UniqueConstraint
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 import enum
 
+from .passwords import pwd_context
+
 Base = declarative_base()
 
 class UserRole(enum.Enum):
@@ -16,6 +19,16 @@ class DifficultyLevel(enum.Enum):
     MEDIUM = "medium"
     HARD = "hard"
 
+# Starting difficulty of a problem on the skill model's logit scale (see
+# app.skill_model), from its curriculum level
+LEVEL_DIFFICULTY = {"easy": -1.0, "medium": 0.0, "hard": 1.0}
+
+def level_difficulty(level) -> float:
+    return LEVEL_DIFFICULTY.get(getattr(level, "value", level), 0.0)
+
+def _difficulty_prior(context) -> float:
+    return level_difficulty(context.get_current_parameters().get("difficulty"))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -34,6 +47,10 @@ class User(Base):
     achievements = relationship("Achievement", back_populates="user")
     attempts = relationship("ProblemAttempt", back_populates="user")
 
+    def verify_password(self, password):
+        # Blocking; request handlers go through auth.PasswordHasher instead
+        return pwd_context.verify(password, self.hashed_password)
+
 class StudentProfile(Base):
     __tablename__ = "student_profiles"
 
@@ -45,6 +62,10 @@ class StudentProfile(Base):
     strengths = Column(JSON)  # Store as JSON: {"topic": score}
     weaknesses = Column(JSON)  # Store as JSON: {"topic": score}
     last_activity = Column(DateTime)
+    # 0 to 1, from session telemetry (see app.engagement)
+    engagement_score = Column(Float, default=0.5)
+    cognitive_load = Column(Float, default=0.5)
+    engagement_updated_at = Column(DateTime)
 
     # Relationships
     user = relationship("User", back_populates="profile")
@@ -60,42 +81,85 @@ class MathProblem(Base):
     correct_answer = Column(String, nullable=False)
     solution_steps = Column(JSON)  # Store steps as JSON array
     hints = Column(JSON)  # Store hints as JSON array
+    visual_aid = Column(Text)  # Pre-rendered base64 PNG
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Online skill model difficulty on the logit scale, see app.skill_model
+    difficulty_rating = Column(Float, default=_difficulty_prior)
+    rating_attempts = Column(Integer, default=0)
 
     # Relationships
     attempts = relationship("ProblemAttempt", back_populates="problem")
 
+    # Problem pool lookups filter on all three; adaptive ones seek by rating
+    __table_args__ = (
+        Index('idx_problem_pool', 'topic', 'grade_level', 'difficulty'),
+        Index('idx_problem_rating', 'topic', 'grade_level', 'difficulty_rating'),
+    )
+
 class ProblemAttempt(Base):
     __tablename__ = "problem_attempts"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), Identity(), primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     problem_id = Column(Integer, ForeignKey("math_problems.id"))
     student_answer = Column(String)
     is_correct = Column(Boolean)
     time_taken = Column(Float)  # Time in seconds
-    attempt_date = Column(DateTime, default=datetime.utcnow)
+    # Part of the primary key: Postgres requires the partition key in it
+    attempt_date = Column(DateTime, primary_key=True, default=datetime.utcnow)
     hints_used = Column(Integer, default=0)
 
     # Relationships
     user = relationship("User", back_populates="attempts")
     problem = relationship("MathProblem", back_populates="attempts")
 
+    # Monthly range partitions in Postgres, managed by app.attempt_partitions.
+    # Recent attempts per student, e.g. to exclude already-seen problems
+    __table_args__ = (
+        Index('idx_attempt_user_date', 'user_id', 'attempt_date'),
+        {"postgresql_partition_by": "RANGE (attempt_date)"},
+    )
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_attempt_primary_key(constraint, compiler, **kw):
+    # SQLite only autoincrements a lone INTEGER PRIMARY KEY, so the local
+    # stand-in keys problem_attempts on id alone
+    if constraint.table is not None and constraint.table.name == "problem_attempts":
+        return "PRIMARY KEY (id)"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
 class Progress(Base):
     __tablename__ = "progress"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     topic = Column(String, nullable=False)
-    mastery_level = Column(Float, default=0.0)  # 0 to 1
+    mastery_level = Column(Float, default=0.0)  # 0 to 1, exponentially weighted correctness
     problems_attempted = Column(Integer, default=0)
     problems_solved = Column(Integer, default=0)
+    solve_rate = Column(Float, default=0.0)  # problems_solved / problems_attempted
     average_time = Column(Float)  # Average time per problem
     last_updated = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     user = relationship("User", back_populates="progress")
 
+    def to_dict(self):
+        return {
+            "topic": self.topic,
+            "mastery_level": self.mastery_level or 0.0,
+            "problems_attempted": self.problems_attempted or 0,
+            "problems_solved": self.problems_solved or 0,
+            "solve_rate": self.solve_rate or 0.0,
+            "average_time": self.average_time,
+            "last_updated": self.last_updated.isoformat() if self.last_updated else None
+        }
+
+    # One row per student and topic; attempt ingestion upserts on it
+    __table_args__ = (
+        UniqueConstraint('user_id', 'topic', name='uq_progress_user_topic'),
+    )
+
 class Achievement(Base):
     __tablename__ = "achievements"
 
@@ -110,6 +174,39 @@ class Achievement(Base):
     # Relationships
     user = relationship("User", back_populates="achievements")
 
+class AttemptDailySummary(Base):
+    """Per-day per-topic rollup of problem_attempts past the retention window"""
+    __tablename__ = "attempt_daily_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    topic = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    attempts = Column(Integer, default=0)
+    solved = Column(Integer, default=0)
+    total_time = Column(Float, default=0.0)  # Seconds across all attempts
+    hints_used = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'topic', 'day', name='uq_attempt_summary_user_topic_day'),
+    )
+
+class SkillRating(Base):
+    """Online skill model rating of a student in a topic, see app.skill_model"""
+    __tablename__ = "skill_ratings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    topic = Column(String, nullable=False)
+    rating = Column(Float, default=0.0)  # Logit scale: P(correct) = sigmoid(rating - difficulty)
+    attempts = Column(Integer, default=0)
+    last_updated = Column(DateTime, default=datetime.utcnow)
+
+    # One row per student and topic; attempt ingestion upserts on it
+    __table_args__ = (
+        UniqueConstraint('user_id', 'topic', name='uq_skill_rating_user_topic'),
+    )
+
 class LearningPath(Base):
     __tablename__ = "learning_paths"
 
@@ -119,8 +216,21 @@ class LearningPath(Base):
     completed_topics = Column(JSON)  # Store as JSON array
     next_topics = Column(JSON)  # Store as JSON array
     difficulty_level = Column(Enum(DifficultyLevel))
+    recommended_practice = Column(JSON)  # [{"topic", "difficulty", "reason"}]
     last_updated = Column(DateTime, default=datetime.utcnow)
 
+    # One path per student; the nightly job upserts on it
+    __table_args__ = (
+        UniqueConstraint('user_id', name='uq_learning_path_user'),
+    )
+
+class RevokedToken(Base):
+    """Access tokens logged out before they expire, see auth.DatabaseRevocationStore"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 class ParentTeacherLink(Base):
     __tablename__ = "parent_teacher_links"
 
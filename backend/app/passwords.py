@@ -0,0 +1,5 @@
+"""Password hashing context shared by the ORM and the auth service."""
+from passlib.context import CryptContext
+
+# bcrypt is deliberately slow (~100+ ms per check); never run it on the event loop
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -0,0 +1,258 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import DifficultyLevel, MathProblem, ProblemAttempt
+from .skill_model import LEVEL_DIFFICULTY, nearest_level
+
+PoolKey = Tuple[str, str, str]
+
+
+class ProblemPool:
+    """Reservoir of ready-made problems in `math_problems`.
+
+    A background thread keeps every (grade_level, topic, difficulty) stocked
+    with at least `low_watermark` problems, topping up to `target_size` with
+    visuals already rendered. Serving is one indexed query that skips the
+    problems a student attempted within `recent_days`, either at a fixed
+    difficulty level or closest to a target skill-model difficulty.
+    """
+
+    def __init__(
+        self,
+        content_generator,
+        session_factory,
+        target_size: int = 500,
+        low_watermark: int = 100,
+        refill_batch: int = 200,
+        recent_days: int = 30,
+        check_interval: float = 30.0
+    ):
+        self.content_generator = content_generator
+        self.session_factory = session_factory
+        self.target_size = target_size
+        self.low_watermark = low_watermark
+        self.refill_batch = refill_batch
+        self.recent_days = recent_days
+        self.check_interval = check_interval
+        self._refill_requests: set = set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.pool_sizes: Dict[PoolKey, int] = {}
+        self.stats = {
+            "fetches": 0,
+            "problems_served": 0,
+            "shortfalls": 0,
+            "total_fetch_time": 0.0,
+            "refills": 0,
+            "problems_generated": 0,
+            "refill_errors": 0
+        }
+
+    def pool_keys(self) -> List[PoolKey]:
+        """Every curriculum entry the batch generator can produce"""
+        supported = self.content_generator.batch_generator.builders
+        return [
+            (grade, topic, difficulty)
+            for grade, topics in self.content_generator.curriculum.items()
+            for topic, difficulties in topics.items()
+            if topic in supported
+            for difficulty in difficulties
+        ]
+
+    def _attempted_recently(self, user_id: int):
+        # Correlated EXISTS rather than NOT IN: problem_id is nullable, and a
+        # single NULL in a NOT IN list makes it match nothing
+        cutoff = datetime.utcnow() - timedelta(days=self.recent_days)
+        return exists().where(
+            ProblemAttempt.problem_id == MathProblem.id,
+            ProblemAttempt.user_id == user_id,
+            ProblemAttempt.attempt_date >= cutoff
+        )
+
+    def _unseen_query(self, user_id: int, grade_level: str, topic: str, difficulty: str, count: int):
+        return (
+            select(MathProblem)
+            .where(
+                MathProblem.topic == topic,
+                MathProblem.grade_level == grade_level,
+                MathProblem.difficulty == DifficultyLevel(difficulty),
+                ~self._attempted_recently(user_id)
+            )
+            .order_by(func.random())
+            .limit(count)
+        )
+
+    def _targeted_query(self, user_id: int, grade_level: str, topic: str, target_difficulty: float, count: int):
+        return (
+            select(MathProblem)
+            .where(
+                MathProblem.topic == topic,
+                MathProblem.grade_level == grade_level,
+                ~self._attempted_recently(user_id)
+            )
+            .order_by(func.abs(MathProblem.difficulty_rating - target_difficulty), func.random())
+            .limit(count)
+        )
+
+    def fetch_unseen(
+        self,
+        db: Session,
+        user_id: int,
+        grade_level: str,
+        topic: str,
+        difficulty: str,
+        count: int = 5
+    ) -> List[MathProblem]:
+        """Pool problems the student has not attempted recently"""
+        started = time.perf_counter()
+        query = self._unseen_query(user_id, grade_level, topic, difficulty, count)
+        problems = db.execute(query).scalars().all()
+        self._record_fetch((grade_level, topic, difficulty), count, len(problems), started)
+        return problems
+
+    async def fetch_unseen_async(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        grade_level: str,
+        topic: str,
+        difficulty: str,
+        count: int = 5
+    ) -> List[MathProblem]:
+        """Same as fetch_unseen, over an async session"""
+        started = time.perf_counter()
+        query = self._unseen_query(user_id, grade_level, topic, difficulty, count)
+        problems = (await db.execute(query)).scalars().all()
+        self._record_fetch((grade_level, topic, difficulty), count, len(problems), started)
+        return problems
+
+    async def fetch_targeted_async(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        grade_level: str,
+        topic: str,
+        target_difficulty: float,
+        count: int = 5
+    ) -> List[MathProblem]:
+        """Unseen pool problems whose skill-model difficulty is closest to the target"""
+        started = time.perf_counter()
+        query = self._targeted_query(user_id, grade_level, topic, target_difficulty, count)
+        problems = (await db.execute(query)).scalars().all()
+        # A shortfall refills the curriculum level nearest the target
+        self._record_fetch((grade_level, topic, nearest_level(target_difficulty)), count, len(problems), started)
+        return problems
+
+    def _record_fetch(self, key: PoolKey, requested: int, served: int, started: float):
+        with self._lock:
+            self.stats["fetches"] += 1
+            self.stats["problems_served"] += served
+            self.stats["total_fetch_time"] += time.perf_counter() - started
+            if served < requested:
+                # This student has nearly exhausted the pool: grow it
+                self.stats["shortfalls"] += 1
+                self._refill_requests.add(key)
+                self._wake.set()
+
+    def count(self, db: Session, key: PoolKey) -> int:
+        grade_level, topic, difficulty = key
+        return (
+            db.query(func.count(MathProblem.id))
+            .filter(
+                MathProblem.topic == topic,
+                MathProblem.grade_level == grade_level,
+                MathProblem.difficulty == DifficultyLevel(difficulty)
+            )
+            .scalar()
+        )
+
+    def refill(self, db: Session, key: PoolKey, amount: int) -> int:
+        """Generate `amount` problems with visuals and insert them in one statement"""
+        grade_level, topic, difficulty = key
+        problems = self.content_generator.generate_problem_batch(
+            grade_level,
+            topic,
+            difficulty,
+            amount,
+            seed=random.getrandbits(32),
+            with_visuals=True
+        )
+        now = datetime.utcnow()
+        rows = [
+            {
+                "topic": problem.topic,
+                "grade_level": problem.grade_level,
+                "difficulty": DifficultyLevel(problem.difficulty.value),
+                "question": problem.question,
+                "correct_answer": str(problem.answer),
+                "solution_steps": problem.solution_steps,
+                "hints": problem.hints,
+                "visual_aid": problem.visual_aids,
+                "created_at": now,
+                "difficulty_rating": LEVEL_DIFFICULTY[difficulty]
+            }
+            for problem in problems
+        ]
+        db.execute(insert(MathProblem), rows)
+        db.commit()
+        with self._lock:
+            self.stats["refills"] += 1
+            self.stats["problems_generated"] += len(rows)
+        return len(rows)
+
+    def check_and_refill(self):
+        """One pass of the filler: top up low pools and those with shortfalls"""
+        with self._lock:
+            requested = set(self._refill_requests)
+            self._refill_requests.clear()
+
+        db = self.session_factory()
+        try:
+            for key in self.pool_keys():
+                size = self.count(db, key)
+                if size < self.low_watermark:
+                    size += self.refill(db, key, self.target_size - size)
+                elif key in requested:
+                    size += self.refill(db, key, self.refill_batch)
+                self.pool_sizes[key] = size
+        except Exception as e:
+            db.rollback()
+            self.stats["refill_errors"] += 1
+            print(f"Error refilling problem pool: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_and_refill()
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="problem-pool-filler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "average_fetch_time": self.stats["total_fetch_time"] / self.stats["fetches"] if self.stats["fetches"] else 0.0,
+                "pool_sizes": {" / ".join(key): size for key, size in self.pool_sizes.items()}
+            }
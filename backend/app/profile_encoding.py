@@ -0,0 +1,308 @@
+"""Student profiles and their dense encoding for batched model input.
+
+`StudentProfile` is what the tutor API passes around per request: lists of
+concept names, an enum and loose floats. `EncodedProfile` holds the same
+information in a fixed-width float vector (continuous fields plus fixed
+integer codes for the categorical ones) and a bitset of mastered concepts in
+which bit i is knowledge graph concept i, so paths can be planned without
+name lookups. Codes and bit positions depend only on the code and the
+graph, never on which profiles a process has seen, so the same profile gets
+the same vector everywhere. `ProfileEncoder.stack_profiles` turns a batch
+into one NumPy matrix.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from .knowledge_graph import MASTERY_THRESHOLD, MIN_ATTEMPTS, KnowledgeGraph
+from .models import Progress, StudentProfile as StudentProfileRow
+
+
+class LearningStyle(Enum):
+    VISUAL = "visual"
+    AUDITORY = "auditory"
+    KINESTHETIC = "kinesthetic"
+    READING_WRITING = "reading_writing"
+
+@dataclass
+class StudentProfile:
+    learning_style: LearningStyle
+    comprehension_level: float
+    attention_span: float
+    preferred_difficulty: str
+    recent_mistakes: List[str]
+    mastered_concepts: List[str]
+    cognitive_load: float
+    emotional_state: str
+    engagement_score: float
+
+
+# Column layout of EncodedProfile.vector; the last three hold integer codes
+VECTOR_FIELDS = (
+    "comprehension_level",
+    "attention_span",
+    "cognitive_load",
+    "engagement_score",
+    "learning_style",
+    "preferred_difficulty",
+    "emotional_state"
+)
+COLUMN = {field: i for i, field in enumerate(VECTOR_FIELDS)}
+LEARNING_STYLES = tuple(LearningStyle)
+STYLE_CODES = {style: i for i, style in enumerate(LEARNING_STYLES)}
+DIFFICULTIES = ("easy", "medium", "hard")
+DIFFICULTY_CODES = {difficulty: i for i, difficulty in enumerate(DIFFICULTIES)}
+# engagement.emotional_state's labels plus the tutor's "focused" default
+EMOTIONAL_STATES = ("neutral", "engaged", "disengaged", "frustrated", "focused")
+EMOTION_CODES = {state: i for i, state in enumerate(EMOTIONAL_STATES)}
+
+# Used where a field is unknown (NaN in the vector); same as the API defaults
+PROFILE_DEFAULTS = {
+    "learning_style": LearningStyle.VISUAL,
+    "comprehension_level": 0.5,
+    "attention_span": 20.0,
+    "preferred_difficulty": "medium",
+    "cognitive_load": 0.5,
+    "emotional_state": "neutral",
+    "engagement_score": 0.5
+}
+
+
+@dataclass(eq=False)
+class EncodedProfile:
+    """A student profile as one float vector, a concept bitset and its recent mistakes"""
+    __slots__ = ("vector", "mastered", "mistakes", "user_id")
+
+    vector: np.ndarray
+    mastered: int
+    # Free text; carried along but not part of the model input
+    mistakes: Tuple[str, ...]
+    user_id: Optional[int]
+
+    @property
+    def learning_style(self) -> LearningStyle:
+        code = self.vector[COLUMN["learning_style"]]
+        return PROFILE_DEFAULTS["learning_style"] if np.isnan(code) else LEARNING_STYLES[int(code)]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, EncodedProfile):
+            return NotImplemented
+        return (
+            self.mastered == other.mastered
+            and self.mistakes == other.mistakes
+            and self.user_id == other.user_id
+            and np.array_equal(self.vector, other.vector, equal_nan=True)
+        )
+
+
+def _field(row, name: str):
+    """Column value from an ORM row or its cached dict snapshot"""
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+
+def _number(value) -> float:
+    return float("nan") if value is None else float(value)
+
+
+def _code(codes: Dict, value) -> float:
+    # Values outside the closed set are treated as missing
+    code = codes.get(value)
+    return float("nan") if code is None else float(code)
+
+
+class ProfileEncoder:
+    """Converts between StudentProfile, ORM rows and EncodedProfile"""
+
+    def __init__(
+        self,
+        graph: Optional[KnowledgeGraph] = None,
+        mastery_threshold: float = MASTERY_THRESHOLD,
+        min_attempts: int = MIN_ATTEMPTS
+    ):
+        # Mastered concepts are graph concepts; other names are ignored
+        self.graph = graph if graph is not None else KnowledgeGraph()
+        self.mastery_threshold = mastery_threshold
+        self.min_attempts = min_attempts
+        self.defaults = self._vector(
+            PROFILE_DEFAULTS["comprehension_level"],
+            PROFILE_DEFAULTS["attention_span"],
+            PROFILE_DEFAULTS["cognitive_load"],
+            PROFILE_DEFAULTS["engagement_score"],
+            PROFILE_DEFAULTS["learning_style"],
+            PROFILE_DEFAULTS["preferred_difficulty"],
+            PROFILE_DEFAULTS["emotional_state"]
+        )
+        self.stats = {"encoded": 0, "decoded": 0, "stacked": 0}
+
+    def _vector(self, comprehension, attention, cognitive_load, engagement, style, difficulty, emotional_state) -> np.ndarray:
+        return np.array([
+            _number(comprehension),
+            _number(attention),
+            _number(cognitive_load),
+            _number(engagement),
+            _code(STYLE_CODES, style),
+            _code(DIFFICULTY_CODES, difficulty),
+            _code(EMOTION_CODES, emotional_state)
+        ])
+
+    def encode(self, profile: StudentProfile, user_id: Optional[int] = None) -> EncodedProfile:
+        self.stats["encoded"] += 1
+        return EncodedProfile(
+            vector=self._vector(
+                profile.comprehension_level,
+                profile.attention_span,
+                profile.cognitive_load,
+                profile.engagement_score,
+                LearningStyle(profile.learning_style),
+                profile.preferred_difficulty,
+                profile.emotional_state
+            ),
+            mastered=self.graph.mask(profile.mastered_concepts),
+            mistakes=tuple(profile.recent_mistakes),
+            user_id=user_id
+        )
+
+    def decode(self, encoded: EncodedProfile) -> StudentProfile:
+        """Unknown fields fall back to PROFILE_DEFAULTS; mastered concepts come back in graph order"""
+        self.stats["decoded"] += 1
+        vector = encoded.vector
+
+        def value(field: str) -> float:
+            number = vector[COLUMN[field]]
+            return PROFILE_DEFAULTS[field] if np.isnan(number) else float(number)
+
+        def label(field: str, labels: Tuple[str, ...]) -> str:
+            code = vector[COLUMN[field]]
+            return PROFILE_DEFAULTS[field] if np.isnan(code) else labels[int(code)]
+
+        return StudentProfile(
+            learning_style=encoded.learning_style,
+            comprehension_level=value("comprehension_level"),
+            attention_span=value("attention_span"),
+            preferred_difficulty=label("preferred_difficulty", DIFFICULTIES),
+            recent_mistakes=list(encoded.mistakes),
+            mastered_concepts=self.graph.concepts_of(encoded.mastered),
+            cognitive_load=value("cognitive_load"),
+            emotional_state=label("emotional_state", EMOTIONAL_STATES),
+            engagement_score=value("engagement_score")
+        )
+
+    def from_orm(self, profile, progress: Sequence = ()) -> EncodedProfile:
+        """Encode a StudentProfile row and the student's Progress rows (or their dict snapshots)
+
+        The row's learning style, engagement score and cognitive load are kept
+        exactly (missing values as NaN, so `to_orm` writes them back unchanged;
+        a style that is not a LearningStyle value is treated as missing).
+        Mastered concepts are topics practised at least `min_attempts` times
+        with mastery at or above the threshold, and comprehension is the mean
+        mastery over all topics; the other fields are not stored in the database.
+        """
+        self.stats["encoded"] += 1
+        mastery = [_field(row, "mastery_level") or 0.0 for row in progress]
+        mastered = self.graph.mask(
+            _field(row, "topic")
+            for row, level in zip(progress, mastery)
+            if self.is_mastered(level, _field(row, "problems_attempted") or 0)
+        )
+        style = _field(profile, "preferred_learning_style")
+        return EncodedProfile(
+            vector=self._vector(
+                float(np.mean(mastery)) if mastery else None,
+                None,
+                _field(profile, "cognitive_load"),
+                _field(profile, "engagement_score"),
+                LearningStyle(style) if style in LearningStyle._value2member_map_ else None,
+                None,
+                None
+            ),
+            mastered=mastered,
+            mistakes=(),
+            user_id=_field(profile, "user_id")
+        )
+
+    @staticmethod
+    def to_orm(encoded: EncodedProfile, profile):
+        """Write the profile-owned fields back onto a StudentProfile row"""
+        vector = encoded.vector
+        style = vector[COLUMN["learning_style"]]
+        profile.preferred_learning_style = None if np.isnan(style) else LEARNING_STYLES[int(style)].value
+        for field in ("engagement_score", "cognitive_load"):
+            value = vector[COLUMN[field]]
+            setattr(profile, field, None if np.isnan(value) else float(value))
+        return profile
+
+    async def load_profiles(self, db, user_ids: Sequence[int]) -> Dict[int, EncodedProfile]:
+        """Encoded profiles for many students with one query per table"""
+        profiles = (await db.execute(
+            select(StudentProfileRow).where(StudentProfileRow.user_id.in_(user_ids))
+        )).scalars().all()
+        progress: Dict[int, List] = {}
+        rows = await db.execute(
+            select(Progress.user_id, Progress.topic, Progress.mastery_level, Progress.problems_attempted)
+            .where(Progress.user_id.in_(user_ids))
+        )
+        for row in rows:
+            progress.setdefault(row.user_id, []).append(row)
+        return {profile.user_id: self.from_orm(profile, progress.get(profile.user_id, ())) for profile in profiles}
+
+    def is_mastered(self, mastery, attempts):
+        """Mastery at or above the threshold over at least min_attempts; works elementwise on arrays"""
+        return (attempts >= self.min_attempts) & (mastery >= self.mastery_threshold)
+
+    def progress_arrays(self, user_ids: Sequence[int], progress: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+        """(students x concepts) mastery levels and attempt counts from Progress rows"""
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        shape = (len(user_ids), len(self.graph.concepts))
+        mastery = np.zeros(shape)
+        attempts = np.zeros(shape, dtype=np.int64)
+        for row in progress:
+            column = self.graph.index.get(_field(row, "topic").lower())
+            if column is not None:
+                mastery[position[_field(row, "user_id")], column] = _field(row, "mastery_level") or 0.0
+                attempts[position[_field(row, "user_id")], column] = _field(row, "problems_attempted") or 0
+        return mastery, attempts
+
+    def mastered_masks(self, mastery: np.ndarray, attempts: np.ndarray) -> List[int]:
+        """One mastered-concept bitset per row of `progress_arrays`"""
+        packed = np.packbits(self.is_mastered(mastery, attempts), axis=1, bitorder="little")
+        return [int.from_bytes(row.tobytes(), "little") for row in packed]
+
+    def known_mask(self, encoded: EncodedProfile) -> int:
+        """Knowledge-graph bitset of mastered concepts and their prerequisites"""
+        return self.graph.with_prerequisites(encoded.mastered)
+
+    def feature_names(self) -> List[str]:
+        return list(VECTOR_FIELDS) + [f"mastered:{name}" for name in self.graph.concepts]
+
+    def stack_profiles(
+        self,
+        profiles: Sequence[EncodedProfile],
+        include_mastery: bool = True,
+        dtype=np.float32
+    ) -> np.ndarray:
+        """(profiles, features) matrix; see `feature_names` for the columns
+
+        Unknown values are filled with the defaults, and mastered concepts are
+        unpacked to one 0/1 column per graph concept.
+        """
+        self.stats["stacked"] += len(profiles)
+        if not profiles:
+            return np.zeros((0, len(self.feature_names()) if include_mastery else len(VECTOR_FIELDS)), dtype=dtype)
+        values = np.vstack([profile.vector for profile in profiles])
+        values = np.where(np.isnan(values), self.defaults, values)
+        if not include_mastery:
+            return values.astype(dtype)
+        width = len(self.graph.concepts)
+        width_bytes = (width + 7) // 8
+        packed = np.frombuffer(
+            b"".join(profile.mastered.to_bytes(width_bytes, "little") for profile in profiles),
+            dtype=np.uint8
+        ).reshape(len(profiles), width_bytes)
+        mastered = np.unpackbits(packed, axis=1, count=width, bitorder="little")
+        return np.hstack([values, mastered]).astype(dtype)
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "concepts": len(self.graph.concepts)}
@@ -0,0 +1,128 @@
+"""Per-topic progress aggregates.
+
+AttemptWriteBuffer keeps each `progress` row current in O(1) per attempt:
+
+* `average_time`  - running mean of time per problem
+* `solve_rate`    - problems_solved / problems_attempted
+* `mastery_level` - exponentially weighted average of correctness, so recent
+                    attempts count most: m <- (1 - alpha) * m + alpha * correct
+
+`rebuild_progress` recomputes the same values from the full attempt history
+in one set-based statement, for backfills or after changing MASTERY_ALPHA:
+
+    python -m app.progress_aggregates rebuild
+"""
+import argparse
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import DateTime, Float, case, cast, func, literal, null, select, union_all
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import AttemptDailySummary, MathProblem, ProblemAttempt, Progress
+
+MASTERY_ALPHA = float(os.getenv("MASTERY_ALPHA", "0.2"))
+
+
+def rebuild_progress(db: Session, user_id: Optional[int] = None, alpha: float = MASTERY_ALPHA) -> int:
+    """Recompute progress rows from attempt history in one INSERT ... SELECT upsert"""
+    recency = func.row_number().over(
+        partition_by=(ProblemAttempt.user_id, MathProblem.topic),
+        order_by=(ProblemAttempt.attempt_date.desc(), ProblemAttempt.id.desc())
+    ).label("recency")
+    ranked = (
+        select(
+            ProblemAttempt.user_id,
+            MathProblem.topic,
+            ProblemAttempt.is_correct,
+            func.coalesce(ProblemAttempt.time_taken, 0.0).label("time_taken"),
+            ProblemAttempt.attempt_date,
+            recency
+        )
+        .join(MathProblem, MathProblem.id == ProblemAttempt.problem_id)
+    )
+    if user_id is not None:
+        ranked = ranked.where(ProblemAttempt.user_id == user_id)
+    ranked = ranked.subquery()
+
+    # The k-th most recent correct attempt contributes alpha * (1 - alpha)^(k - 1)
+    recent = select(
+        ranked.c.user_id,
+        ranked.c.topic,
+        func.sum(case(
+            (ranked.c.is_correct, alpha * func.power(1 - alpha, ranked.c.recency - 1)),
+            else_=0.0
+        )).label("mastery"),
+        func.count().label("attempted"),
+        func.sum(case((ranked.c.is_correct, 1), else_=0)).label("solved"),
+        func.sum(ranked.c.time_taken).label("total_time"),
+        func.max(ranked.c.attempt_date).label("last_attempt")
+    ).group_by(ranked.c.user_id, ranked.c.topic)
+
+    # Months compacted by app.attempt_partitions still count toward the
+    # totals; their weight in the mastery average has long decayed to ~0
+    archived = select(
+        AttemptDailySummary.user_id,
+        AttemptDailySummary.topic,
+        literal(0.0),
+        func.sum(AttemptDailySummary.attempts),
+        func.sum(AttemptDailySummary.solved),
+        func.sum(AttemptDailySummary.total_time),
+        cast(null(), DateTime)
+    ).group_by(AttemptDailySummary.user_id, AttemptDailySummary.topic)
+    if user_id is not None:
+        archived = archived.where(AttemptDailySummary.user_id == user_id)
+    combined = union_all(recent, archived).subquery()
+
+    attempted = func.sum(combined.c.attempted)
+    solved = func.sum(combined.c.solved)
+    aggregates = select(
+        combined.c.user_id,
+        combined.c.topic,
+        cast(func.sum(combined.c.mastery), Float),
+        attempted,
+        solved,
+        cast(solved, Float) / attempted,
+        func.sum(combined.c.total_time) / attempted,
+        func.max(combined.c.last_attempt)
+    ).group_by(combined.c.user_id, combined.c.topic)
+
+    dialect_insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    statement = dialect_insert(Progress).from_select(
+        ["user_id", "topic", "mastery_level", "problems_attempted", "problems_solved",
+         "solve_rate", "average_time", "last_updated"],
+        # SQLite needs a WHERE clause to parse INSERT ... SELECT ... ON CONFLICT
+        aggregates.where(literal(True)) if db.bind.dialect.name == "sqlite" else aggregates
+    )
+    new = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[Progress.user_id, Progress.topic],
+        set_={
+            "mastery_level": new.mastery_level,
+            "problems_attempted": new.problems_attempted,
+            "problems_solved": new.problems_solved,
+            "solve_rate": new.solve_rate,
+            "average_time": new.average_time,
+            "last_updated": new.last_updated
+        }
+    )
+    result = db.execute(statement)
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Progress aggregate maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user-id", type=int, help="Only rebuild one student's rows")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        rows = rebuild_progress(db, args.user_id)
+    print(f"Rebuilt {rows} progress rows in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+
+class ResponseCache:
+    """Two-tier cache for deterministic tutor generations.
+
+    Entries are content-addressed by a hash of everything that determines the
+    output. The in-process LRU tier is always on; the SQLite tier is enabled
+    by passing `disk_path` and survives restarts. Both tiers honour the TTL.
+
+    SQLite is only touched from one dedicated thread, never the event loop.
+    Reads of the disk tier don't write: hits record their access time in
+    memory. Writes and access times are written behind, in batches of one
+    transaction, while callers carry on; `flush` waits for them. The
+    connection is opened on first use, so each process gets its own.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 86400.0,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 100000
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache") if disk_path else None
+        )
+        # Written behind: key -> (value, expires_at, last_access), and key -> last_access
+        self._pending_writes: Dict[str, Tuple[str, float, float]] = {}
+        self._pending_touches: Dict[str, float] = {}
+        self._flushing: Optional[asyncio.Future] = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "writes": 0,
+            "disk_flushes": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0
+        }
+
+    @staticmethod
+    def make_key(
+        model_type: str,
+        prompt: str,
+        generation_kwargs: Dict,
+        model_revision: str
+    ) -> str:
+        """Content address for one generation request"""
+        payload = json.dumps(
+            {
+                "model_type": model_type,
+                "prompt": prompt,
+                "generation_kwargs": generation_kwargs,
+                "model_revision": model_revision
+            },
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Runs on the cache thread only
+        if self._disk is None:
+            self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+            self._disk.commit()
+        return self._disk
+
+    async def _on_disk_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._disk_executor, function, *args)
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self.stats["expired"] += 1
+            pending = self._pending_writes.get(key)
+        if pending is not None and pending[1] > now:
+            value = pending[0]
+        elif self._disk_executor is not None:
+            value = await self._on_disk_thread(self._get_from_disk, key, now)
+        else:
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._pending_touches[key] = now
+            self._put_in_memory(key, value, now + self.ttl_seconds)
+        return value
+
+    def _get_from_disk(self, key: str, now: float) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            # Deleted by the next trim
+            with self._lock:
+                self.stats["expired"] += 1
+            return None
+        return value
+
+    async def set(self, key: str, value: str):
+        """Store in memory now; the disk write happens in the background"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._put_in_memory(key, value, expires_at)
+            self.stats["writes"] += 1
+            if self._disk_executor is None:
+                return
+            self._pending_writes[key] = (value, expires_at, now)
+            self._pending_touches.pop(key, None)
+            if self._flushing is None or self._flushing.done():
+                self._flushing = asyncio.ensure_future(self._flush_pending())
+
+    async def _flush_pending(self):
+        # One batch per pass; writes that arrive meanwhile go in the next
+        while True:
+            with self._lock:
+                writes, self._pending_writes = self._pending_writes, {}
+                touches, self._pending_touches = self._pending_touches, {}
+            if not writes and not touches:
+                return
+            try:
+                await self._on_disk_thread(self._write_batch, writes, touches)
+            except Exception as e:
+                print(f"Error writing response cache to disk: {e}")
+                return
+
+    def _write_batch(self, writes: Dict[str, Tuple[str, float, float]], touches: Dict[str, float]):
+        disk = self._connection()
+        disk.executemany(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            [(key, value, expires_at, accessed) for key, (value, expires_at, accessed) in writes.items()]
+        )
+        disk.executemany(
+            "UPDATE responses SET last_access = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in touches.items()]
+        )
+        with self._lock:
+            self.stats["disk_flushes"] += 1
+            # Counting rows is a table scan, so only trim every so often
+            trim = self.stats["disk_flushes"] % 100 == 0
+        if trim:
+            self._trim_disk(disk)
+        disk.commit()
+
+    def _put_in_memory(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _trim_disk(self, disk: sqlite3.Connection):
+        disk.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        (count,) = disk.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            disk.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            with self._lock:
+                self.stats["disk_evictions"] += overflow
+
+    async def flush(self):
+        """Wait until pending writes and access times are on disk"""
+        if self._flushing is not None:
+            await self._flushing
+        if self._disk_executor is not None:
+            await self._flush_pending()
+
+    async def close(self):
+        await self.flush()
+        if self._disk_executor is not None:
+            if self._disk is not None:
+                await self._on_disk_thread(self._disk.close)
+                self._disk = None
+            self._disk_executor.shutdown(wait=True)
+            self._disk_executor = None
+
+    async def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._pending_writes.clear()
+            self._pending_touches.clear()
+        if self._disk_executor is not None:
+            await self.flush()
+            await self._on_disk_thread(self._clear_disk)
+
+    def _clear_disk(self):
+        disk = self._connection()
+        disk.execute("DELETE FROM responses")
+        disk.commit()
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            return {
+                **self.stats,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "pending_disk_writes": len(self._pending_writes),
+                "disk_enabled": self._disk_executor is not None
+            }
@@ -0,0 +1,148 @@
+"""In-place upgrades for tables created before newer model columns and constraints.
+
+`Base.metadata.create_all` creates missing tables but never alters existing
+ones, so columns, indexes and unique constraints added to a model after its
+table was created are added here. Each step inspects the live schema and
+applies only what is missing, so running them again is a no-op. The app
+runs them at startup after create_all; they can also be run on their own:
+
+    python -m app.schema_upgrades
+"""
+from typing import Callable, List
+
+from sqlalchemy import Float, case, cast, inspect, text
+
+from .models import LEVEL_DIFFICULTY, DifficultyLevel, LearningPath, MathProblem, ProblemAttempt, Progress, StudentProfile
+
+# Serializes upgrades across web workers starting at the same time (Postgres)
+SCHEMA_UPGRADE_LOCK = 0x5C4E3A01
+
+
+def has_unique(conn, table, columns: List[str]) -> bool:
+    """Whether a unique constraint or unique index covers exactly `columns`"""
+    inspector = inspect(conn)
+    uniques = inspector.get_unique_constraints(table.name)
+    uniques += [index for index in inspector.get_indexes(table.name) if index.get("unique")]
+    return any(list(unique["column_names"]) == list(columns) for unique in uniques)
+
+
+def add_missing_columns(conn, table, names: List[str]) -> List[str]:
+    """ALTER TABLE ... ADD COLUMN for model columns the live table lacks; returns the ones added"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"))
+        if column.default is not None and column.default.is_scalar:
+            # Model defaults are applied by the ORM, so fill them in for existing rows
+            conn.execute(table.update().values({name: column.default.arg}))
+        added.append(name)
+    return added
+
+
+def ensure_index(conn, index) -> bool:
+    """CREATE INDEX for a model index the live table lacks"""
+    if index.name in {existing["name"] for existing in inspect(conn).get_indexes(index.table.name)}:
+        return False
+    index.create(conn)
+    return True
+
+
+def ensure_unique(conn, table, name: str, columns: List[str]) -> bool:
+    """Add a unique index backing ON CONFLICT (columns), keeping the newest of any duplicates"""
+    if has_unique(conn, table, columns):
+        return False
+    column_list = ", ".join(columns)
+    duplicates = conn.execute(text(
+        f"DELETE FROM {table.name} WHERE id NOT IN "
+        f"(SELECT MAX(id) FROM {table.name} GROUP BY {column_list})"
+    )).rowcount
+    if duplicates:
+        print(f"Removed {duplicates} duplicate {table.name} rows before adding {name}")
+    conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table.name} ({column_list})"))
+    return True
+
+
+def named_index(table, name: str):
+    return next(index for index in table.indexes if index.name == name)
+
+
+def problem_pool_support(conn) -> bool:
+    # Pre-rendered visuals and the indexes behind GET /problems/next
+    added = add_missing_columns(conn, MathProblem.__table__, ["visual_aid"])
+    pool = ensure_index(conn, named_index(MathProblem.__table__, "idx_problem_pool"))
+    recent = ensure_index(conn, named_index(ProblemAttempt.__table__, "idx_attempt_user_date"))
+    return bool(added) or pool or recent
+
+
+def progress_unique_user_topic(conn) -> bool:
+    # Attempt ingestion upserts ON CONFLICT (user_id, topic). Dropped
+    # duplicates only lose counters: python -m app.progress_aggregates rebuild
+    return ensure_unique(conn, Progress.__table__, "uq_progress_user_topic", ["user_id", "topic"])
+
+
+def progress_solve_rate(conn) -> bool:
+    if not add_missing_columns(conn, Progress.__table__, ["solve_rate"]):
+        return False
+    conn.execute(
+        Progress.__table__.update()
+        .where(Progress.problems_attempted > 0)
+        .values(solve_rate=cast(Progress.problems_solved, Float) / Progress.problems_attempted)
+    )
+    return True
+
+
+def problem_skill_ratings(conn) -> bool:
+    problems = MathProblem.__table__
+    added = add_missing_columns(conn, problems, ["difficulty_rating", "rating_attempts"])
+    if "difficulty_rating" in added:
+        # Unrated problems start from their level's prior, as new ones do
+        conn.execute(problems.update().values(difficulty_rating=case(
+            *[(problems.c.difficulty == DifficultyLevel(level), prior) for level, prior in LEVEL_DIFFICULTY.items()],
+            else_=0.0
+        )))
+    return ensure_index(conn, named_index(problems, "idx_problem_rating")) or bool(added)
+
+
+def learning_path_recommendations(conn) -> bool:
+    added = add_missing_columns(conn, LearningPath.__table__, ["recommended_practice"])
+    # The nightly job upserts ON CONFLICT (user_id); it rewrites every row anyway
+    unique = ensure_unique(conn, LearningPath.__table__, "uq_learning_path_user", ["user_id"])
+    return bool(added) or unique
+
+
+def student_profile_engagement(conn) -> bool:
+    # Existing profiles start from the model default until their next session is scored
+    columns = ["engagement_score", "cognitive_load", "engagement_updated_at"]
+    return bool(add_missing_columns(conn, StudentProfile.__table__, columns))
+
+
+UPGRADES: List[Callable] = [
+    problem_pool_support,
+    progress_unique_user_topic,
+    progress_solve_rate,
+    problem_skill_ratings,
+    learning_path_recommendations,
+    student_profile_engagement,
+]
+
+
+def upgrade_schema(engine) -> List[str]:
+    """Apply every pending upgrade; returns the names of the steps that changed something"""
+    applied = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Held until commit, so concurrent workers run the steps one at a time
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_UPGRADE_LOCK})
+        for step in UPGRADES:
+            if step(conn):
+                applied.append(step.__name__)
+    return applied
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    print(f"Applied schema upgrades: {upgrade_schema(engine) or 'none'}")
@@ -0,0 +1,336 @@
+"""Online skill model for adaptive problem selection.
+
+Students and problems share one logit scale (a 1PL / Rasch model):
+
+    P(correct) = sigmoid(rating - difficulty)
+
+Each attempt nudges both in O(1), Elo-style:
+
+    rating     <- rating     + k(student attempts) * (correct - p)
+    difficulty <- difficulty - k(problem attempts) * (correct - p)
+
+with a step size that shrinks as ratings accumulate evidence. Ratings live
+in `skill_ratings` (one row per student and topic) and difficulties on
+`math_problems`, so choosing problems for a target success probability is an
+indexed lookup instead of a scan of attempt history. AttemptWriteBuffer
+applies the updates as additive upserts inside its flush transaction.
+
+`refit_ratings` re-estimates everything from the attempt table with NumPy
+(regularised joint maximum likelihood), e.g. for a backfill:
+
+    python -m app.skill_model refit
+"""
+import argparse
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import LEVEL_DIFFICULTY, MathProblem, ProblemAttempt, SkillRating, level_difficulty
+
+SKILL_K = float(os.getenv("SKILL_K", "0.4"))
+SKILL_K_MIN = float(os.getenv("SKILL_K_MIN", "0.05"))
+SKILL_K_DECAY = float(os.getenv("SKILL_K_DECAY", "0.05"))
+# Problems are chosen so the student is expected to get this share right
+TARGET_SUCCESS = float(os.getenv("SKILL_TARGET_SUCCESS", "0.7"))
+
+# Keeps multi-row statements well under driver bind-parameter limits
+WRITE_CHUNK_ROWS = 1000
+
+
+def success_probability(rating: float, difficulty: float) -> float:
+    return 1.0 / (1.0 + math.exp(difficulty - rating))
+
+
+def difficulty_for_success(rating: float, target: float = TARGET_SUCCESS) -> float:
+    """Difficulty at which a student with `rating` succeeds with probability `target`"""
+    return rating - math.log(target / (1.0 - target))
+
+
+def nearest_level(difficulty: float) -> str:
+    return min(LEVEL_DIFFICULTY, key=lambda level: abs(LEVEL_DIFFICULTY[level] - difficulty))
+
+
+@dataclass
+class RatingDelta:
+    """Change to one rating folded over the attempts of a flush"""
+    change: float = 0.0
+    attempts: int = 0
+
+
+class SkillModel:
+    """Elo-style updates of student ratings and problem difficulties"""
+
+    def __init__(self, k: float = SKILL_K, k_min: float = SKILL_K_MIN, k_decay: float = SKILL_K_DECAY):
+        self.k = k
+        self.k_min = k_min
+        self.k_decay = k_decay
+        self.stats = {
+            "attempts_rated": 0,
+            "flushes": 0,
+            "total_log_loss": 0.0,
+            "total_update_time": 0.0
+        }
+
+    def step_size(self, attempts: int) -> float:
+        return max(self.k_min, self.k / (1.0 + self.k_decay * attempts))
+
+    def update(
+        self,
+        rating: float,
+        rating_attempts: int,
+        difficulty: float,
+        difficulty_attempts: int,
+        correct: bool
+    ) -> Tuple[float, float]:
+        """New (rating, difficulty) after one attempt"""
+        p = success_probability(rating, difficulty)
+        residual = float(bool(correct)) - p
+        self.stats["attempts_rated"] += 1
+        self.stats["total_log_loss"] -= math.log(max(p if correct else 1.0 - p, 1e-12))
+        return (
+            rating + self.step_size(rating_attempts) * residual,
+            difficulty - self.step_size(difficulty_attempts) * residual
+        )
+
+    def fold(
+        self,
+        records: Iterable,
+        ratings: Dict[Tuple[int, str], Tuple[float, int]],
+        difficulties: Dict[int, Tuple[float, int]]
+    ) -> Tuple[Dict[Tuple[int, str], RatingDelta], Dict[int, RatingDelta]]:
+        """Apply attempts in order to the given (value, attempts) state; returns the changes"""
+        rating_deltas: Dict[Tuple[int, str], RatingDelta] = {}
+        difficulty_deltas: Dict[int, RatingDelta] = {}
+        for record in records:
+            key = (record.user_id, record.topic)
+            rating, rating_attempts = ratings.get(key, (0.0, 0))
+            difficulty, difficulty_attempts = difficulties.get(record.problem_id, (0.0, 0))
+            new_rating, new_difficulty = self.update(
+                rating, rating_attempts, difficulty, difficulty_attempts, record.is_correct
+            )
+            ratings[key] = (new_rating, rating_attempts + 1)
+            difficulties[record.problem_id] = (new_difficulty, difficulty_attempts + 1)
+
+            delta = rating_deltas.setdefault(key, RatingDelta())
+            delta.change += new_rating - rating
+            delta.attempts += 1
+            delta = difficulty_deltas.setdefault(record.problem_id, RatingDelta())
+            delta.change += new_difficulty - difficulty
+            delta.attempts += 1
+        return rating_deltas, difficulty_deltas
+
+    async def apply(self, db, records: List) -> int:
+        """Rate a flush of attempts within the caller's transaction; returns ratings touched"""
+        if not records:
+            return 0
+        started = time.perf_counter()
+        keys = {(record.user_id, record.topic) for record in records}
+        rows = await db.execute(
+            select(SkillRating.user_id, SkillRating.topic, SkillRating.rating, SkillRating.attempts)
+            .where(tuple_(SkillRating.user_id, SkillRating.topic).in_(list(keys)))
+        )
+        ratings = {(row.user_id, row.topic): (row.rating or 0.0, row.attempts or 0) for row in rows}
+        rows = await db.execute(
+            select(MathProblem.id, MathProblem.difficulty, MathProblem.difficulty_rating, MathProblem.rating_attempts)
+            .where(MathProblem.id.in_({record.problem_id for record in records}))
+        )
+        # Rows predating the rating columns start from their level's prior
+        difficulties = {
+            row.id: (
+                row.difficulty_rating if row.difficulty_rating is not None else level_difficulty(row.difficulty),
+                row.rating_attempts or 0
+            )
+            for row in rows
+        }
+        starting = dict(difficulties)
+
+        rating_deltas, difficulty_deltas = self.fold(records, ratings, difficulties)
+        last_attempt = max(record.attempt_date for record in records)
+        await db.execute(self._rating_upsert(db.bind.dialect.name, rating_deltas, last_attempt))
+        params = [
+            {
+                "problem_id": problem_id,
+                "base": starting[problem_id][0],
+                "change": delta.change,
+                "attempts": delta.attempts
+            }
+            for problem_id, delta in difficulty_deltas.items()
+            if problem_id in starting
+        ]
+        if params:
+            await db.execute(self._difficulty_update(), params)
+        self.stats["flushes"] += 1
+        self.stats["total_update_time"] += time.perf_counter() - started
+        return len(rating_deltas)
+
+    @staticmethod
+    def _rating_upsert(dialect: str, deltas: Dict[Tuple[int, str], RatingDelta], last_attempt):
+        """Add each change to the stored rating, so concurrent flushes don't overwrite each other"""
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        statement = dialect_insert(SkillRating).values([
+            {
+                "user_id": user_id,
+                "topic": topic,
+                "rating": delta.change,
+                "attempts": delta.attempts,
+                "last_updated": last_attempt
+            }
+            for (user_id, topic), delta in deltas.items()
+        ])
+        new = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=[SkillRating.user_id, SkillRating.topic],
+            set_={
+                "rating": func.coalesce(SkillRating.rating, 0.0) + new.rating,
+                "attempts": func.coalesce(SkillRating.attempts, 0) + new.attempts,
+                "last_updated": new.last_updated
+            }
+        )
+
+    @staticmethod
+    def _difficulty_update():
+        problems = MathProblem.__table__
+        return (
+            update(problems)
+            .where(problems.c.id == bindparam("problem_id"))
+            .values(
+                difficulty_rating=func.coalesce(problems.c.difficulty_rating, bindparam("base")) + bindparam("change"),
+                rating_attempts=func.coalesce(problems.c.rating_attempts, 0) + bindparam("attempts")
+            )
+        )
+
+    async def get_rating(self, db, user_id: int, topic: str) -> float:
+        """Stored rating of a student in a topic; 0 (an average student) if unrated"""
+        rating = (await db.execute(
+            select(SkillRating.rating).where(SkillRating.user_id == user_id, SkillRating.topic == topic)
+        )).scalar_one_or_none()
+        return rating or 0.0
+
+    def get_stats(self) -> Dict:
+        rated = self.stats["attempts_rated"]
+        flushes = self.stats["flushes"]
+        return {
+            **self.stats,
+            "average_log_loss": self.stats["total_log_loss"] / rated if rated else 0.0,
+            "average_update_time": self.stats["total_update_time"] / flushes if flushes else 0.0
+        }
+
+
+def fit_ratings(
+    students: np.ndarray,
+    problems: np.ndarray,
+    correct: np.ndarray,
+    prior_difficulty: np.ndarray,
+    n_students: int,
+    iterations: int = 30,
+    prior_weight: float = 1.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Regularised joint maximum likelihood of the 1PL model.
+
+    Alternating diagonal Newton steps; every step is a handful of bincounts
+    over the attempt arrays. Ratings are shrunk towards 0 and difficulties
+    towards their level's prior with weight `prior_weight`.
+    """
+    rating = np.zeros(n_students)
+    difficulty = prior_difficulty.astype(float).copy()
+    observed = correct.astype(float)
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(difficulty[problems] - rating[students]))
+        residual, weight = observed - p, p * (1.0 - p)
+        rating += (
+            (np.bincount(students, residual, n_students) - prior_weight * rating)
+            / (np.bincount(students, weight, n_students) + prior_weight)
+        )
+        p = 1.0 / (1.0 + np.exp(difficulty[problems] - rating[students]))
+        residual, weight = observed - p, p * (1.0 - p)
+        difficulty -= (
+            (np.bincount(problems, residual, len(difficulty)) + prior_weight * (difficulty - prior_difficulty))
+            / (np.bincount(problems, weight, len(difficulty)) + prior_weight)
+        )
+    return rating, difficulty
+
+
+def refit_ratings(db: Session, iterations: int = 30, chunk_size: int = 50000) -> Dict:
+    """Re-estimate every rating and difficulty from the attempts still in problem_attempts"""
+    started = time.perf_counter()
+    query = (
+        select(ProblemAttempt.user_id, MathProblem.topic, ProblemAttempt.problem_id,
+               ProblemAttempt.is_correct, MathProblem.difficulty)
+        .join(MathProblem, MathProblem.id == ProblemAttempt.problem_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    student_index: Dict[Tuple[int, str], int] = {}
+    problem_index: Dict[int, int] = {}
+    priors: List[float] = []
+    students, problems, correct = [], [], []
+    for chunk in db.execute(query).partitions(chunk_size):
+        for row in chunk:
+            students.append(student_index.setdefault((row.user_id, row.topic), len(student_index)))
+            if row.problem_id not in problem_index:
+                problem_index[row.problem_id] = len(problem_index)
+                priors.append(level_difficulty(row.difficulty))
+            problems.append(problem_index[row.problem_id])
+            correct.append(bool(row.is_correct))
+    if not students:
+        return {"attempts": 0, "ratings": 0, "problems": 0, "seconds": time.perf_counter() - started}
+
+    students, problems, correct = np.array(students), np.array(problems), np.array(correct)
+    loaded = time.perf_counter()
+    rating, difficulty = fit_ratings(students, problems, correct, np.array(priors), len(student_index), iterations)
+    fitted = time.perf_counter()
+    p = 1.0 / (1.0 + np.exp(difficulty[problems] - rating[students]))
+    log_loss = float(-np.mean(np.log(np.clip(np.where(correct, p, 1.0 - p), 1e-12, None))))
+    rating_attempts = np.bincount(students, minlength=len(student_index))
+    difficulty_attempts = np.bincount(problems, minlength=len(problem_index))
+
+    dialect_insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    rows = [
+        {"user_id": user_id, "topic": topic, "rating": float(rating[i]), "attempts": int(rating_attempts[i])}
+        for (user_id, topic), i in student_index.items()
+    ]
+    for start in range(0, len(rows), WRITE_CHUNK_ROWS):
+        statement = dialect_insert(SkillRating).values(rows[start:start + WRITE_CHUNK_ROWS])
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[SkillRating.user_id, SkillRating.topic],
+            set_={"rating": statement.excluded.rating, "attempts": statement.excluded.attempts}
+        ))
+    problems_table = MathProblem.__table__
+    db.execute(
+        update(problems_table)
+        .where(problems_table.c.id == bindparam("problem_id"))
+        .values(difficulty_rating=bindparam("new_difficulty"), rating_attempts=bindparam("new_attempts")),
+        [
+            {"problem_id": problem_id, "new_difficulty": float(difficulty[i]), "new_attempts": int(difficulty_attempts[i])}
+            for problem_id, i in problem_index.items()
+        ]
+    )
+    db.commit()
+    return {
+        "attempts": len(students),
+        "ratings": len(student_index),
+        "problems": len(problem_index),
+        "log_loss": log_loss,
+        "load_seconds": loaded - started,
+        "fit_seconds": fitted - loaded,
+        "seconds": time.perf_counter() - started
+    }
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Skill model maintenance")
+    parser.add_argument("command", choices=["refit"])
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        print(refit_ratings(db, args.iterations))
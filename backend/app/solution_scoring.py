@@ -0,0 +1,395 @@
+"""Embedding-based solution similarity and misconception detection.
+
+Solutions are embedded in batches into L2-normalised rows, so similarity is
+a dot product. Each topic's known misconceptions are a precomputed matrix
+of exemplar embeddings; labelling a batch is one matrix multiply followed by
+a per-label max. With EMBEDDING_MODEL_PATH set, embeddings are mean-pooled
+hidden states of that (sentence-embedding or tutor) model. Otherwise a
+character n-gram hashing vectoriser is used, which needs no model at all.
+
+Historical attempts can be re-scored offline:
+
+    python -m app.solution_scoring rescore --output scores.csv
+"""
+import argparse
+import csv
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Worked student solutions showing each misconception, written the way
+# `student_work` renders an attempt: the question with its answer filled in
+MISCONCEPTION_EXEMPLARS: Dict[str, Dict[str, List[str]]] = {
+    "Addition": {
+        "forgot_to_carry": [
+            "27 + 15 = 32",
+            "48 + 36 = 74",
+            "59 + 23 = 72",
+            "38 + 47 = 75",
+            "27 + 15 = 312",
+            "48 + 36 = 714"
+        ],
+        "place_value_misalignment": [
+            "23 + 5 = 73",
+            "41 + 7 = 111",
+            "52 + 6 = 112",
+            "34 + 2 = 54"
+        ],
+        "counting_error": [
+            "8 + 5 = 12",
+            "7 + 6 = 12",
+            "9 + 4 = 12",
+            "6 + 7 = 14",
+            "15 + 4 = 18"
+        ]
+    },
+    "Subtraction": {
+        "smaller_from_larger": [
+            "52 - 27 = 35",
+            "41 - 18 = 37",
+            "63 - 29 = 46",
+            "70 - 34 = 44"
+        ],
+        "forgot_to_borrow": [
+            "41 - 18 = 33",
+            "63 - 29 = 44",
+            "70 - 34 = 46",
+            "82 - 45 = 47"
+        ],
+        "added_instead": [
+            "52 - 27 = 79",
+            "41 - 18 = 59",
+            "15 - 6 = 21",
+            "9 - 4 = 13"
+        ]
+    },
+    "Multiplication": {
+        "added_instead": [
+            "6 × 4 = 10",
+            "7 × 3 = 10",
+            "8 × 5 = 13",
+            "9 × 2 = 11"
+        ],
+        "times_table_fact_error": [
+            "7 × 8 = 48",
+            "9 × 6 = 48",
+            "8 × 7 = 63",
+            "6 × 7 = 48"
+        ],
+        "partial_product_error": [
+            "23 × 14 = 115",
+            "32 × 21 = 96",
+            "45 × 12 = 135",
+            "31 × 13 = 124"
+        ]
+    },
+    "Division": {
+        "reversed_operands": [
+            "2 ÷ 8 = 4",
+            "3 ÷ 12 = 4",
+            "5 ÷ 20 = 4",
+            "6 ÷ 18 = 3"
+        ],
+        "multiplied_instead": [
+            "12 ÷ 4 = 48",
+            "15 ÷ 3 = 45",
+            "20 ÷ 5 = 100",
+            "18 ÷ 6 = 108"
+        ],
+        "remainder_confusion": [
+            "17 ÷ 5 = 3",
+            "23 ÷ 4 = 5",
+            "17 ÷ 5 = 3.2",
+            "23 ÷ 4 = 5.3",
+            "29 ÷ 6 = 4.5"
+        ]
+    },
+    "Fractions": {
+        "added_denominators": [
+            "3/4 + 1/2 = 4/6",
+            "1/3 + 1/4 = 2/7",
+            "2/5 + 1/5 = 3/10",
+            "1/2 + 1/2 = 2/4",
+            "2/3 + 1/6 = 3/9"
+        ],
+        "no_common_denominator": [
+            "1/2 + 1/4 = 2/4",
+            "1/3 + 1/6 = 2/6",
+            "3/4 + 1/2 = 4/4",
+            "2/5 + 1/10 = 3/10"
+        ],
+        "whole_number_thinking": [
+            "Which is larger, 1/3 or 1/5? 1/5",
+            "Which is bigger: 1/2 or 1/8? 1/8",
+            "1/4 > 1/3",
+            "1/6 > 1/2"
+        ]
+    },
+    "Decimals": {
+        "misaligned_decimal_point": [
+            "2.5 + 1.25 = 1.50",
+            "3.4 + 1.25 = 1.59",
+            "0.6 + 0.25 = 0.31",
+            "4.2 + 0.15 = 0.57"
+        ],
+        "longer_is_larger": [
+            "Which is larger, 0.5 or 0.45? 0.45",
+            "Which is bigger: 0.7 or 0.65? 0.65",
+            "0.25 > 0.3",
+            "0.125 > 0.5"
+        ],
+        "dropped_decimal_point": [
+            "2.5 + 1.3 = 38",
+            "0.4 + 0.3 = 7",
+            "1.25 + 2.5 = 375",
+            "3.6 + 1.2 = 48"
+        ]
+    }
+}
+
+
+def student_work(question: str, answer: str) -> str:
+    """An attempt written like the exemplars: "3/4 + 1/2 = ?" answered 4/6 is "3/4 + 1/2 = 4/6" """
+    question, answer = str(question or "").strip(), str(answer or "").strip()
+    if question.endswith("= ?"):
+        return f"{question[:-1]}{answer}"
+    if question.endswith("?"):
+        return f"{question} {answer}"
+    return f"{question} = {answer}"
+
+
+class SolutionEncoder:
+    """Embeds texts in batches as L2-normalised float32 rows"""
+
+    def __init__(self, model_path: Optional[str] = None, batch_size: int = 64, n_features: int = 2 ** 12):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.model = None
+        self.tokenizer = None
+        if model_path:
+            self._load_model(model_path)
+        # Character n-grams keep digits and operators, which carry most of the
+        # signal in short arithmetic work
+        self.vectorizer = HashingVectorizer(
+            analyzer="char_wb",
+            ngram_range=(2, 4),
+            n_features=n_features,
+            alternate_sign=False,
+            norm="l2"
+        )
+        self.stats = {"texts_encoded": 0, "batches": 0, "total_encode_time": 0.0}
+
+    @classmethod
+    def from_env(cls) -> "SolutionEncoder":
+        return cls(
+            model_path=os.getenv("EMBEDDING_MODEL_PATH"),
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        )
+
+    def _load_model(self, model_path: str):
+        try:
+            from transformers import AutoModel, AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+            self.model = AutoModel.from_pretrained(model_path)
+            self.model.eval()
+        except Exception as e:
+            print(f"Error loading embedding model {model_path}, using hashed n-grams: {e}")
+            self.model = None
+            self.tokenizer = None
+
+    @property
+    def backend(self) -> str:
+        return "model" if self.model is not None else "hashing"
+
+    def _encode_with_model(self, texts: Sequence[str]) -> np.ndarray:
+        import torch
+
+        rows = []
+        with torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                inputs = self.tokenizer(
+                    list(texts[start:start + self.batch_size]),
+                    padding=True,
+                    truncation=True,
+                    max_length=128,
+                    return_tensors="pt"
+                )
+                hidden = self.model(**inputs).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                rows.append(((hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)).float().numpy())
+        embeddings = np.concatenate(rows).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def encode(self, texts: Sequence[str]):
+        """(n, dimension) rows; a scipy CSR matrix for the hashing backend"""
+        started = time.perf_counter()
+        texts = [str(text or "") for text in texts]
+        if not texts:
+            embeddings = np.zeros((0, self.dimension), dtype=np.float32)
+        elif self.model is not None:
+            embeddings = self._encode_with_model(texts)
+        else:
+            # Left sparse: a row has a few dozen n-grams out of n_features
+            embeddings = self.vectorizer.transform(texts).astype(np.float32)
+        self.stats["texts_encoded"] += len(texts)
+        self.stats["batches"] += 1
+        self.stats["total_encode_time"] += time.perf_counter() - started
+        return embeddings
+
+    @property
+    def dimension(self) -> int:
+        if self.model is not None:
+            return self.model.config.hidden_size
+        return self.vectorizer.n_features
+
+    def similarity(self, texts: Sequence[str], references: Sequence[str]) -> np.ndarray:
+        """Cosine similarity of each text to its reference, clipped to [0, 1]"""
+        embedded = self.encode(list(texts) + list(references))
+        left, right = embedded[:len(texts)], embedded[len(texts):]
+        if sparse.issparse(embedded):
+            products = np.asarray(left.multiply(right).sum(axis=1)).ravel()
+        else:
+            products = np.einsum("ij,ij->i", left, right)
+        return np.clip(products, 0.0, 1.0)
+
+
+class MisconceptionIndex:
+    """Per-topic exemplar matrices for labelling solutions in one multiply"""
+
+    def __init__(
+        self,
+        encoder: SolutionEncoder,
+        exemplars: Optional[Dict[str, Dict[str, List[str]]]] = None,
+        threshold: Optional[float] = None
+    ):
+        self.encoder = encoder
+        self.threshold = threshold if threshold is not None else float(os.getenv("MISCONCEPTION_THRESHOLD", "0.5"))
+        exemplars = exemplars or MISCONCEPTION_EXEMPLARS
+        # topic -> (exemplar matrix, label per row, start column of each label)
+        self.topics: Dict[Optional[str], Tuple[np.ndarray, List[str], np.ndarray]] = {}
+        for topic, labels in exemplars.items():
+            self.topics[topic] = self._build(labels)
+        # Used when the topic is unknown: every topic's exemplars together
+        self.topics[None] = self._build(
+            {f"{topic}:{label}": texts for topic, labels in exemplars.items() for label, texts in labels.items()}
+        )
+
+    def _build(self, labels: Dict[str, List[str]]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        names, texts, starts = [], [], []
+        for label, label_texts in labels.items():
+            names.append(label)
+            starts.append(len(texts))
+            texts.extend(label_texts)
+        matrix = self.encoder.encode(texts)
+        if sparse.issparse(matrix):
+            matrix = matrix.toarray()
+        return matrix, names, np.array(starts)
+
+    def scores(self, texts: Sequence[str], topic: Optional[str] = None) -> Tuple[np.ndarray, List[str]]:
+        """(n_texts, n_labels) best exemplar similarity per label"""
+        matrix, labels, starts = self.topics.get(topic, self.topics[None])
+        similarities = np.asarray(self.encoder.encode(texts) @ matrix.T)
+        return np.maximum.reduceat(similarities, starts, axis=1), labels
+
+    def identify(self, texts: Sequence[str], topic: Optional[str] = None, top_k: int = 3) -> List[List[Dict]]:
+        """Misconceptions above the threshold for each text, best first"""
+        if not texts:
+            return []
+        scores, labels = self.scores(texts, topic)
+        ranked = np.argsort(-scores, axis=1)[:, :top_k]
+        return [
+            [
+                {"misconception": labels[column], "score": float(row_scores[column])}
+                for column in row_ranking
+                if row_scores[column] >= self.threshold
+            ]
+            for row_scores, row_ranking in zip(scores, ranked)
+        ]
+
+
+def score_solutions(
+    index: MisconceptionIndex,
+    student_solutions: Sequence[str],
+    correct_solutions: Sequence[str],
+    topic: Optional[str] = None
+) -> List[Dict]:
+    """Similarity and misconceptions for a batch of solutions of one topic, as `student_work` texts"""
+    similarity = index.encoder.similarity(student_solutions, correct_solutions)
+    misconceptions = index.identify(student_solutions, topic)
+    return [
+        {"similarity_score": float(score), "misconceptions": labels}
+        for score, labels in zip(similarity, misconceptions)
+    ]
+
+
+def rescore_attempts(db, index: MisconceptionIndex, chunk_size: int = 5000, writer=None) -> Dict:
+    """Score every recorded wrong attempt, one chunk and topic at a time"""
+    from sqlalchemy import select
+
+    from .models import MathProblem, ProblemAttempt
+
+    query = (
+        select(
+            ProblemAttempt.id,
+            MathProblem.topic,
+            MathProblem.question,
+            ProblemAttempt.student_answer,
+            MathProblem.correct_answer
+        )
+        .join(MathProblem, MathProblem.id == ProblemAttempt.problem_id)
+        .where(ProblemAttempt.is_correct.is_(False))
+        .execution_options(yield_per=chunk_size)
+    )
+    started = time.perf_counter()
+    scored, label_counts = 0, {}
+    for chunk in db.execute(query).partitions(chunk_size):
+        by_topic: Dict[str, list] = {}
+        for row in chunk:
+            by_topic.setdefault(row.topic, []).append(row)
+        for topic, rows in by_topic.items():
+            results = score_solutions(
+                index,
+                [student_work(row.question, row.student_answer) for row in rows],
+                [student_work(row.question, row.correct_answer) for row in rows],
+                topic if topic in index.topics else None
+            )
+            for row, result in zip(rows, results):
+                labels = [item["misconception"] for item in result["misconceptions"]]
+                for label in labels:
+                    label_counts[label] = label_counts.get(label, 0) + 1
+                if writer is not None:
+                    writer.writerow([row.id, topic, f"{result['similarity_score']:.4f}", ";".join(labels)])
+            scored += len(rows)
+    elapsed = time.perf_counter() - started
+    return {
+        "attempts_scored": scored,
+        "seconds": elapsed,
+        "attempts_per_second": scored / elapsed if elapsed else 0.0,
+        "misconceptions": label_counts
+    }
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Offline solution scoring")
+    parser.add_argument("command", choices=["rescore"])
+    parser.add_argument("--output", help="CSV of attempt_id, topic, similarity, misconceptions")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    index = MisconceptionIndex(SolutionEncoder.from_env())
+    with SessionLocal() as db:
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                writer = csv.writer(output)
+                writer.writerow(["attempt_id", "topic", "similarity_score", "misconceptions"])
+                report = rescore_attempts(db, index, args.chunk_size, writer)
+        else:
+            report = rescore_attempts(db, index, args.chunk_size)
+    print(report)
@@ -0,0 +1,125 @@
+import threading
+from typing import Callable, Dict, Optional
+
+import torch
+import torch.nn as nn
+from transformers import DynamicCache
+
+from .kv_cache import crop_to
+
+
+class SpeculativeDecoder:
+    """Greedy speculative decoding with a small draft model.
+
+    The draft proposes `num_draft_tokens` tokens, the target scores all of
+    them in a single forward pass, and the longest prefix the target agrees
+    with is kept plus the target's own next token. The result is the target's
+    greedy output; only the number of target forward passes changes.
+    """
+
+    def __init__(
+        self,
+        draft_provider: Callable[[], Optional[nn.Module]],
+        num_draft_tokens: int = 4
+    ):
+        self.draft_provider = draft_provider
+        self.num_draft_tokens = num_draft_tokens
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def is_available(self) -> bool:
+        return self.draft_provider() is not None
+
+    @staticmethod
+    def _forward(model: nn.Module, token_ids: torch.Tensor, cache: DynamicCache) -> torch.Tensor:
+        return model(input_ids=token_ids, past_key_values=cache, use_cache=True).logits
+
+    def generate(
+        self,
+        target: nn.Module,
+        input_ids: torch.Tensor,
+        max_new_tokens: int,
+        eos_token_id: Optional[int] = None,
+        model_type: str = "default"
+    ) -> torch.Tensor:
+        """Generate for a single sequence; returns prompt plus new tokens"""
+        draft = self.draft_provider()
+        if draft is None:
+            raise RuntimeError("Draft model is not available")
+        if input_ids.shape[0] != 1:
+            raise ValueError("Speculative decoding runs one sequence at a time")
+
+        device = target.device
+        tokens = input_ids[0].tolist()
+        prompt_length = len(tokens)
+        target_cache, draft_cache = DynamicCache(), DynamicCache()
+        target_cached = draft_cached = 0
+        drafted = accepted = target_passes = 0
+
+        with torch.no_grad():
+            while len(tokens) - prompt_length < max_new_tokens:
+                budget = max_new_tokens - (len(tokens) - prompt_length)
+                k = min(self.num_draft_tokens, budget)
+
+                # Draft k tokens greedily, feeding whatever the draft cache lacks
+                proposal = []
+                pending = tokens[draft_cached:]
+                for _ in range(k):
+                    logits = self._forward(draft, torch.tensor([pending], device=draft.device), draft_cache)
+                    next_token = int(logits[0, -1].argmax())
+                    proposal.append(next_token)
+                    pending = [next_token]
+                    if next_token == eos_token_id:
+                        break
+
+                # Verify every proposed token with one target pass
+                candidate = tokens[target_cached:] + proposal
+                logits = self._forward(target, torch.tensor([candidate], device=device), target_cache)
+                target_passes += 1
+                predictions = logits[0, -(len(proposal) + 1):].argmax(dim=-1).tolist()
+
+                matched = 0
+                while matched < len(proposal) and proposal[matched] == predictions[matched]:
+                    matched += 1
+                new_tokens = proposal[:matched] + [predictions[matched]]
+                drafted += len(proposal)
+                accepted += matched
+
+                # Roll both caches back to the verified prefix
+                target_cached = len(tokens) + matched
+                draft_cached = len(tokens) + min(matched, len(proposal) - 1)
+                crop_to(target_cache, target_cached)
+                crop_to(draft_cache, draft_cached)
+
+                new_tokens = new_tokens[:budget]
+                if eos_token_id is not None and eos_token_id in new_tokens:
+                    tokens.extend(new_tokens[:new_tokens.index(eos_token_id) + 1])
+                    break
+                tokens.extend(new_tokens)
+
+        self._record(model_type, drafted, accepted, target_passes, len(tokens) - prompt_length)
+        return torch.tensor([tokens], device=input_ids.device)
+
+    def _record(self, model_type: str, drafted: int, accepted: int, target_passes: int, generated: int):
+        with self._lock:
+            stats = self.stats.setdefault(
+                model_type,
+                {"sequences": 0, "drafted_tokens": 0, "accepted_tokens": 0, "target_passes": 0, "generated_tokens": 0}
+            )
+            stats["sequences"] += 1
+            stats["drafted_tokens"] += drafted
+            stats["accepted_tokens"] += accepted
+            stats["target_passes"] += target_passes
+            stats["generated_tokens"] += generated
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per model_type acceptance rate and tokens per target pass"""
+        with self._lock:
+            return {
+                model_type: {
+                    **stats,
+                    "acceptance_rate": stats["accepted_tokens"] / stats["drafted_tokens"] if stats["drafted_tokens"] else 0.0,
+                    "tokens_per_target_pass": stats["generated_tokens"] / stats["target_passes"] if stats["target_passes"] else 0.0
+                }
+                for model_type, stats in self.stats.items()
+            }
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+
+class AsyncTokenStreamer(BaseStreamer):
+    """Forwards token ids from a `generate` worker thread to an asyncio queue.
+
+    Decoding is left to the consumer on the event loop thread, which keeps
+    the shared tokenizer off the generation thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, skip_prompt: bool = True):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.skip_prompt = skip_prompt
+        self._prompt_seen = False
+
+    def put(self, value: torch.Tensor):
+        # The first call carries the prompt ids
+        if self.skip_prompt and not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        token_ids = value.reshape(-1).tolist()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, token_ids)
+
+    def end(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def fail(self, error: Exception):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, error)
+
+
+class CancelGeneration(StoppingCriteria):
+    """Stops `generate` once the consumer has gone away"""
+
+    def __init__(self, cancelled: threading.Event):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class IncrementalDecoder:
+    """Turns a growing list of token ids into printable text deltas"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token_ids: List[int] = []
+        self.emitted = 0
+
+    def push(self, token_ids: List[int]) -> str:
+        self.token_ids.extend(token_ids)
+        text = self.tokenizer.decode(self.token_ids, skip_special_tokens=True)
+        # Hold back a trailing partial word or an incomplete multi-byte character
+        if text.endswith("�"):
+            return ""
+        boundary = max(text.rfind(" "), text.rfind("\n")) + 1
+        return self._emit(text, boundary)
+
+    def flush(self) -> str:
+        text = self.tokenizer.decode(self.token_ids, skip_special_tokens=True)
+        return self._emit(text, len(text))
+
+    def _emit(self, text: str, until: int) -> str:
+        if until <= self.emitted:
+            return ""
+        delta = text[self.emitted:until]
+        self.emitted = until
+        return delta
+
+
+async def stream_generation(
+    model_provider: Callable[[], Optional[nn.Module]],
+    tokenizer,
+    executor: Executor,
+    prompt: str,
+    generation_kwargs: Optional[Dict] = None
+) -> AsyncIterator[str]:
+    """Run `generate` on a worker thread and yield decoded text as it is produced"""
+    loop = asyncio.get_running_loop()
+    streamer = AsyncTokenStreamer(loop)
+    cancelled = threading.Event()
+    inputs = tokenizer(prompt, return_tensors="pt")
+
+    def generate():
+        try:
+            model = model_provider()
+            if model is None:
+                raise RuntimeError("Model is not available")
+            with torch.no_grad():
+                model.generate(
+                    **inputs.to(model.device),
+                    pad_token_id=tokenizer.pad_token_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([CancelGeneration(cancelled)]),
+                    **(generation_kwargs or {"max_length": 512})
+                )
+        except Exception as e:
+            streamer.fail(e)
+
+    loop.run_in_executor(executor, generate)
+    decoder = IncrementalDecoder(tokenizer)
+    try:
+        while True:
+            item = await streamer.queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            delta = decoder.push(item)
+            if delta:
+                yield delta
+        tail = decoder.flush()
+        if tail:
+            yield tail
+    finally:
+        # Frees the worker thread early when the client disconnects mid-stream
+        cancelled.set()
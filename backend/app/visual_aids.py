@@ -0,0 +1,214 @@
+import asyncio
+import base64
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle, Polygon, Rectangle, RegularPolygon, Wedge
+
+SHAPES = [
+    "square", "rectangle", "triangle", "circle", "parallelogram",
+    "rhombus", "trapezoid", "pentagon", "hexagon"
+]
+
+VisualKey = Tuple[str, Tuple[str, ...], Optional[str]]
+
+
+def visual_key(problem) -> VisualKey:
+    """Everything a rendered visual depends on: topic, operands and shape"""
+    question = problem.question.lower()
+    shape = next((name for name in SHAPES if name in question), None) if problem.topic == "Geometry" else None
+    operands = tuple(re.findall(r"\d+(?:\.\d+)?", question)) if problem.topic in DRAWERS else ()
+    return problem.topic, operands, shape
+
+
+def _draw_counters(ax, counts: List[int]):
+    colors = ["tab:blue", "tab:orange", "tab:green"]
+    for row, count in enumerate(counts):
+        for i in range(count):
+            ax.add_patch(Circle((i % 10 + 0.5, -(row * 3 + i // 10) - 0.5), 0.35, color=colors[row % len(colors)]))
+    ax.set_xlim(0, 10)
+    ax.set_ylim(-(len(counts) * 3), 0)
+
+
+def _draw_addition_visual(ax, operands: Tuple[str, ...], shape: Optional[str]):
+    _draw_counters(ax, [min(int(float(value)), 50) for value in operands])
+
+
+def _draw_multiplication_visual(ax, operands: Tuple[str, ...], shape: Optional[str]):
+    rows, cols = (min(int(float(value)), 15) for value in operands[:2])
+    for r in range(rows):
+        for c in range(cols):
+            ax.add_patch(Circle((c + 0.5, -r - 0.5), 0.35, color="tab:blue"))
+    ax.set_xlim(0, max(cols, 1))
+    ax.set_ylim(-max(rows, 1), 0)
+
+
+def _draw_fraction_circle(ax, x: float, shaded: int, denominator: int):
+    step = 360.0 / denominator
+    for i in range(denominator):
+        ax.add_patch(Wedge((x, 0), 1, i * step, (i + 1) * step, facecolor="tab:orange" if i < shaded else "white", edgecolor="black"))
+
+
+def _draw_fraction_visual(ax, operands: Tuple[str, ...], shape: Optional[str]):
+    # Operands come in numerator/denominator pairs, e.g. 1/5 + 2/5 -> 1, 5, 2, 5
+    numbers = [int(float(value)) for value in operands]
+    fractions = [(numbers[i], max(numbers[i + 1], 1)) for i in range(0, len(numbers) - 1, 2)]
+    if not fractions:
+        circles = [(0, 1)]
+    elif len({denominator for _, denominator in fractions}) == 1:
+        # Same denominator: the sum, as whole circles of that many pieces
+        denominator = fractions[0][1]
+        total = min(sum(numerator for numerator, _ in fractions), 4 * denominator)
+        circles = [(min(total - start, denominator), denominator) for start in range(0, max(total, 1), denominator)]
+    else:
+        # Different denominators have no common picture; show each fraction
+        circles = fractions
+    for index, (shaded, denominator) in enumerate(circles):
+        _draw_fraction_circle(ax, index * 2.5, shaded, denominator)
+    ax.set_xlim(-1.2, (len(circles) - 1) * 2.5 + 1.2)
+    ax.set_ylim(-1.2, 1.2)
+
+
+def _draw_geometry_visual(ax, operands: Tuple[str, ...], shape: Optional[str]):
+    patches = {
+        "square": lambda: Rectangle((-1, -1), 2, 2),
+        "rectangle": lambda: Rectangle((-1.5, -1), 3, 2),
+        "triangle": lambda: Polygon([(-1, -1), (1, -1), (0, 1)]),
+        "circle": lambda: Circle((0, 0), 1),
+        "parallelogram": lambda: Polygon([(-1.5, -1), (1, -1), (1.5, 1), (-1, 1)]),
+        "rhombus": lambda: Polygon([(0, -1.2), (1, 0), (0, 1.2), (-1, 0)]),
+        "trapezoid": lambda: Polygon([(-1.5, -1), (1.5, -1), (0.8, 1), (-0.8, 1)]),
+        "pentagon": lambda: RegularPolygon((0, 0), 5, radius=1.2),
+        "hexagon": lambda: RegularPolygon((0, 0), 6, radius=1.2)
+    }
+    if shape in patches:
+        patch = patches[shape]()
+        patch.set_facecolor("lightblue")
+        patch.set_edgecolor("black")
+        ax.add_patch(patch)
+    ax.set_xlim(-2, 2)
+    ax.set_ylim(-2, 2)
+
+
+DRAWERS = {
+    "Addition": _draw_addition_visual,
+    "Multiplication": _draw_multiplication_visual,
+    "Fractions": _draw_fraction_visual,
+    "Geometry": _draw_geometry_visual
+}
+
+
+def render_visual(key: VisualKey) -> Tuple[str, float]:
+    """Render one visual to a base64 PNG; returns the image and render seconds.
+
+    Uses a standalone Figure on the Agg canvas rather than pyplot, so no
+    global figure registry is involved and nothing is left open.
+    """
+    started = time.perf_counter()
+    topic, operands, shape = key
+    figure = Figure(figsize=(8, 6))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    if topic in DRAWERS:
+        DRAWERS[topic](ax, operands, shape)
+        ax.set_aspect("equal")
+        ax.axis("off")
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    figure.clear()
+    return base64.b64encode(buffer.getvalue()).decode(), time.perf_counter() - started
+
+
+class VisualAidGenerator:
+    """Renders problem visuals in a bounded process pool behind an LRU cache"""
+
+    def __init__(self, max_workers: Optional[int] = None, cache_size: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("VISUAL_RENDER_WORKERS", "2"))
+        self.cache_size = cache_size or int(os.getenv("VISUAL_CACHE_SIZE", "2048"))
+        self._cache: "OrderedDict[VisualKey, str]" = OrderedDict()
+        self._pending: Dict[VisualKey, Future] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"hits": 0, "misses": 0, "renders": 0, "total_render_time": 0.0, "evictions": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def _submit(self, key: VisualKey) -> Future:
+        """Cached image as a completed future, or the (shared) pending render"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                future = Future()
+                future.set_result(self._cache[key])
+                return future
+            self.stats["misses"] += 1
+            if key in self._pending:
+                return self._pending[key]
+
+            result = Future()
+            render = self._get_pool().submit(render_visual, key)
+            self._pending[key] = result
+
+        render.add_done_callback(lambda done: self._finish(key, done, result))
+        return result
+
+    def _finish(self, key: VisualKey, render: Future, result: Future):
+        try:
+            image, elapsed = render.result()
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            result.set_exception(e)
+            return
+        with self._lock:
+            self._pending.pop(key, None)
+            self._cache[key] = image
+            self.stats["renders"] += 1
+            self.stats["total_render_time"] += elapsed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.stats["evictions"] += 1
+        result.set_result(image)
+
+    def generate_visual(self, problem) -> str:
+        return self._submit(visual_key(problem)).result()
+
+    async def generate_visual_async(self, problem) -> str:
+        """Render without blocking the event loop"""
+        return await asyncio.wrap_future(self._submit(visual_key(problem)))
+
+    def generate_visuals(self, problems: List) -> List[str]:
+        """Render many problems in parallel, each distinct visual only once"""
+        futures = [self._submit(visual_key(problem)) for problem in problems]
+        return [future.result() for future in futures]
+
+    def get_stats(self) -> Dict:
+        """Render time and cache hit rate"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "average_render_time": self.stats["total_render_time"] / self.stats["renders"] if self.stats["renders"] else 0.0,
+                "cached_visuals": len(self._cache)
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -1,18 +1,33 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
+from datetime import datetime
 import os
-import jwt
+import json
+import asyncio
 from dotenv import load_dotenv
 
 # Import our modules
-from app.database import get_db, engine
-from app.models import Base, User  # Make sure to import User model
-from app.ai_tutor_core import AdvancedMathTutorAI
-from app.content_generation import ContentGenerator
+from app.database import get_db, get_async_db, engine, SessionLocal, AsyncSessionLocal
+from app.models import Base, User, MathProblem, ParentTeacherLink  # Make sure to import User model
+from app.ai_tutor_core import AdvancedMathTutorAI, LearningStyle, StudentProfile
+from app.inference_workers import RemoteTutor
+from app.content_generation import AdvancedContentGenerator
+from app.problem_pool import ProblemPool
+from app.attempt_ingestion import AttemptRecord, AttemptWriteBuffer
+from app.attempt_partitions import AttemptPartitionMaintainer
+from app.schema_upgrades import upgrade_schema
+from app.identity_cache import IdentityCache, make_backend
+from app.answer_checker import check_answer
+from app.auth import HashingBusy, InvalidToken, PasswordHasher, TokenVerifier, make_revocation_store
+from app.skill_model import SkillModel, difficulty_for_success, success_probability
+from app.engagement import EngagementTracker, make_session_store
 
 # Load environment variables
 load_dotenv()
@@ -36,49 +51,266 @@ app.add_middleware(
 # Initialize OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Initialize AI components
+# Upper bound on items per batch request (problems, answers or hints)
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "100"))
+MAX_ENGAGEMENT_EVENTS = int(os.getenv("MAX_ENGAGEMENT_EVENTS", "500"))
+
+# Initialize AI components; with INFERENCE_SOCKET set, generation runs in the
+# shared inference worker processes instead of loading models in this one
 try:
-    ai_tutor = AdvancedMathTutorAI()
-    content_generator = ContentGenerator(ai_tutor)
+    if os.getenv("INFERENCE_SOCKET"):
+        ai_tutor = RemoteTutor(os.getenv("INFERENCE_SOCKET"))
+    else:
+        ai_tutor = AdvancedMathTutorAI()
 except Exception as e:
+    ai_tutor = None
     print(f"Error initializing AI components: {e}")
 
+# Template-based problems don't need the tutor, so the pool runs without it
+content_generator = AdvancedContentGenerator(ai_tutor)
+problem_pool = ProblemPool(
+    content_generator,
+    SessionLocal,
+    target_size=int(os.getenv("PROBLEM_POOL_TARGET", "500")),
+    low_watermark=int(os.getenv("PROBLEM_POOL_LOW_WATERMARK", "100"))
+)
+
+# Identity lookups (user, profile, progress) served from cache; IDENTITY_CACHE_URL selects Redis
+identity_cache = IdentityCache(
+    make_backend(),
+    AsyncSessionLocal,
+    ttl_seconds=float(os.getenv("IDENTITY_CACHE_TTL", "300"))
+)
+identity_cache.install()
+
+# Login hashing off the event loop; verified tokens cached by signature.
+# Revocations live in the database (or TOKEN_REVOCATION_URL's Redis) so a
+# logout holds in every worker
+password_hasher = PasswordHasher()
+token_verifier = TokenVerifier(os.getenv("SECRET_KEY"), make_revocation_store(AsyncSessionLocal))
+
+# Online skill ratings, updated with each flush of attempts
+skill_model = SkillModel()
+
+# Answer submissions are written in batches; "sync" durability makes each
+# request wait until its attempt has been committed
+attempt_buffer = AttemptWriteBuffer(
+    AsyncSessionLocal,
+    max_rows=int(os.getenv("ATTEMPT_FLUSH_ROWS", "500")),
+    flush_interval_ms=float(os.getenv("ATTEMPT_FLUSH_MS", "200")),
+    durability=os.getenv("ATTEMPT_DURABILITY", "buffered"),
+    on_progress_updated=identity_cache.invalidate_progress,
+    skill_model=skill_model,
+    max_pending=int(os.getenv("ATTEMPT_MAX_PENDING", "50000")),
+    # Rows that cannot be written; replay with python -m app.attempt_ingestion
+    dead_letter_path=os.getenv("ATTEMPT_DEAD_LETTER_PATH", "attempt_dead_letters.jsonl")
+)
+
+# Session telemetry aggregated in sliding windows; profiles' engagement_score
+# and cognitive_load are rewritten at most every ENGAGEMENT_UPDATE_SECONDS.
+# With more than one web worker, ENGAGEMENT_STORE_URL must point at Redis
+ENGAGEMENT_SESSION_TIMEOUT = float(os.getenv("ENGAGEMENT_SESSION_TIMEOUT", "1800"))
+engagement_tracker = EngagementTracker(
+    AsyncSessionLocal,
+    window_seconds=float(os.getenv("ENGAGEMENT_WINDOW_SECONDS", "120")),
+    update_interval=float(os.getenv("ENGAGEMENT_UPDATE_SECONDS", "5")),
+    session_timeout=ENGAGEMENT_SESSION_TIMEOUT,
+    store=make_session_store(
+        session_timeout=ENGAGEMENT_SESSION_TIMEOUT,
+        max_sessions_per_user=int(os.getenv("ENGAGEMENT_MAX_SESSIONS_PER_USER", "5"))
+    ),
+    on_profiles_updated=identity_cache.invalidate_profiles
+)
+
+# Request Schemas
+class StudentProfileIn(BaseModel):
+    learning_style: LearningStyle = LearningStyle.VISUAL
+    comprehension_level: float = 0.5
+    attention_span: float = 20.0
+    preferred_difficulty: str = "medium"
+    recent_mistakes: List[str] = []
+    mastered_concepts: List[str] = []
+    cognitive_load: float = 0.5
+    emotional_state: str = "neutral"
+    engagement_score: float = 0.5
+
+    def to_profile(self) -> StudentProfile:
+        return StudentProfile(**self.dict())
+
+class AnswerSubmission(BaseModel):
+    answer: str
+    time_taken: float = 0.0
+    hints_used: int = 0
+    # Have the assessment model explain a wrong answer
+    explain: bool = False
+    student_profile: StudentProfileIn = StudentProfileIn()
+
+class BatchAnswer(BaseModel):
+    problem_id: int
+    answer: str
+    time_taken: float = 0.0
+    hints_used: int = 0
+
+class BatchProblemsRequest(BaseModel):
+    problem_ids: List[int]
+
+class BatchCheckRequest(BaseModel):
+    answers: List[BatchAnswer]
+    # Ask the tutor for a hint on every wrong answer
+    feedback: bool = False
+    student_profile: StudentProfileIn = StudentProfileIn()
+
+class BatchHintItem(BaseModel):
+    problem_id: int
+    previous_hints: List[str] = []
+
+class BatchHintRequest(BaseModel):
+    hints: List[BatchHintItem]
+    student_profile: StudentProfileIn = StudentProfileIn()
+
+class EngagementEvent(BaseModel):
+    type: str
+    timestamp: Optional[float] = None  # Unix seconds; server time if missing or skewed
+
+class EngagementBatch(BaseModel):
+    session_id: str
+    events: List[EngagementEvent]
+
+class ExplanationRequest(BaseModel):
+    concept: str
+    student_profile: StudentProfileIn = StudentProfileIn()
+
+class HintRequest(BaseModel):
+    problem: str
+    student_profile: StudentProfileIn = StudentProfileIn()
+    previous_hints: List[str] = []
+
 # Helper Functions
-def verify_credentials(username: str, password: str, db: Session) -> bool:
+async def verify_credentials(username: str, password: str) -> bool:
     try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
+        # Password hashes are never cached; logins are rare enough to read them directly
+        async with AsyncSessionLocal() as db:
+            hashed_password = (await db.execute(
+                select(User.hashed_password).where(User.username == username)
+            )).scalar_one_or_none()
+        if hashed_password is None:
             return False
-        return user.verify_password(password)  # Implement this method in your User model
+        return await password_hasher.verify(password, hashed_password)
+    except HashingBusy:
+        raise HTTPException(status_code=503, detail="Too many login attempts, try again shortly")
     except Exception as e:
         print(f"Error verifying credentials: {e}")
         return False
 
 def create_access_token(username: str) -> str:
     try:
-        to_encode = {"sub": username, "exp": datetime.utcnow() + timedelta(days=1)}
-        return jwt.encode(to_encode, os.getenv("SECRET_KEY"), algorithm="HS256")
+        return token_verifier.create_token(username)
     except Exception as e:
         print(f"Error creating access token: {e}")
         raise HTTPException(status_code=500, detail="Could not create access token")
 
-def get_student_progress(student_id: int, db: Session) -> dict:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    """Cached user row for the request's bearer token"""
     try:
-        # Implement your progress retrieval logic
-        progress = db.query(Progress).filter(Progress.student_id == student_id).all()
-        return {"progress": [p.to_dict() for p in progress]}
+        claims = await token_verifier.verify(token)
+    except InvalidToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    user = await identity_cache.get_user(claims["sub"])
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unknown user")
+    return user
+
+async def is_linked_to_student(user: dict, student_id: int) -> bool:
+    """Whether a parent or teacher has a ParentTeacherLink to this student"""
+    if user["role"] not in ("parent", "teacher"):
+        return False
+    async with AsyncSessionLocal() as db:
+        link = (await db.execute(
+            select(ParentTeacherLink.id).where(
+                ParentTeacherLink.parent_id == user["id"],
+                ParentTeacherLink.student_id == student_id
+            )
+        )).first()
+    return link is not None
+
+async def get_student_progress(student_id: int) -> dict:
+    try:
+        # Aggregates are maintained on write; a cache miss is one read on (user_id, topic)
+        return {"progress": await identity_cache.get_progress(student_id)}
     except Exception as e:
         print(f"Error getting progress: {e}")
         raise HTTPException(status_code=500, detail="Could not retrieve progress")
 
+async def load_problems(db: AsyncSession, problem_ids: List[int]) -> dict:
+    """Every requested problem in one query, keyed by id"""
+    if len(problem_ids) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+    result = await db.execute(select(MathProblem).where(MathProblem.id.in_(set(problem_ids))))
+    return {problem.id: problem for problem in result.scalars()}
+
+def problem_to_dict(problem: MathProblem) -> dict:
+    return {
+        "id": problem.id,
+        "question": problem.question,
+        "topic": problem.topic,
+        "grade_level": problem.grade_level,
+        "difficulty": problem.difficulty.value,
+        "hints": problem.hints,
+        "visual_aid": problem.visual_aid
+    }
+
+async def ndjson_lines(results: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """One JSON object per line, sent as soon as each result is ready"""
+    async for result in results:
+        yield json.dumps(result, default=str) + "\n"
+
+async def batch_response(results: AsyncIterator[dict], key: str, stream: bool):
+    if stream:
+        return StreamingResponse(ndjson_lines(results), media_type="application/x-ndjson")
+    return {key: [result async for result in results]}
+
+async def tutor_hint(question: str, profile: StudentProfile, previous_hints: Optional[List[str]] = None) -> dict:
+    try:
+        hint = await ai_tutor.provide_hint(question, profile, previous_hints)
+        return {"hint": hint["hint"], "hint_level": hint["hint_level"]}
+    except Exception as e:
+        print(f"Error generating hint: {e}")
+        return {"hint": None, "error": "hint_unavailable"}
+
+async def completed(coroutines: list, ordered: bool) -> AsyncIterator[dict]:
+    """
+    Run tutor calls concurrently, so the scheduler batches them into shared
+    forward passes. Yields in request order, or as each finishes when streaming.
+    """
+    if ordered:
+        for result in await asyncio.gather(*coroutines):
+            yield result
+    else:
+        for next_done in asyncio.as_completed(coroutines):
+            yield await next_done
+
+async def server_sent_events(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Wrap streamed text chunks as SSE messages, ending with a `done` event"""
+    try:
+        async for chunk in chunks:
+            yield f"data: {json.dumps({'text': chunk})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        print(f"Error streaming tutor response: {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': 'Generation failed'})}\n\n"
+
 # Keep your existing routes, but add error handling...
 
 # Health Check with database check
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     try:
         # Test database connection
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         return {
             "status": "healthy",
             "database": "connected",
@@ -94,12 +326,290 @@ async def health_check(db: Session = Depends(get_db)):
             "version": "1.0.0"
         }
 
-# Create database tables
+# Authentication
+@app.post("/token")
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    if not await verify_credentials(form_data.username, form_data.password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return {"access_token": create_access_token(form_data.username), "token_type": "bearer"}
+
+@app.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme)):
+    try:
+        await token_verifier.revoke(token)
+    except InvalidToken:
+        pass
+    return {"status": "logged out"}
+
+@app.get("/metrics/auth")
+async def auth_metrics():
+    return {"tokens": token_verifier.get_stats(), "password_hashing": password_hasher.get_stats()}
+
+# Problems served from the pre-generated pool
+@app.get("/problems/next")
+async def next_problems(
+    grade_level: str,
+    topic: str,
+    difficulty: str = "medium",
+    count: int = 5,
+    adaptive: bool = False,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        if adaptive:
+            # Pick by skill rating instead of the requested level
+            rating = await skill_model.get_rating(db, current_user["id"], topic)
+            problems = await problem_pool.fetch_targeted_async(
+                db, current_user["id"], grade_level, topic, difficulty_for_success(rating), count
+            )
+        else:
+            problems = await problem_pool.fetch_unseen_async(db, current_user["id"], grade_level, topic, difficulty, count)
+        results = [problem_to_dict(problem) for problem in problems]
+        if adaptive:
+            for result, problem in zip(results, problems):
+                result["predicted_success"] = success_probability(rating, problem.difficulty_rating or 0.0)
+        return {"problems": results}
+    except Exception as e:
+        print(f"Error fetching problems: {e}")
+        raise HTTPException(status_code=500, detail="Could not retrieve problems")
+
+# Worksheet batches: one query for all problems, optionally streamed as NDJSON
+@app.post("/problems/batch")
+async def problems_batch(
+    request: BatchProblemsRequest,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    problems = await load_problems(db, request.problem_ids)
+
+    async def results():
+        for problem_id in request.problem_ids:
+            problem = problems.get(problem_id)
+            yield problem_to_dict(problem) if problem else {"id": problem_id, "error": "not_found"}
+
+    return await batch_response(results(), "problems", stream)
+
+@app.post("/problems/batch/check")
+async def check_answers_batch(
+    request: BatchCheckRequest,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    problems = await load_problems(db, [item.problem_id for item in request.answers])
+    graded, records = [], []
+    for item in request.answers:
+        problem = problems.get(item.problem_id)
+        if problem is None:
+            graded.append({"problem_id": item.problem_id, "error": "not_found"})
+            continue
+        is_correct = check_answer(item.answer, problem.correct_answer).is_correct
+        graded.append({"problem_id": problem.id, "is_correct": is_correct, "solution_steps": problem.solution_steps})
+        records.append(AttemptRecord(
+            user_id=current_user["id"],
+            problem_id=problem.id,
+            topic=problem.topic,
+            student_answer=item.answer,
+            is_correct=is_correct,
+            time_taken=item.time_taken,
+            hints_used=item.hints_used
+        ))
+    await attempt_buffer.add_many(records)
+
+    async def with_feedback(result: dict) -> dict:
+        if not request.feedback or result.get("is_correct") is not False:
+            return result
+        question = problems[result["problem_id"]].question
+        return {**result, "feedback": await tutor_hint(question, request.student_profile.to_profile())}
+
+    return await batch_response(
+        completed([with_feedback(result) for result in graded], ordered=not stream),
+        "results",
+        stream
+    )
+
+@app.post("/problems/batch/hints")
+async def hints_batch(
+    request: BatchHintRequest,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    problems = await load_problems(db, [item.problem_id for item in request.hints])
+    profile = request.student_profile.to_profile()
+
+    async def hint_for(item: BatchHintItem) -> dict:
+        problem = problems.get(item.problem_id)
+        if problem is None:
+            return {"problem_id": item.problem_id, "error": "not_found"}
+        return {"problem_id": problem.id, **await tutor_hint(problem.question, profile, item.previous_hints)}
+
+    return await batch_response(
+        completed([hint_for(item) for item in request.hints], ordered=not stream),
+        "hints",
+        stream
+    )
+
+@app.post("/problems/{problem_id}/check")
+async def check_problem_answer(
+    problem_id: int,
+    submission: AnswerSubmission,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    problem = await db.get(MathProblem, problem_id)
+    if problem is None:
+        raise HTTPException(status_code=404, detail="Problem not found")
+
+    check = check_answer(submission.answer, problem.correct_answer)
+    is_correct = check.is_correct
+    await attempt_buffer.add(AttemptRecord(
+        user_id=current_user["id"],
+        problem_id=problem.id,
+        topic=problem.topic,
+        student_answer=submission.answer,
+        is_correct=is_correct,
+        time_taken=submission.time_taken,
+        hints_used=submission.hints_used
+    ))
+    result = {
+        "problem_id": problem.id,
+        "is_correct": is_correct,
+        "solution_steps": problem.solution_steps,
+        "check": check.to_dict()
+    }
+    if submission.explain and not is_correct:
+        try:
+            assessment = await ai_tutor.assess_solution(
+                problem.question,
+                submission.answer,
+                problem.correct_answer,
+                submission.student_profile.to_profile(),
+                explain_mistakes=True,
+                topic=problem.topic
+            )
+            result["explanation"] = assessment["detailed_feedback"]
+            result["misconceptions"] = assessment["misconceptions"]
+        except Exception as e:
+            print(f"Error explaining answer: {e}")
+            result["explanation"] = None
+    return result
+
+@app.get("/students/{user_id}/progress")
+async def student_progress(user_id: int, current_user: dict = Depends(get_current_user)):
+    # Students see their own progress; parents and teachers only that of linked students
+    if current_user["id"] != user_id and not await is_linked_to_student(current_user, user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to view this student")
+    return await get_student_progress(user_id)
+
+# Engagement telemetry: cheap to ingest, scored in batches off the request path
+@app.post("/engagement/events")
+async def ingest_engagement_events(batch: EngagementBatch, current_user: dict = Depends(get_current_user)):
+    if len(batch.events) > MAX_ENGAGEMENT_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_ENGAGEMENT_EVENTS} events per batch")
+    accepted = await engagement_tracker.ingest(current_user["id"], batch.session_id, [event.dict() for event in batch.events])
+    return {"accepted": accepted, "rejected": len(batch.events) - accepted}
+
+@app.get("/engagement/sessions/{session_id}")
+async def engagement_snapshot(session_id: str, current_user: dict = Depends(get_current_user)):
+    snapshot = await engagement_tracker.snapshot(current_user["id"], session_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return snapshot
+
+@app.get("/metrics/engagement")
+async def engagement_metrics():
+    return engagement_tracker.get_stats()
+
+@app.get("/metrics/attempts")
+async def attempt_metrics():
+    return attempt_buffer.get_stats()
+
+@app.get("/metrics/skill-model")
+async def skill_model_metrics():
+    return skill_model.get_stats()
+
+@app.get("/metrics/identity-cache")
+async def identity_cache_metrics():
+    return identity_cache.get_stats()
+
+@app.get("/metrics/attempt-partitions")
+async def attempt_partition_metrics():
+    return partition_maintainer.get_stats()
+
+@app.get("/metrics/problem-pool")
+async def problem_pool_metrics():
+    return problem_pool.get_stats()
+
+# Streaming tutor endpoints
+@app.post("/tutor/explanation/stream")
+async def stream_explanation(request: ExplanationRequest):
+    return StreamingResponse(
+        server_sent_events(
+            ai_tutor.stream_explanation(request.concept, request.student_profile.to_profile())
+        ),
+        media_type="text/event-stream"
+    )
+
+@app.post("/tutor/hint/stream")
+async def stream_hint(request: HintRequest):
+    return StreamingResponse(
+        server_sent_events(
+            ai_tutor.stream_hint(
+                request.problem,
+                request.student_profile.to_profile(),
+                request.previous_hints
+            )
+        ),
+        media_type="text/event-stream"
+    )
+
+# Inference metrics
+@app.get("/metrics/inference")
+async def inference_metrics():
+    try:
+        return await ai_tutor.get_inference_stats()
+    except Exception as e:
+        print(f"Error getting inference metrics: {e}")
+        raise HTTPException(status_code=503, detail="AI tutor is not available")
+
+# Create database tables, then bring tables that predate newer columns and
+# constraints up to date (create_all never alters existing tables)
 try:
     Base.metadata.create_all(bind=engine)
+    applied = upgrade_schema(engine)
+    if applied:
+        print(f"Applied schema upgrades: {', '.join(applied)}")
 except Exception as e:
     print(f"Error creating database tables: {e}")
 
+# Monthly problem_attempts partitions and rollup of expired months
+partition_maintainer = AttemptPartitionMaintainer(engine)
+
+@app.on_event("startup")
+async def start_background_workers():
+    attempt_buffer.start()
+    engagement_tracker.start()
+    partition_maintainer.start()
+    problem_pool.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    # Flush buffered attempts before the process exits
+    await attempt_buffer.stop()
+    await engagement_tracker.stop()
+    partition_maintainer.stop()
+    problem_pool.stop()
+    if isinstance(ai_tutor, AdvancedMathTutorAI):
+        # Response cache entries are written to disk behind the requests
+        await ai_tutor.response_cache.close()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -0,0 +1,51 @@
+"""Test setup: a throwaway SQLite database behind both the sync and async engines.
+
+Run from backend/:
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import types
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before app.database creates its engines
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("IDENTITY_CACHE_URL", None)
+
+# app/__init__.py builds the legacy standalone API (app.routes is not part of
+# this tree); the modules under test only need `app` as a package path
+if "app" not in sys.modules:
+    package = types.ModuleType("app")
+    package.__path__ = [os.path.join(BACKEND_DIR, "app")]
+    sys.modules["app"] = package
+
+from app.database import async_engine, engine  # noqa: E402
+from app.models import Base  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop, closing the async connections it opened"""
+    def runner(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return runner
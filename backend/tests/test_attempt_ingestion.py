@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app.attempt_ingestion import AttemptRecord, AttemptWriteBuffer, load_dead_letters
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import DifficultyLevel, MathProblem, ProblemAttempt, Progress, User
+
+
+@pytest.fixture
+def student():
+    with SessionLocal() as db:
+        db.add(User(id=1, username="ann", email="ann@example.com", hashed_password="x"))
+        db.add(MathProblem(
+            id=1, question="2 + 2 = ?", correct_answer="4", topic="Addition",
+            difficulty=DifficultyLevel.EASY, grade_level="Grade 1"
+        ))
+        db.commit()
+    return 1
+
+
+def attempts(results, start=datetime(2026, 1, 5, 10, 0)):
+    return [
+        AttemptRecord(
+            user_id=1, problem_id=1, topic="Addition", student_answer="4" if correct else "5",
+            is_correct=correct, time_taken=float(10 + i), attempt_date=start + timedelta(minutes=i)
+        )
+        for i, correct in enumerate(results)
+    ]
+
+
+def test_flushes_upsert_one_progress_row(run, student):
+    updated = []
+
+    async def on_progress_updated(user_ids):
+        updated.append(user_ids)
+
+    async def scenario():
+        buffer = AttemptWriteBuffer(AsyncSessionLocal, on_progress_updated=on_progress_updated)
+        # No background flusher: each add writes through
+        await buffer.add_many(attempts([True, False, True]))
+        await buffer.add_many(attempts([True, True], start=datetime(2026, 1, 6, 10, 0)))
+        return buffer.get_stats()
+
+    stats = run(scenario())
+
+    times = [10.0, 11.0, 12.0, 10.0, 11.0]
+    with SessionLocal() as db:
+        progress = db.execute(select(Progress)).scalars().all()
+        assert db.execute(select(func.count()).select_from(ProblemAttempt)).scalar() == 5
+    assert len(progress) == 1
+    row = progress[0]
+    assert (row.user_id, row.topic) == (student, "Addition")
+    assert (row.problems_attempted, row.problems_solved) == (5, 4)
+    assert row.average_time == pytest.approx(sum(times) / len(times))
+    assert updated == [[student], [student]]
+    assert stats["attempts_written"] == 5 and stats["progress_upserts"] == 2
+
+
+def test_a_bad_row_is_dead_lettered_and_the_rest_written(run, student, tmp_path):
+    path = str(tmp_path / "dead.jsonl")
+    records = attempts([True, True, False, True, True])
+    # NOT NULL violation, like an attempt with no partition to land in
+    records[2].attempt_date = None
+
+    async def scenario():
+        buffer = AttemptWriteBuffer(AsyncSessionLocal, dead_letter_path=path)
+        await buffer.add_many(records)
+        return buffer
+
+    buffer = run(scenario())
+    assert buffer.stats["attempts_written"] == 4
+    assert buffer.stats["attempts_dead_lettered"] == 1
+    assert not buffer._pending
+    dead = load_dead_letters(path)
+    assert [record.time_taken for record in dead] == [12.0]
+    with SessionLocal() as db:
+        assert db.execute(select(Progress.problems_attempted)).scalar() == 4
+
+
+def unreachable():
+    raise OperationalError("connect", {}, ConnectionRefusedError("database is down"))
+
+
+def test_unreachable_database_keeps_a_bounded_backlog(run, student, tmp_path):
+    path = str(tmp_path / "dead.jsonl")
+
+    async def scenario():
+        buffer = AttemptWriteBuffer(unreachable, max_rows=1, max_pending=3, dead_letter_path=path)
+        await buffer.add_many(attempts([True] * 5))
+        pending = [record.time_taken for record, _ in buffer._pending]
+        # Kept rows retry until shutdown, then go to disk too
+        await buffer.stop()
+        return buffer, pending
+
+    buffer, pending = run(scenario())
+    assert pending == [12.0, 13.0, 14.0]
+    assert not buffer._pending
+    assert buffer.stats["attempts_dead_lettered"] == 5
+    assert [record.time_taken for record in load_dead_letters(path)] == [10.0, 11.0, 12.0, 13.0, 14.0]
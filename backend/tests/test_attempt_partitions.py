@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.attempt_partitions import AttemptPartitionMaintainer
+from app.database import SessionLocal, engine
+from app.models import AttemptDailySummary, DifficultyLevel, MathProblem, ProblemAttempt, User
+
+
+def test_expired_months_are_rolled_up():
+    with SessionLocal() as db:
+        db.add(User(id=1, username="ann", email="ann@example.com", hashed_password="x"))
+        db.add(MathProblem(
+            id=1, question="2 + 2 = ?", correct_answer="4", topic="Addition",
+            difficulty=DifficultyLevel.EASY, grade_level="Grade 1"
+        ))
+        for day, hour, correct in [(3, 9, True), (3, 10, False), (20, 9, True)]:
+            db.add(ProblemAttempt(
+                user_id=1, problem_id=1, student_answer="4", is_correct=correct,
+                time_taken=10.0, attempt_date=datetime(2025, 1, day, hour, 0)
+            ))
+        db.add(ProblemAttempt(
+            user_id=1, problem_id=1, student_answer="4", is_correct=True,
+            time_taken=10.0, attempt_date=datetime(2026, 9, 1, 9, 0)
+        ))
+        db.commit()
+
+    maintainer = AttemptPartitionMaintainer(engine, retention_months=12)
+    assert maintainer.compact(now=datetime(2026, 10, 18)) == 3
+
+    with SessionLocal() as db:
+        assert db.execute(select(func.count()).select_from(ProblemAttempt)).scalar() == 1
+        summaries = db.execute(
+            select(AttemptDailySummary.attempts, AttemptDailySummary.solved).order_by(AttemptDailySummary.day)
+        ).all()
+    assert [tuple(row) for row in summaries] == [(2, 1), (1, 1)]
+
+
+def test_runs_are_skipped_while_another_process_maintains():
+    maintainer = AttemptPartitionMaintainer(engine)
+
+    @contextmanager
+    def held_elsewhere():
+        yield False
+
+    maintainer.maintenance_lock = held_elsewhere
+    assert maintainer.run_once() is False
+    assert maintainer.get_stats()["maintenance_skipped"] == 1
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+from sqlalchemy import select
+
+from app.auth import DatabaseRevocationStore, InvalidToken, RedisRevocationStore, TokenVerifier
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import RevokedToken
+
+SECRET = "test-secret-of-at-least-thirty-two-bytes"
+
+
+@pytest.fixture(params=["database", "redis"])
+def revocations(request):
+    if request.param == "database":
+        return DatabaseRevocationStore(AsyncSessionLocal)
+    return RedisRevocationStore(fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer()))
+
+
+def test_logout_holds_in_every_worker(run, revocations):
+    # Two verifiers sharing one store stand in for two web workers
+    first, second = TokenVerifier(SECRET, revocations), TokenVerifier(SECRET, revocations)
+    token = first.create_token("ann")
+
+    async def scenario():
+        # Both workers have the claims cached before the logout
+        await first.verify(token)
+        await second.verify(token)
+        await first.revoke(token)
+        with pytest.raises(InvalidToken):
+            await second.verify(token)
+        with pytest.raises(InvalidToken):
+            await first.verify(token)
+
+    run(scenario())
+    assert second.stats["revoked"] == 1
+
+
+def test_expired_revocations_are_purged(run):
+    store = DatabaseRevocationStore(AsyncSessionLocal)
+
+    async def scenario():
+        await store.revoke("old", datetime.utcnow() - timedelta(minutes=1))
+        await store.revoke("current", datetime.utcnow() + timedelta(hours=1))
+
+    run(scenario())
+    with SessionLocal() as db:
+        assert db.execute(select(RevokedToken.jti)).scalars().all() == ["current"]
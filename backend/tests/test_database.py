@@ -0,0 +1,34 @@
+from sqlalchemy import select, text
+
+from app import database
+from app.database import SessionLocal, get_async_db, to_async_url
+from app.models import User
+
+
+def test_get_async_db_yields_a_working_session(run):
+    async def scenario():
+        sessions = get_async_db()
+        db = await sessions.__anext__()
+        assert (await db.execute(text("SELECT 1"))).scalar() == 1
+        db.add(User(username="ann", email="ann@example.com", hashed_password="x"))
+        await db.commit()
+        await sessions.aclose()
+
+    run(scenario())
+    with SessionLocal() as db:
+        assert db.execute(select(User.username)).scalars().all() == ["ann"]
+
+
+def test_async_url_mapping():
+    assert to_async_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert to_async_url("postgres://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert to_async_url("sqlite:////tmp/app.db") == "sqlite+aiosqlite:////tmp/app.db"
+
+
+def test_sync_and_async_pools_share_one_budget(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("DB_MAX_CONNECTIONS", "40")
+    monkeypatch.setenv("DB_SYNC_CONNECTIONS", "3")
+    sync_pool, async_pool = database.sync_pool_settings(), database.async_pool_settings()
+    assert sync_pool == {"pool_size": 2, "max_overflow": 1}
+    assert sum(sync_pool.values()) + sum(async_pool.values()) == 10
@@ -0,0 +1,86 @@
+import time
+
+import fakeredis
+import pytest
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.engagement import EngagementModel, EngagementTracker, MemorySessionStore, RedisSessionStore
+from app.models import StudentProfile, User
+
+
+@pytest.fixture
+def students():
+    with SessionLocal() as db:
+        for user_id in (1, 2):
+            db.add(User(id=user_id, username=f"s{user_id}", email=f"s{user_id}@example.com", hashed_password="x"))
+            db.add(StudentProfile(user_id=user_id))
+        db.commit()
+    return [1, 2]
+
+
+def events(count=6):
+    now = time.time()
+    kinds = ["answer_correct", "hint", "answer_wrong", "interaction"]
+    return [{"type": kinds[i % len(kinds)], "timestamp": now - count + i} for i in range(count)]
+
+
+def tracker(store):
+    return EngagementTracker(AsyncSessionLocal, model=EngagementModel(), update_interval=60.0, store=store)
+
+
+def redis_store(server, **kwargs):
+    return RedisSessionStore(fakeredis.FakeAsyncRedis(server=server), **kwargs)
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_sessions_beyond_the_cap_are_dropped(run, shared):
+    store = redis_store(fakeredis.FakeServer(), max_sessions_per_user=2) if shared else MemorySessionStore(2)
+    engagement = tracker(store)
+
+    async def scenario():
+        for session_id in ("a", "b", "c"):
+            await engagement.ingest(1, session_id, events())
+        return [await engagement.snapshot(1, session_id) for session_id in ("a", "b", "c")]
+
+    a, b, c = run(scenario())
+    assert a is None and b is not None and c is not None
+    assert engagement.stats["sessions_dropped"] == 1
+
+
+def test_workers_share_sessions_and_write_each_once(run, students):
+    server = fakeredis.FakeServer()
+    first, second = tracker(redis_store(server)), tracker(redis_store(server))
+
+    async def scenario():
+        await first.ingest(1, "tab", events())
+        await second.ingest(2, "tab", events())
+        snapshot = await second.snapshot(1, "tab")
+        written = [await first.flush(), await second.flush()]
+        # Within the update interval nobody writes again
+        await second.ingest(1, "tab", events(2))
+        written += [await first.flush(), await second.flush()]
+        return snapshot, written
+
+    snapshot, written = run(scenario())
+    assert snapshot is not None and 0.0 <= snapshot["attention_level"] <= 1.0
+    assert written == [2, 0, 0, 0]
+    with SessionLocal() as db:
+        updated = db.execute(select(StudentProfile.engagement_updated_at)).scalars().all()
+    assert all(updated)
+
+
+def test_failed_writes_are_retried(run, students):
+    engagement = tracker(redis_store(fakeredis.FakeServer()))
+
+    def unreachable():
+        raise OSError("database is down")
+
+    async def scenario():
+        await engagement.ingest(1, "tab", events())
+        engagement.session_factory = unreachable
+        failed = await engagement.flush()
+        engagement.session_factory = AsyncSessionLocal
+        return failed, await engagement.flush()
+
+    assert run(scenario()) == (0, 1)
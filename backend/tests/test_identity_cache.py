@@ -0,0 +1,138 @@
+import asyncio
+
+import fakeredis
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database import AsyncSessionLocal, SessionLocal, engine
+from app.identity_cache import IdentityCache, LocalCacheBackend, RedisCacheBackend
+from app.models import User
+
+
+def redis_backend(server):
+    return RedisCacheBackend(fakeredis.FakeAsyncRedis(server=server), fakeredis.FakeRedis(server=server))
+
+
+@pytest.fixture
+def user():
+    with SessionLocal() as db:
+        db.add(User(id=1, username="ann", email="ann@example.com", hashed_password="bcrypt-hash"))
+        db.commit()
+    return "ann"
+
+
+@pytest.fixture(params=["local", "redis"])
+def cache(request):
+    backend = LocalCacheBackend() if request.param == "local" else redis_backend(fakeredis.FakeServer())
+    cache = IdentityCache(backend, AsyncSessionLocal)
+    uninstall = cache.install()
+    yield cache
+    uninstall()
+
+
+def test_user_snapshot_leaves_out_the_password_hash(run, cache, user):
+    async def scenario():
+        cached = await cache.get_user(user)
+        return cached, await cache.backend.get(cache.user_key(user))
+
+    cached, raw = run(scenario())
+    assert cached["email"] == "ann@example.com"
+    assert "hashed_password" not in cached
+    assert "bcrypt-hash" not in raw
+
+
+def test_async_commit_invalidates_the_user(run, cache, user):
+    async def scenario():
+        await cache.get_user(user)
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(select(User).where(User.username == user))).scalar_one()
+            row.email = "new@example.com"
+            await db.commit()
+        # Remote deletes are deferred to a task; let it run
+        await asyncio.sleep(0.01)
+        return await cache.get_user(user)
+
+    assert run(scenario())["email"] == "new@example.com"
+    assert cache.stats["loads"] == 2
+
+
+def test_sync_commit_on_a_worker_thread_invalidates_the_user(run, cache, user):
+    def rename():
+        with Session(engine) as db:
+            db.execute(select(User)).scalar_one().email = "thread@example.com"
+            db.commit()
+
+    async def scenario():
+        await cache.get_user(user)
+        await asyncio.get_running_loop().run_in_executor(None, rename)
+        await asyncio.sleep(0.01)
+        return await cache.get_user(user)
+
+    assert run(scenario())["email"] == "thread@example.com"
+
+
+def test_invalidate_async_for_progress(run, cache):
+    async def scenario():
+        assert await cache.get_progress(1) == []
+        await cache.invalidate_progress([1, 1])
+        return await cache.backend.get(cache.progress_key(1))
+
+    assert run(scenario()) is None
+    assert cache.stats["invalidations"] == 1
+
+
+def test_fill_racing_an_invalidation_is_not_cached(run, cache):
+    release = asyncio.Event()
+
+    async def slow_load(db):
+        await release.wait()
+        return {"value": "read before the commit"}
+
+    async def scenario():
+        fill = asyncio.ensure_future(cache._read_through("key", slow_load))
+        await asyncio.sleep(0.01)
+        await cache.invalidate_async(["key"])
+        release.set()
+        value = await fill
+        return value, await cache.backend.get("key")
+
+    value, cached = run(scenario())
+    assert value == {"value": "read before the commit"}
+    assert cached is None
+    assert cache.stats["stale_fills_skipped"] == 1
+    # Only in-flight keys are tracked
+    assert not cache._stale
+
+
+def test_invalidation_from_another_process_blocks_a_stale_fill(run):
+    server = fakeredis.FakeServer()
+    filling, committing = IdentityCache(redis_backend(server), AsyncSessionLocal), IdentityCache(redis_backend(server), AsyncSessionLocal)
+    release = asyncio.Event()
+
+    async def slow_load(db):
+        await release.wait()
+        return {"value": "read before the commit"}
+
+    async def scenario():
+        fill = asyncio.ensure_future(filling._read_through("key", slow_load))
+        await asyncio.sleep(0.01)
+        await committing.invalidate_async(["key"])
+        release.set()
+        await fill
+        return await filling.backend.get("key")
+
+    assert run(scenario()) is None
+    assert filling.stats["stale_fills_skipped"] == 1
+
+
+def test_invalidations_do_not_accumulate_state(run, cache):
+    async def scenario():
+        for i in range(1000):
+            cache.invalidate([f"key:{i}"])
+        await asyncio.sleep(0.05)
+
+    run(scenario())
+    assert not cache._stale
+    assert not cache._pending_deletes
+    assert cache.stats["backend_errors"] == 0
@@ -0,0 +1,21 @@
+from app.curriculum import practisable_topics
+from app.knowledge_graph import KnowledgeGraph, practisable_prerequisites
+
+
+def test_planner_only_has_practisable_topics():
+    graph = KnowledgeGraph()
+    assert sorted(graph.concepts) == sorted(practisable_topics())
+    # Division needs Times Tables, which needs Multiplication
+    assert sorted(graph.prerequisites_of("Division")) == ["Multiplication", "Subtraction"]
+
+
+def test_paths_never_wait_on_concepts_without_problems():
+    graph = KnowledgeGraph()
+    # Grade 3 goals for a student who has mastered Multiplication
+    path = graph.learning_path(["Multiplication"], ["Addition", "Subtraction", "Multiplication", "Division"])
+    assert path == ["Subtraction", "Division"]
+
+
+def test_looking_through_missing_concepts():
+    prerequisites = {"A": [], "hidden": ["A"], "deeper": ["hidden"], "B": ["deeper", "A"]}
+    assert practisable_prerequisites(prerequisites, ["A", "B"]) == {"A": [], "B": ["A"]}
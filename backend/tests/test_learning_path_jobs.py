@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from app.curriculum import practisable_topics
+from app.learning_path_jobs import LearningPathJob
+
+
+def progress(user_id, topic, mastery, attempts=10):
+    return SimpleNamespace(user_id=user_id, topic=topic, mastery_level=mastery, problems_attempted=attempts)
+
+
+def test_every_planned_topic_can_be_practised():
+    job = LearningPathJob(session_factory=None)
+    students = [
+        SimpleNamespace(id=1, grade_level="Grade 3"),
+        SimpleNamespace(id=2, grade_level="Grade 4"),
+        SimpleNamespace(id=3, grade_level=None)
+    ]
+    rows = job.plan_chunk(students, [progress(1, "Multiplication", 0.95), progress(2, "Addition", 0.9)], [])
+
+    topics = set(practisable_topics())
+    assert rows[0]["current_topic"] == "Subtraction"
+    for row in rows:
+        assert row["current_topic"] in topics
+        assert set(row["next_topics"]) <= topics
+        assert {item["topic"] for item in row["recommended_practice"]} <= topics
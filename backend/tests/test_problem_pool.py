@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from app.database import SessionLocal
+from app.models import DifficultyLevel, MathProblem, ProblemAttempt, User
+from app.problem_pool import ProblemPool
+
+
+def test_recent_attempts_are_skipped_and_null_problem_ids_ignored():
+    with SessionLocal() as db:
+        db.add(User(id=1, username="ann", email="ann@example.com", hashed_password="x"))
+        for problem_id in (1, 2, 3):
+            db.add(MathProblem(
+                id=problem_id, question=f"{problem_id} + 1 = ?", correct_answer=str(problem_id + 1),
+                topic="Addition", difficulty=DifficultyLevel.EASY, grade_level="Grade 1"
+            ))
+        db.add(ProblemAttempt(user_id=1, problem_id=2, student_answer="3", is_correct=True, attempt_date=datetime.utcnow()))
+        # An attempt whose problem was never recorded
+        db.add(ProblemAttempt(user_id=1, problem_id=None, student_answer="?", is_correct=False, attempt_date=datetime.utcnow()))
+        db.commit()
+
+        pool = ProblemPool(content_generator=None, session_factory=SessionLocal)
+        problems = pool.fetch_unseen(db, 1, "Grade 1", "Addition", "easy", count=5)
+
+    assert sorted(problem.id for problem in problems) == [1, 3]
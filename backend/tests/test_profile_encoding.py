@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.profile_encoding import LearningStyle, ProfileEncoder, StudentProfile
+
+
+def profile(**fields):
+    values = dict(
+        learning_style=LearningStyle.VISUAL,
+        comprehension_level=0.6,
+        attention_span=0.7,
+        preferred_difficulty="hard",
+        recent_mistakes=["forgot to carry the one"],
+        mastered_concepts=["Addition", "Subtraction"],
+        cognitive_load=0.4,
+        emotional_state="frustrated",
+        engagement_score=0.8
+    )
+    values.update(fields)
+    return StudentProfile(**values)
+
+
+def test_codes_do_not_depend_on_what_was_seen_first():
+    first, second = ProfileEncoder(), ProfileEncoder()
+    first.encode(profile(preferred_difficulty="easy", emotional_state="engaged"))
+
+    a, b = first.encode(profile()), second.encode(profile())
+    assert np.array_equal(a.vector, b.vector)
+    assert a.mastered == b.mastered
+
+
+def test_free_text_does_not_widen_the_matrix():
+    encoder = ProfileEncoder()
+    width = encoder.stack_profiles([encoder.encode(profile())]).shape[1]
+
+    odd = encoder.encode(profile(
+        preferred_difficulty="extreme",
+        emotional_state="hungry",
+        recent_mistakes=[f"mistake {i}" for i in range(50)],
+        mastered_concepts=["Addition", "Underwater Basket Weaving"]
+    ))
+
+    assert encoder.stack_profiles([odd]).shape[1] == width == len(encoder.feature_names())
+    assert np.isnan(odd.vector[5]) and np.isnan(odd.vector[6])
+    assert encoder.decode(odd).mastered_concepts == ["Addition"]
+
+
+def test_round_trip():
+    encoder = ProfileEncoder()
+    original = profile()
+
+    assert encoder.decode(encoder.encode(original)) == original
+
+
+def test_progress_masks_match_per_profile_encoding():
+    encoder = ProfileEncoder(min_attempts=3)
+    progress = [
+        SimpleNamespace(user_id=1, topic="Addition", mastery_level=0.9, problems_attempted=5),
+        SimpleNamespace(user_id=1, topic="Fractions", mastery_level=0.9, problems_attempted=2),
+        SimpleNamespace(user_id=2, topic="Subtraction", mastery_level=0.95, problems_attempted=4),
+    ]
+
+    masks = encoder.mastered_masks(*encoder.progress_arrays([1, 2], progress))
+
+    assert [encoder.graph.concepts_of(mask) for mask in masks] == [["Addition"], ["Subtraction"]]
+    for user_id, mask in zip([1, 2], masks):
+        rows = [row for row in progress if row.user_id == user_id]
+        row = SimpleNamespace(user_id=user_id, preferred_learning_style=None, cognitive_load=None, engagement_score=None)
+        assert encoder.from_orm(row, rows).mastered == mask
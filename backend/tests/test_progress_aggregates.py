@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.attempt_ingestion import AttemptRecord, AttemptWriteBuffer
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import DifficultyLevel, MathProblem, Progress, User
+from app.progress_aggregates import MASTERY_ALPHA, rebuild_progress
+
+RESULTS = [True, False, True, True, True]
+
+
+@pytest.fixture
+def history(run):
+    with SessionLocal() as db:
+        db.add(User(id=1, username="ann", email="ann@example.com", hashed_password="x"))
+        db.add(MathProblem(
+            id=1, question="2 + 2 = ?", correct_answer="4", topic="Addition",
+            difficulty=DifficultyLevel.EASY, grade_level="Grade 1"
+        ))
+        db.commit()
+
+    async def ingest():
+        buffer = AttemptWriteBuffer(AsyncSessionLocal)
+        start = datetime(2026, 1, 5, 10, 0)
+        # Two flushes, so the stored EWMA is decayed and extended once
+        for chunk in (RESULTS[:3], RESULTS[3:]):
+            await buffer.add_many([
+                AttemptRecord(
+                    user_id=1, problem_id=1, topic="Addition", student_answer="4",
+                    is_correct=correct, time_taken=10.0, attempt_date=start
+                )
+                for correct in chunk
+            ])
+            start += timedelta(days=1)
+
+    run(ingest())
+
+
+def expected_mastery():
+    mastery = 0.0
+    for correct in RESULTS:
+        mastery = (1 - MASTERY_ALPHA) * mastery + MASTERY_ALPHA * float(correct)
+    return mastery
+
+
+def progress_row():
+    with SessionLocal() as db:
+        return db.execute(select(Progress)).scalar_one()
+
+
+def test_ingestion_maintains_mastery_and_solve_rate(history):
+    row = progress_row()
+    assert row.solve_rate == pytest.approx(0.8)
+    assert row.mastery_level == pytest.approx(expected_mastery())
+
+
+def test_rebuild_matches_the_incremental_aggregates(history):
+    with SessionLocal() as db:
+        db.query(Progress).update({"mastery_level": 0.0, "solve_rate": 0.0, "problems_attempted": 0})
+        db.commit()
+        assert rebuild_progress(db) == 1
+
+    row = progress_row()
+    assert (row.problems_attempted, row.problems_solved) == (5, 4)
+    assert row.solve_rate == pytest.approx(0.8)
+    assert row.mastery_level == pytest.approx(expected_mastery())
@@ -0,0 +1,55 @@
+import asyncio
+import sqlite3
+import threading
+
+from app.response_cache import ResponseCache
+
+
+def last_access(path, key):
+    with sqlite3.connect(path) as disk:
+        return disk.execute("SELECT last_access FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_disk_tier_is_written_behind_and_read_off_the_loop(tmp_path):
+    path = str(tmp_path / "responses.db")
+
+    async def scenario():
+        writer = ResponseCache(disk_path=path)
+        await writer.set("k", "cached answer")
+        # Served from memory before the write lands
+        assert await writer.get("k") == "cached answer"
+        await writer.close()
+        written = last_access(path, "k")
+
+        reader = ResponseCache(disk_path=path)
+        threads = []
+        lookup = reader._get_from_disk
+
+        def tracked(*args):
+            threads.append(threading.current_thread())
+            return lookup(*args)
+
+        reader._get_from_disk = tracked
+        await asyncio.sleep(0.01)
+        value = await reader.get("k")
+        # A hit doesn't write until the next flush
+        unchanged = last_access(path, "k") == written
+        await reader.close()
+        return value, threads, unchanged, written, reader.get_stats()
+
+    value, threads, unchanged, written, stats = asyncio.run(scenario())
+    assert value == "cached answer"
+    assert threads and threading.main_thread() not in threads
+    assert unchanged
+    assert last_access(path, "k") > written
+    assert stats["disk_hits"] == 1 and stats["misses"] == 0
+
+
+def test_memory_only_cache_needs_no_disk():
+    async def scenario():
+        cache = ResponseCache(max_entries=1)
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        return await cache.get("a"), await cache.get("b")
+
+    assert asyncio.run(scenario()) == (None, "2")
@@ -0,0 +1,119 @@
+from sqlalchemy import inspect, select, text
+
+from app.database import SessionLocal, engine
+from app.models import DifficultyLevel, MathProblem
+from app.schema_upgrades import upgrade_schema
+
+
+def recreate(ddl):
+    with engine.begin() as conn:
+        for statement in ddl:
+            conn.execute(text(statement))
+
+
+def test_progress_gains_its_upsert_key_without_duplicates():
+    recreate([
+        "DROP TABLE progress",
+        "CREATE TABLE progress (id INTEGER PRIMARY KEY, user_id INTEGER, topic VARCHAR NOT NULL, "
+        "mastery_level FLOAT, problems_attempted INTEGER, problems_solved INTEGER, solve_rate FLOAT, "
+        "average_time FLOAT, last_updated DATETIME)",
+        "INSERT INTO progress (id, user_id, topic, problems_attempted) VALUES "
+        "(1, 1, 'Addition', 3), (2, 1, 'Addition', 5), (3, 1, 'Fractions', 2)"
+    ])
+
+    assert "progress_unique_user_topic" in upgrade_schema(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM progress ORDER BY id")).scalars().all() == [2, 3]
+    assert any(index["unique"] for index in inspect(engine).get_indexes("progress"))
+    # Already applied
+    assert "progress_unique_user_topic" not in upgrade_schema(engine)
+
+
+def test_progress_gains_a_backfilled_solve_rate():
+    recreate([
+        "DROP TABLE progress",
+        "CREATE TABLE progress (id INTEGER PRIMARY KEY, user_id INTEGER, topic VARCHAR NOT NULL, "
+        "mastery_level FLOAT, problems_attempted INTEGER, problems_solved INTEGER, "
+        "average_time FLOAT, last_updated DATETIME)",
+        "INSERT INTO progress (id, user_id, topic, problems_attempted, problems_solved) VALUES "
+        "(1, 1, 'Addition', 4, 3), (2, 1, 'Fractions', 0, 0)"
+    ])
+
+    assert "progress_solve_rate" in upgrade_schema(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT solve_rate FROM progress ORDER BY id")).scalars().all() == [0.75, 0.0]
+
+
+def test_problems_gain_ratings_from_their_level():
+    recreate([
+        "DROP TABLE math_problems",
+        "CREATE TABLE math_problems (id INTEGER PRIMARY KEY, question VARCHAR NOT NULL, "
+        "correct_answer VARCHAR NOT NULL, topic VARCHAR, difficulty VARCHAR(6), grade_level VARCHAR, "
+        "solution_steps JSON, hints JSON, visual_aid TEXT, created_at DATETIME)",
+        "INSERT INTO math_problems (id, question, correct_answer, difficulty) VALUES "
+        "(1, '1 + 1', '2', 'EASY'), (2, '12 x 12', '144', 'HARD')"
+    ])
+
+    assert "problem_skill_ratings" in upgrade_schema(engine)
+    with SessionLocal() as db:
+        rows = db.execute(select(MathProblem.difficulty_rating, MathProblem.rating_attempts).order_by(MathProblem.id)).all()
+    assert [tuple(row) for row in rows] == [(-1.0, 0), (1.0, 0)]
+    assert "idx_problem_rating" in {index["name"] for index in inspect(engine).get_indexes("math_problems")}
+
+
+def test_new_problems_default_to_their_level_prior():
+    with SessionLocal() as db:
+        db.add(MathProblem(
+            question="9 x 9", correct_answer="81", topic="Multiplication",
+            grade_level="Grade 3", difficulty=DifficultyLevel.HARD
+        ))
+        db.commit()
+        assert db.execute(select(MathProblem.difficulty_rating)).scalar() == 1.0
+
+
+def test_learning_paths_gain_recommendations_and_one_row_per_student():
+    recreate([
+        "DROP TABLE learning_paths",
+        "CREATE TABLE learning_paths (id INTEGER PRIMARY KEY, user_id INTEGER, current_topic VARCHAR, "
+        "completed_topics JSON, next_topics JSON, difficulty_level VARCHAR(6), last_updated DATETIME)",
+        "INSERT INTO learning_paths (id, user_id, current_topic) VALUES "
+        "(1, 1, 'Addition'), (2, 1, 'Subtraction'), (3, 2, 'Division')"
+    ])
+
+    assert "learning_path_recommendations" in upgrade_schema(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, recommended_practice FROM learning_paths ORDER BY id")).all()
+    assert [tuple(row) for row in rows] == [(2, None), (3, None)]
+
+
+def test_profiles_gain_engagement_columns():
+    recreate([
+        "DROP TABLE student_profiles",
+        "CREATE TABLE student_profiles (id INTEGER PRIMARY KEY, user_id INTEGER, current_level INTEGER, "
+        "xp_points INTEGER, preferred_learning_style VARCHAR, strengths JSON, weaknesses JSON, "
+        "last_activity DATETIME)",
+        "INSERT INTO student_profiles (id, user_id) VALUES (1, 1)"
+    ])
+
+    assert "student_profile_engagement" in upgrade_schema(engine)
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT engagement_score, cognitive_load, engagement_updated_at FROM student_profiles"
+        )).one()
+    assert tuple(row) == (0.5, 0.5, None)
+
+
+def test_problems_gain_pool_columns_and_indexes():
+    recreate([
+        "DROP TABLE math_problems",
+        "CREATE TABLE math_problems (id INTEGER PRIMARY KEY, question VARCHAR NOT NULL, "
+        "correct_answer VARCHAR NOT NULL, topic VARCHAR, difficulty VARCHAR(6), grade_level VARCHAR, "
+        "solution_steps JSON, hints JSON, difficulty_rating FLOAT, rating_attempts INTEGER, created_at DATETIME)",
+        "DROP INDEX idx_attempt_user_date"
+    ])
+
+    assert "problem_pool_support" in upgrade_schema(engine)
+    columns = {column["name"] for column in inspect(engine).get_columns("math_problems")}
+    assert "visual_aid" in columns
+    assert "idx_problem_pool" in {index["name"] for index in inspect(engine).get_indexes("math_problems")}
+    assert "idx_attempt_user_date" in {index["name"] for index in inspect(engine).get_indexes("problem_attempts")}
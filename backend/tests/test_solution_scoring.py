@@ -0,0 +1,35 @@
+import pytest
+
+from app.database import SessionLocal
+from app.models import DifficultyLevel, MathProblem, ProblemAttempt, User
+from app.solution_scoring import MisconceptionIndex, SolutionEncoder, rescore_attempts, student_work
+
+
+@pytest.fixture(scope="module")
+def index():
+    return MisconceptionIndex(SolutionEncoder(), threshold=0.5)
+
+
+def test_student_work_fills_in_the_answer():
+    assert student_work("3/4 + 1/2 = ?", "4/6") == "3/4 + 1/2 = 4/6"
+    assert student_work("Which is larger, 1/3 or 1/5?", "1/5") == "Which is larger, 1/3 or 1/5? 1/5"
+
+
+def test_adding_across_fractions_is_recognised(index):
+    labels = index.identify([student_work("2/3 + 1/4 = ?", "3/7")], "Fractions")[0]
+    assert labels[0]["misconception"] == "added_denominators"
+
+
+def test_rescoring_labels_the_worked_attempt(index):
+    with SessionLocal() as db:
+        db.add(User(id=1, username="ann", email="ann@example.com", hashed_password="x"))
+        db.add(MathProblem(
+            id=1, question="3/4 + 1/2 = ?", correct_answer="5/4", topic="Fractions",
+            difficulty=DifficultyLevel.EASY, grade_level="Grade 4"
+        ))
+        db.add(ProblemAttempt(user_id=1, problem_id=1, student_answer="4/6", is_correct=False, time_taken=20.0))
+        db.commit()
+        report = rescore_attempts(db, index)
+
+    assert report["attempts_scored"] == 1
+    assert "added_denominators" in report["misconceptions"]
@@ -0,0 +1,21 @@
+from matplotlib.figure import Figure
+
+from app.visual_aids import _draw_fraction_visual
+
+
+def shading(operands):
+    ax = Figure().add_subplot()
+    _draw_fraction_visual(ax, operands, None)
+    return [patch.get_facecolor() != (1.0, 1.0, 1.0, 1.0) for patch in ax.patches]
+
+
+def test_like_fractions_shade_their_sum():
+    assert shading(("1", "5", "2", "5")) == [True, True, True, False, False]
+
+
+def test_sums_past_one_fill_another_circle():
+    assert shading(("3", "4", "3", "4")) == [True] * 4 + [True, True, False, False]
+
+
+def test_unlike_fractions_are_drawn_separately():
+    assert shading(("1", "2", "1", "3")) == [True, False, True, False, False]
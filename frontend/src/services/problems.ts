@@ -16,5 +16,24 @@ export const problemsService = {
   async getHint(problemId: string) {
     const { data } = await api.get(`/problems/${problemId}/hint`);
     return data;
+  },
+
+  // Worksheet batches: one request instead of one per problem
+  async getProblemsBatch(problemIds: number[]) {
+    const { data } = await api.post('/problems/batch', { problem_ids: problemIds });
+    return data.problems;
+  },
+
+  async checkSolutions(
+    answers: { problem_id: number; answer: string; time_taken?: number; hints_used?: number }[],
+    feedback = false
+  ) {
+    const { data } = await api.post('/problems/batch/check', { answers, feedback });
+    return data.results;
+  },
+
+  async getHints(requests: { problem_id: number; previous_hints?: string[] }[]) {
+    const { data } = await api.post('/problems/batch/hints', { hints: requests });
+    return data.hints;
   }
 };
\ No newline at end of file